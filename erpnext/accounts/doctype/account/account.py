@@ -194,6 +194,12 @@ class Account(Document):
 		frappe.utils.nestedset.update_nsm(self)
 
 	def on_update(self):
+		if self.lft and cstr(self.parent_account) != cstr(self.old_parent):
+			# balances of the old and new parent accounts change
+			from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint \
+				import clear_checkpoints
+			clear_checkpoints(self.company)
+
 		self.update_nsm_model()
 
 	def validate_trash(self):
@@ -0,0 +1,187 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt, cstr, getdate, nowdate, add_days, get_first_day, get_last_day, now
+from frappe.model.document import Document
+
+class AccountBalanceCheckpoint(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabAccount Balance Checkpoint`
+		where Key_name="checkpoint_key" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabAccount Balance Checkpoint`
+			add unique index checkpoint_key(account, party_type, party, company, checkpoint_date)""")
+
+def get_checkpoint_date(upto_date=None):
+	'''Last month end on or before `upto_date`. Checkpoints are only kept for months that have ended'''
+	last_month_end = add_days(get_first_day(nowdate()), -1)
+	if not upto_date:
+		return last_month_end
+
+	upto_date = getdate(upto_date)
+	if upto_date == get_last_day(upto_date):
+		checkpoint_date = upto_date
+	else:
+		checkpoint_date = add_days(get_first_day(upto_date), -1)
+
+	return min(checkpoint_date, last_month_end)
+
+def get_balance_upto(key, conditions, upto_date=None, exclude_period_closing=False):
+	'''Returns (balance, balance in account currency) of GL Entries matching `conditions`
+		and posted on or before `upto_date` (all if not set).
+
+	The balance is read from the latest checkpoint of `key` (dict of account, party_type,
+	party and company) plus GL Entries posted after it. If there is no checkpoint at the
+	last month end covered, one is requested from `build_checkpoints`.'''
+	key = get_checkpoint_key(key, upto_date)
+
+	checkpoint = frappe.db.sql("""select checkpoint_date, balance, balance_in_account_currency,
+			closing_balance, closing_balance_in_account_currency
+		from `tabAccount Balance Checkpoint`
+		where account=%(account)s and party_type=%(party_type)s and party=%(party)s
+			and company=%(company)s and checkpoint_date <= %(checkpoint_date)s
+		order by checkpoint_date desc limit 1""", key, as_dict=True)
+	checkpoint = checkpoint[0] if checkpoint else frappe._dict()
+
+	base_conditions, conditions = conditions, list(conditions)
+	if checkpoint:
+		conditions.append("posting_date > '%s'" % checkpoint.checkpoint_date)
+	if upto_date:
+		conditions.append("posting_date <= '%s'" % frappe.db.escape(cstr(upto_date), percent=False))
+
+	total = [a + b for a, b in zip([flt(checkpoint.balance), flt(checkpoint.balance_in_account_currency),
+		flt(checkpoint.closing_balance), flt(checkpoint.closing_balance_in_account_currency)],
+		get_gl_balances(conditions))]
+
+	if getdate(key.checkpoint_date) > getdate(checkpoint.checkpoint_date or "1900-01-01"):
+		request_checkpoint(key, base_conditions)
+
+	if exclude_period_closing:
+		return total[0] - total[2], total[1] - total[3]
+	else:
+		return total[0], total[1]
+
+def get_checkpoint_key(key, upto_date=None):
+	return frappe._dict({
+		"account": cstr(key.get("account")),
+		"party_type": cstr(key.get("party_type")),
+		"party": cstr(key.get("party")),
+		"company": cstr(key.get("company")),
+		"checkpoint_date": get_checkpoint_date(upto_date)
+	})
+
+def get_gl_balances(conditions, for_share=False):
+	'''[balance, balance in account currency, closing balance, closing balance in account currency]
+		of GL Entries matching `conditions`. Runs without values, so `%` is not escaped'''
+	out = [0.0, 0.0, 0.0, 0.0]
+	for d in frappe.db.sql("""select
+			if(voucher_type = 'Period Closing Voucher', 1, 0) as is_period_closing,
+			sum(debit) - sum(credit) as balance,
+			sum(debit_in_account_currency) - sum(credit_in_account_currency) as balance_in_account_currency
+		from `tabGL Entry` gle
+		where {0}
+		group by is_period_closing {1}""".format(" and ".join(conditions),
+			"lock in share mode" if for_share else ""), as_dict=True):
+			out[0] += flt(d.balance)
+			out[1] += flt(d.balance_in_account_currency)
+			if d.is_period_closing:
+				out[2] += flt(d.balance)
+				out[3] += flt(d.balance_in_account_currency)
+
+	return out
+
+def request_checkpoint(key, conditions):
+	'''Ask `build_checkpoints` for a checkpoint of `key`. Reads never write checkpoints,
+		as they may run in a transaction that misses GL Entries being posted'''
+	frappe.cache().hset("balance_checkpoint_requests",
+		"|".join([key.account, key.party_type, key.party, key.company, cstr(key.checkpoint_date)]),
+		{"key": dict(key, checkpoint_date=cstr(key.checkpoint_date)), "conditions": conditions})
+
+def build_checkpoints():
+	'''Save the checkpoints requested since the last run. Called by the scheduler.
+
+	One job runs at a time. GL Entries are read with shared locks, so a back-dated entry
+	posted meanwhile waits for the checkpoint to be committed and then removes it.'''
+	if not frappe.db.sql("select get_lock('account_balance_checkpoint', 0)")[0][0]:
+		return
+
+	try:
+		for field, request in (frappe.cache().hgetall("balance_checkpoint_requests") or {}).items():
+			frappe.cache().hdel("balance_checkpoint_requests", field)
+
+			key = frappe._dict(request["key"])
+			conditions = request["conditions"] + ["posting_date <= '%s'" % key.checkpoint_date]
+			save_checkpoint(key, get_gl_balances(conditions, for_share=True))
+
+			if not frappe.flags.in_test:
+				frappe.db.commit()
+	finally:
+		frappe.db.sql("select release_lock('account_balance_checkpoint')")
+
+def save_checkpoint(key, values):
+	timestamp, user = now(), frappe.session.user
+	frappe.db.sql("""insert into `tabAccount Balance Checkpoint`
+		(name, creation, modified, owner, modified_by, account, party_type, party, company,
+			checkpoint_date, balance, balance_in_account_currency, closing_balance,
+			closing_balance_in_account_currency)
+		values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+		on duplicate key update balance=values(balance),
+			balance_in_account_currency=values(balance_in_account_currency),
+			closing_balance=values(closing_balance),
+			closing_balance_in_account_currency=values(closing_balance_in_account_currency),
+			modified=values(modified)""", tuple([frappe.generate_hash(length=10), timestamp, timestamp,
+			user, user, key.account, key.party_type, key.party, key.company, key.checkpoint_date] + values))
+
+def invalidate_checkpoints(gl_entries):
+	'''Remove checkpoints on or after the posting date of added or removed GL Entries,
+		for their accounts (and parent accounts) and parties'''
+	earliest = {}
+	for gle in gl_entries:
+		key = (gle.get("account"), cstr(gle.get("party_type")), cstr(gle.get("party")))
+		posting_date = getdate(gle.get("posting_date"))
+		if key not in earliest or posting_date < earliest[key]:
+			earliest[key] = posting_date
+
+	for (account, party_type, party), posting_date in earliest.items():
+		frappe.db.sql("""delete from `tabAccount Balance Checkpoint`
+			where checkpoint_date >= %(posting_date)s
+			and (account = '' or account in (select parent.name from `tabAccount` parent, `tabAccount` child
+				where child.name = %(account)s and parent.lft <= child.lft and parent.rgt >= child.rgt))
+			and (party = '' or (party_type = %(party_type)s and party = %(party)s))""", {
+				"account": account,
+				"party_type": party_type,
+				"party": party,
+				"posting_date": posting_date
+			})
+
+def clear_checkpoints(company=None):
+	'''Remove all checkpoints, e.g. after GL Entries are changed directly in the database
+		or accounts are moved in the tree'''
+	# checkpoints without a company are kept for the account, or for the party across companies
+	frappe.db.sql("""delete from `tabAccount Balance Checkpoint` {0}""".format(
+		"""where company=%(company)s
+			or account in (select name from `tabAccount` where company=%(company)s)
+			or (ifnull(company, '')='' and ifnull(account, '')='')""" if company else ""),
+		{"company": company})
+
+	# conditions of pending requests may list accounts of the old tree
+	frappe.cache().delete_value("balance_checkpoint_requests")
+
+def rename_checkpoints(doctype, old, new, merge=False):
+	'''Checkpoints of a renamed account or party. Merged balances are built again'''
+	if doctype == "Account":
+		if merge:
+			clear_checkpoints(frappe.db.get_value("Account", new, "company"))
+		else:
+			frappe.db.sql("""update `tabAccount Balance Checkpoint` set account=%s
+				where account=%s""", (new, old))
+	elif merge:
+		frappe.db.sql("""delete from `tabAccount Balance Checkpoint`
+			where party_type=%s and party in (%s, %s)""", (doctype, old, new))
+	else:
+		frappe.db.sql("""update `tabAccount Balance Checkpoint` set party=%s
+			where party_type=%s and party=%s""", (new, doctype, old))
@@ -0,0 +1,56 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import flt
+from erpnext.accounts.utils import get_balance_on
+from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint import build_checkpoints
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+
+class TestAccountBalanceCheckpoint(unittest.TestCase):
+	def get_gl_balance(self, account, date):
+		return flt(frappe.db.sql("""select sum(debit) - sum(credit) from `tabGL Entry`
+			where account=%s and posting_date <= %s""", (account, date))[0][0])
+
+	def test_checkpoint_is_invalidated_by_backdated_entry(self):
+		account = "_Test Bank - _TC"
+
+		make_journal_entry("_Test Account Cost for Goods Sold - _TC", account, 100,
+			"_Test Cost Center - _TC", posting_date="2013-03-10", submit=True)
+
+		self.assertEqual(get_balance_on(account, "2013-03-20"), self.get_gl_balance(account, "2013-03-20"))
+
+		# reads only request checkpoints
+		self.assertFalse(frappe.db.exists("Account Balance Checkpoint",
+			{"account": account, "checkpoint_date": "2013-02-28"}))
+
+		build_checkpoints()
+		self.assertTrue(frappe.db.exists("Account Balance Checkpoint",
+			{"account": account, "checkpoint_date": "2013-02-28"}))
+
+		# back-dated entry before the checkpoint
+		make_journal_entry("_Test Account Cost for Goods Sold - _TC", account, 50,
+			"_Test Cost Center - _TC", posting_date="2013-02-14", submit=True)
+
+		self.assertFalse(frappe.db.exists("Account Balance Checkpoint",
+			{"account": account, "checkpoint_date": "2013-02-28"}))
+		self.assertEqual(get_balance_on(account, "2013-03-20"), self.get_gl_balance(account, "2013-03-20"))
+
+	def test_clear_checkpoints_of_company(self):
+		from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint \
+			import clear_checkpoints
+
+		account = "_Test Bank - _TC"
+
+		make_journal_entry("_Test Account Cost for Goods Sold - _TC", account, 100,
+			"_Test Cost Center - _TC", posting_date="2013-03-10", submit=True)
+
+		# balance read without a company
+		get_balance_on(account, "2013-03-20")
+		build_checkpoints()
+		self.assertTrue(frappe.db.exists("Account Balance Checkpoint", {"account": account}))
+
+		clear_checkpoints("_Test Company")
+		self.assertFalse(frappe.db.exists("Account Balance Checkpoint", {"account": account}))
@@ -0,0 +1,170 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt, cstr, getdate, get_first_day, get_last_day, now
+from frappe.model.document import Document
+
+class AccountPeriodBalance(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabAccount Period Balance`
+		where Key_name="period_balance_key" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabAccount Period Balance`
+			add unique index period_balance_key(company, account, cost_center,
+				period_start_date, is_opening, is_period_closing)""")
+
+def get_balance_key(gle):
+	return (gle.get("company"), gle.get("account"), cstr(gle.get("cost_center")),
+		get_first_day(gle.get("posting_date")), gle.get("is_opening") or "No",
+		1 if gle.get("voucher_type")=="Period Closing Voucher" else 0)
+
+def update_period_balances(gl_entries, cancel=False):
+	'''Add posted (or subtract cancelled) GL Entries to the monthly account balances'''
+	balances = {}
+	for gle in gl_entries:
+		key = get_balance_key(gle)
+		debit, credit = balances.get(key, (0.0, 0.0))
+		balances[key] = (debit + flt(gle.get("debit")), credit + flt(gle.get("credit")))
+
+	if not balances:
+		return
+
+	factor = -1 if cancel else 1
+	timestamp, user = now(), frappe.session.user
+
+	values = []
+	for key, (debit, credit) in balances.items():
+		values.extend([frappe.generate_hash(length=10), timestamp, timestamp, user, user]
+			+ list(key) + [factor * debit, factor * credit])
+
+	frappe.db.sql("""insert into `tabAccount Period Balance`
+		(name, creation, modified, owner, modified_by, company, account, cost_center,
+			period_start_date, is_opening, is_period_closing, debit, credit)
+		values {0}
+		on duplicate key update debit = debit + values(debit), credit = credit + values(credit),
+			modified = values(modified)""".format(", ".join(["(%s)" % ", ".join(["%s"] * 13)] * len(balances))),
+		tuple(values))
+
+	if cancel:
+		# balances left at zero by cancelled entries
+		keys = balances.keys()
+		frappe.db.sql("""delete from `tabAccount Period Balance`
+			where abs(debit) < 0.005 and abs(credit) < 0.005
+			and (company, account, cost_center, period_start_date, is_opening, is_period_closing) in ({0})""".format(
+				", ".join(["(%s)" % ", ".join(["%s"] * 6)] * len(keys))), tuple(v for key in keys for v in key))
+
+def can_use_period_balances(from_date, to_date):
+	'''Balances are kept per month, so only ranges of whole months can be read from them'''
+	return (not from_date or getdate(from_date).day == 1) \
+		and (not to_date or getdate(to_date) == get_last_day(to_date))
+
+def get_period_balances(company, from_date, to_date, root_lft, root_rgt, ignore_closing_entries=False):
+	'''Returns monthly balances shaped like GL Entries, with `posting_date` as the first day of
+		the month, for accounts between `root_lft` and `root_rgt`'''
+	additional_conditions = []
+
+	if ignore_closing_entries:
+		additional_conditions.append("and is_period_closing = 0")
+
+	if from_date:
+		additional_conditions.append("and period_start_date >= %(from_date)s")
+
+	return frappe.db.sql("""select period_start_date as posting_date, account,
+			sum(debit) as debit, sum(credit) as credit, is_opening
+		from `tabAccount Period Balance`
+		where company=%(company)s
+		{additional_conditions}
+		and period_start_date <= %(to_date)s
+		and account in (select name from `tabAccount`
+			where lft >= %(lft)s and rgt <= %(rgt)s)
+		group by account, period_start_date, is_opening
+		order by account, period_start_date""".format(additional_conditions="\n".join(additional_conditions)),
+		{
+			"company": company,
+			"from_date": from_date,
+			"to_date": to_date,
+			"lft": root_lft,
+			"rgt": root_rgt
+		},
+		as_dict=True)
+
+def get_conditions(filters):
+	return " and ".join(["{0}=%({0})s".format(key) for key in sorted(filters) if filters[key]])
+
+def get_summary_query(filters=None):
+	'''Query to aggregate `tabGL Entry` in the shape of Account Period Balance,
+		for GL Entries matching `filters` (company, account, cost_center)'''
+	conditions = get_conditions(filters or {})
+
+	return """select company, account, ifnull(cost_center, '') as cost_center,
+			date_format(posting_date, '%%Y-%%m-01') as period_start_date,
+			ifnull(is_opening, 'No') as is_opening,
+			if(voucher_type='Period Closing Voucher', 1, 0) as is_period_closing,
+			sum(debit) as debit, sum(credit) as credit
+		from `tabGL Entry`
+		{0}
+		group by company, account, ifnull(cost_center, ''), date_format(posting_date, '%%Y-%%m-01'),
+			ifnull(is_opening, 'No'), if(voucher_type='Period Closing Voucher', 1, 0)""".format(
+			"where " + conditions if conditions else "")
+
+def rebuild_period_balances(company=None):
+	'''Rebuild Account Period Balance from `tabGL Entry`
+
+	bench --site [site] execute erpnext.accounts.doctype.account_period_balance.account_period_balance.rebuild_period_balances'''
+	aggregate_period_balances({"company": company})
+	frappe.db.commit()
+
+def aggregate_period_balances(filters):
+	'''Replace balances matching `filters` with the sums of their GL Entries'''
+	conditions = get_conditions(filters)
+	frappe.db.sql("""delete from `tabAccount Period Balance` {0}""".format(
+		"where " + conditions if conditions else ""), filters)
+
+	frappe.db.sql("""insert into `tabAccount Period Balance`
+		(name, creation, modified, owner, modified_by, company, account, cost_center,
+			period_start_date, is_opening, is_period_closing, debit, credit)
+		select substr(md5(uuid()), 1, 10), now(), now(), 'Administrator', 'Administrator',
+			company, account, cost_center, period_start_date, is_opening, is_period_closing, debit, credit
+		from ({0}) gle""".format(get_summary_query(filters)), filters)
+
+def rename_period_balances(doctype, old, new, merge=False):
+	'''Balances of a renamed account or cost center. GL Entries of a merged one are
+		aggregated again, as their balances now share keys'''
+	fieldname = frappe.scrub(doctype)
+	if merge:
+		frappe.db.sql("""delete from `tabAccount Period Balance`
+			where `{0}`=%s""".format(fieldname), old)
+		aggregate_period_balances({fieldname: new})
+	else:
+		frappe.db.sql("""update `tabAccount Period Balance` set `{0}`=%s
+			where `{0}`=%s""".format(fieldname), (new, old))
+
+def verify_period_balances(company=None):
+	'''Returns balances that do not match `tabGL Entry` as list of
+		(key, [debit, credit] as per period balance, [debit, credit] as per GL Entry)'''
+	def _get_map(data):
+		out = {}
+		for d in data:
+			key = (d.company, d.account, d.cost_center, getdate(d.period_start_date),
+				d.is_opening, int(d.is_period_closing))
+			out[key] = [flt(d.debit, 3), flt(d.credit, 3)]
+		return out
+
+	expected = _get_map(frappe.db.sql(get_summary_query({"company": company}), {"company": company},
+		as_dict=1))
+	actual = _get_map(frappe.db.sql("""select company, account, cost_center, period_start_date,
+			is_opening, is_period_closing, debit, credit
+		from `tabAccount Period Balance`
+		where (debit != 0 or credit != 0) {0}""".format("and company=%(company)s" if company else ""),
+		{"company": company}, as_dict=1))
+
+	mismatched = []
+	for key in set(expected.keys() + actual.keys()):
+		if expected.get(key, [0.0, 0.0]) != actual.get(key, [0.0, 0.0]):
+			mismatched.append((key, actual.get(key), expected.get(key)))
+
+	return mismatched
@@ -0,0 +1,46 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import flt
+from erpnext.accounts.doctype.journal_entry.test_journal_entry import make_journal_entry
+from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+	import rebuild_period_balances, verify_period_balances
+
+class TestAccountPeriodBalance(unittest.TestCase):
+	def get_balance(self, account):
+		return [flt(d) for d in frappe.db.sql("""select sum(debit), sum(credit)
+			from `tabAccount Period Balance`
+			where account=%s and period_start_date='2013-02-01'""", account)[0]]
+
+	def test_balances_on_submit_and_cancel(self):
+		rebuild_period_balances("_Test Company")
+		opening = self.get_balance("_Test Bank - _TC")
+
+		jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+			"_Test Bank - _TC", 100, "_Test Cost Center - _TC", posting_date="2013-02-14", submit=True)
+
+		debit, credit = self.get_balance("_Test Bank - _TC")
+		self.assertEqual(credit - opening[1], 100)
+		self.assertEqual(verify_period_balances("_Test Company"), [])
+
+		jv.cancel()
+		self.assertEqual(self.get_balance("_Test Bank - _TC")[1], opening[1])
+		self.assertEqual(verify_period_balances("_Test Company"), [])
+
+	def test_balances_after_merging_accounts(self):
+		for account_name in ("_Test Merged Bank", "_Test Merged Into Bank"):
+			if not frappe.db.exists("Account", account_name + " - _TC"):
+				frappe.get_doc({"doctype": "Account", "account_name": account_name,
+					"parent_account": "Bank Accounts - _TC", "company": "_Test Company",
+					"account_type": "Bank"}).insert()
+
+			make_journal_entry("_Test Account Cost for Goods Sold - _TC", account_name + " - _TC", 100,
+				"_Test Cost Center - _TC", posting_date="2013-02-14", submit=True)
+
+		frappe.rename_doc("Account", "_Test Merged Bank - _TC", "_Test Merged Into Bank - _TC", merge=True)
+
+		self.assertEqual(self.get_balance("_Test Merged Bank - _TC"), [0.0, 0.0])
+		self.assertEqual(verify_period_balances("_Test Company"), [])
@@ -8,6 +8,7 @@ from frappe import _
 from frappe.utils import flt, getdate, add_months, get_last_day
 from frappe.model.naming import make_autoname
 from frappe.model.document import Document
+from erpnext.utilities.tree_cache import get_ancestors, get_descendants
 
 class BudgetError(frappe.ValidationError): pass
 class DuplicateBudgetError(frappe.ValidationError): pass
@@ -52,7 +53,9 @@ class Budget(Document):
 def validate_expense_against_budget(args):
 	args = frappe._dict(args)
 	if frappe.db.get_value("Account", {"name": args.account, "root_type": "Expense"}):
-		cc_lft, cc_rgt = frappe.db.get_value("Cost Center", args.cost_center, ["lft", "rgt"])
+		cost_centers = get_ancestors("Cost Center", args.cost_center, include_self=True)
+		if not cost_centers:
+			return
 
 		budget_records = frappe.db.sql("""
 			select ba.budget_amount, b.monthly_distribution, b.cost_center,
@@ -60,8 +63,8 @@ def validate_expense_against_budget(args):
 			from `tabBudget` b, `tabBudget Account` ba
 			where
 				b.name=ba.parent and b.fiscal_year=%s and ba.account=%s and b.docstatus=1
-				and exists(select name from `tabCost Center` where lft<=%s and rgt>=%s and name=b.cost_center)
-		""", (args.fiscal_year, args.account, cc_lft, cc_rgt), as_dict=True)
+				and b.cost_center in %s
+		""", (args.fiscal_year, args.account, tuple(cost_centers)), as_dict=True)
 
 		for budget in budget_records:
 			if budget.budget_amount:
@@ -115,8 +118,7 @@ def get_accumulated_monthly_budget(monthly_distribution, posting_date, fiscal_ye
 	return annual_budget * accumulated_percentage / 100
 
 def get_actual_expense(args, cost_center):
-	lft_rgt = frappe.db.get_value("Cost Center", cost_center, ["lft", "rgt"], as_dict=1)
-	args.update(lft_rgt)
+	args.cost_centers = tuple(get_descendants("Cost Center", cost_center))
 
 	condition = " and gle.posting_date <= %(month_end_date)s" if args.get("month_end_date") else ""
 
@@ -124,8 +126,7 @@ def get_actual_expense(args, cost_center):
 		select sum(gle.debit) - sum(gle.credit)
 		from `tabGL Entry` gle
 		where gle.account=%(account)s
-			and exists(select name from `tabCost Center`
-				where lft>=%(lft)s and rgt<=%(rgt)s and name=gle.cost_center)
+			and gle.cost_center in %(cost_centers)s
 			and gle.fiscal_year=%(fiscal_year)s
 			and gle.company=%(company)s
 			and gle.docstatus=1
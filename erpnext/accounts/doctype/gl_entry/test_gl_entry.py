@@ -23,3 +23,51 @@ class TestGLEntry(unittest.TestCase):
 			and debit = 0 and credit = '.01'""", jv.name)
 
 		self.assertTrue(round_off_entry)
+
+	def test_bulk_insert(self):
+		from erpnext.accounts import general_ledger
+
+		self.assertFalse(general_ledger.has_gl_entry_doc_events())
+
+		def make_entry(*args, **kwargs):
+			raise AssertionError("GL Entry inserted as a document")
+
+		make_entry_per_row = general_ledger.make_entry
+		general_ledger.make_entry = make_entry
+		try:
+			jv = make_journal_entry("_Test Account Cost for Goods Sold - _TC",
+				"_Test Bank - _TC", 100, "_Test Cost Center - _TC", submit=True)
+		finally:
+			general_ledger.make_entry = make_entry_per_row
+
+		gl_entries = frappe.get_all("GL Entry", filters={"voucher_no": jv.name},
+			fields=["name", "account", "cost_center", "debit", "credit", "account_currency",
+				"fiscal_year", "docstatus"], order_by="account")
+
+		self.assertEqual(len(gl_entries), 2)
+		self.assertEqual([d.account for d in gl_entries],
+			["_Test Account Cost for Goods Sold - _TC", "_Test Bank - _TC"])
+
+		# cost center is only kept for profit and loss accounts
+		self.assertEqual([d.cost_center for d in gl_entries], ["_Test Cost Center - _TC", None])
+		self.assertEqual([(d.debit, d.credit) for d in gl_entries], [(100, 0), (0, 100)])
+
+		for d in gl_entries:
+			self.assertTrue(d.name.startswith("GL."))
+			self.assertEqual(d.docstatus, 1)
+			self.assertEqual(d.account_currency, "INR")
+			self.assertTrue(d.fiscal_year)
+
+	def test_merge_similar_entries(self):
+		from erpnext.accounts.general_ledger import merge_similar_entries
+
+		gl_map = [frappe._dict(account=account, cost_center=cost_center, debit=debit, credit=0,
+			debit_in_account_currency=debit, credit_in_account_currency=0)
+			for account, cost_center, debit in (("A", "C1", 10), ("B", "C1", 5), ("A", "C2", 1),
+				("A", "C1", 20), ("B", "C1", -5))]
+
+		merged = merge_similar_entries(gl_map)
+
+		# first occurrence decides the order, zero entries are removed
+		self.assertEqual([(d.account, d.cost_center, d.debit) for d in merged],
+			[("A", "C1", 30), ("A", "C2", 1)])
@@ -6,10 +6,10 @@
 from __future__ import unicode_literals
 import frappe
 import json
-import copy
 from frappe import throw, _
-from frappe.utils import flt, cint
+from frappe.utils import flt, cint, cstr, getdate
 from frappe.model.document import Document
+from erpnext.utilities.tree_cache import get_ancestors, validate_node
 
 class MultiplePricingRuleConflict(frappe.ValidationError): pass
 
@@ -22,6 +22,12 @@ class PricingRule(Document):
 		self.validate_price_or_discount()
 		self.validate_max_discount()
 
+	def on_update(self):
+		clear_pricing_rule_index()
+
+	def on_trash(self):
+		clear_pricing_rule_index()
+
 	def validate_mandatory(self):
 		for field in ["apply_on", "applicable_for"]:
 			tocheck = frappe.scrub(self.get(field) or "")
@@ -110,13 +116,15 @@ def apply_pricing_rule(args):
 	args.pop("items")
 
 	for item in item_list:
-		args_copy = copy.deepcopy(args)
+		args_copy = frappe._dict(args)
 		args_copy.update(item)
 		out.append(get_pricing_rule_for_item(args_copy))
 
 	return out
 
-def get_pricing_rule_for_item(args):
+def get_pricing_rule_for_item(args, item=None):
+	"""Pricing rule and the price or discount it gives. Item Group and Brand missing in `args`
+	are taken from `item` if it is given, else from the database"""
 	if args.get("parenttype") == "Material Request": return {}
 
 	item_details = frappe._dict({
@@ -128,7 +136,12 @@ def get_pricing_rule_for_item(args):
 	if args.ignore_pricing_rule or not args.item_code:
 		return item_details
 
-	if not (args.item_group and args.brand):
+	if not (args.item_group and args.brand) and item:
+		args.item_group, args.brand = item.item_group, item.brand
+		if not args.item_group:
+			frappe.throw(_("Item Group not mentioned in item master for item {0}").format(args.item_code))
+
+	elif not (args.item_group and args.brand):
 		try:
 			args.item_group, args.brand = frappe.db.get_value("Item", args.item_code, ["item_group", "brand"])
 		except TypeError:
@@ -149,7 +162,7 @@ def get_pricing_rule_for_item(args):
 		args.supplier_type = frappe.db.get_value("Supplier", args.supplier, "supplier_type")
 		args.customer = args.customer_group = args.territory = None
 
-	pricing_rules = get_pricing_rules(args)
+	pricing_rules = get_pricing_rules_from_index(args)
 	pricing_rule = filter_pricing_rules(args, pricing_rules)
 
 	if pricing_rule:
@@ -172,13 +185,8 @@ def get_pricing_rules(args):
 		field = frappe.scrub(parenttype)
 		condition = ""
 		if args.get(field):
-			try:
-				lft, rgt = frappe.db.get_value(parenttype, args[field], ["lft", "rgt"])
-			except TypeError:
-				frappe.throw(_("Invalid {0}").format(args[field]))
-
-			parent_groups = frappe.db.sql_list("""select name from `tab%s`
-				where lft<=%s and rgt>=%s""" % (parenttype, '%s', '%s'), (lft, rgt))
+			validate_node(parenttype, args[field])
+			parent_groups = get_ancestors(parenttype, args[field], include_self=True)
 
 			if parent_groups:
 				if allow_blank: parent_groups.append('')
@@ -233,6 +241,91 @@ def get_pricing_rules(args):
 			transaction_type = args.transaction_type,
 			conditions = conditions), values, as_dict=1)
 
+def get_pricing_rules_from_index(args):
+	"""Same rules as `get_pricing_rules`, resolved from the cached pricing rule index. Values
+	are compared in lower case, as MySQL compares them case-insensitively"""
+	index = get_pricing_rule_index(args.transaction_type)
+
+	def _get_ancestors(parenttype):
+		value = args.get(frappe.scrub(parenttype))
+		if value:
+			validate_node(parenttype, value)
+			return [d.lower() for d in get_ancestors(parenttype, value, include_self=True)]
+
+	customer_groups = _get_ancestors("Customer Group")
+	territories = _get_ancestors("Territory")
+	item_groups = _get_ancestors("Item Group")
+
+	if not args.price_list: args.price_list = None
+
+	# load variant of if not defined
+	if "variant_of" not in args:
+		args.variant_of = frappe.db.get_value("Item", args.item_code, "variant_of")
+
+	candidates = {}
+	for field, values in (("item_code", [args.item_code, args.variant_of]),
+		("item_group", item_groups or []), ("brand", [args.brand])):
+		for value in values:
+			if value is not None:
+				for rule in index.get(field).get(cstr(value).lower(), []):
+					candidates[rule.name] = rule
+
+	transaction_date = getdate(args.transaction_date) if args.get("transaction_date") else None
+
+	pricing_rules = []
+	for rule in candidates.values():
+		if not all(cstr(rule.get(field)).lower() in (cstr(args.get(field)).lower(), '')
+			for field in ("company", "customer", "supplier", "supplier_type", "campaign", "sales_partner")):
+			continue
+
+		if (customer_groups and cstr(rule.customer_group).lower() not in customer_groups + [''])\
+			or (territories and cstr(rule.territory).lower() not in territories + ['']):
+			continue
+
+		if cstr(rule.for_price_list).lower() not in (cstr(args.price_list).lower(), ''):
+			continue
+
+		if transaction_date and not (getdate(rule.valid_from or '2000-01-01') <= transaction_date
+			<= getdate(rule.valid_upto or '2500-12-31')):
+			continue
+
+		# rules are shared through the cache and get modified while filtering
+		pricing_rules.append(frappe._dict(rule))
+
+	return sorted(pricing_rules, key=get_rule_order, reverse=True)
+
+def get_rule_order(rule):
+	# order by priority desc, name desc (priority is a Select, nulls last)
+	return (rule.priority is not None, rule.priority or "", rule.name)
+
+def get_pricing_rule_index(transaction_type):
+	"""Enabled pricing rules for `selling` or `buying` bucketed by item code, item group and
+		brand. Cached in redis till a Pricing Rule is modified."""
+	index = frappe.cache().hget("pricing_rule_index", transaction_type)
+	if index is None:
+		index = build_pricing_rule_index(transaction_type)
+		frappe.cache().hset("pricing_rule_index", transaction_type, index)
+
+	return index
+
+def build_pricing_rule_index(transaction_type):
+	index = frappe._dict({
+		"item_code": {},
+		"item_group": {},
+		"brand": {}
+	})
+
+	for rule in frappe.db.sql("""select * from `tabPricing Rule`
+		where docstatus < 2 and disable = 0 and {0} = 1""".format(transaction_type), as_dict=1):
+		for field in ("item_code", "item_group", "brand"):
+			if rule.get(field) is not None:
+				index[field].setdefault(rule.get(field).lower(), []).append(rule)
+
+	return index
+
+def clear_pricing_rule_index(*args, **kwargs):
+	frappe.cache().delete_value("pricing_rule_index")
+
 def filter_pricing_rules(args, pricing_rules):
 	# filter for qty
 	if pricing_rules:
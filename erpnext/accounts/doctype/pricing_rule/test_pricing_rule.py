@@ -5,8 +5,16 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import clear_pricing_rule_index
 
 class TestPricingRule(unittest.TestCase):
+	def setUp(self):
+		# rules are also deleted directly in the database, which does not clear the index
+		clear_pricing_rule_index()
+
+	def tearDown(self):
+		clear_pricing_rule_index()
+
 	def test_pricing_rule_for_discount(self):
 		from erpnext.stock.get_item_details import get_item_details
 		from frappe import MandatoryError
@@ -77,6 +85,7 @@ class TestPricingRule(unittest.TestCase):
 		self.assertEquals(details.get("discount_percentage"), 5)
 
 		frappe.db.sql("update `tabPricing Rule` set priority=NULL where campaign='_Test Campaign'")
+		clear_pricing_rule_index()
 		from erpnext.accounts.doctype.pricing_rule.pricing_rule	import MultiplePricingRuleConflict
 		self.assertRaises(MultiplePricingRuleConflict, get_item_details, args)
 
@@ -203,3 +212,86 @@ class TestPricingRule(unittest.TestCase):
 
 		details = get_item_details(args)
 		self.assertEquals(details.get("discount_percentage"), 17.5)
+
+	def test_pricing_rule_index_matches_query(self):
+		from frappe.utils import nowdate, add_days
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import (get_pricing_rules,
+			get_pricing_rules_from_index)
+
+		frappe.db.sql("delete from `tabPricing Rule`")
+
+		for i, rule in enumerate([
+			{"apply_on": "Item Code", "item_code": "_Test Item", "applicable_for": "Customer",
+				"customer": "_Test Customer"},
+			{"apply_on": "Item Group", "item_group": "All Item Groups", "applicable_for": "Customer Group",
+				"customer_group": "_Test Customer Group"},
+			{"apply_on": "Brand", "brand": "_Test Brand", "applicable_for": "Territory",
+				"territory": "_Test Territory"},
+			{"apply_on": "Item Group", "item_group": "_Test Item Group", "company": "_Test Company 1"},
+			{"apply_on": "Item Code", "item_code": "_Test Item 2", "valid_upto": add_days(nowdate(), -1)},
+			{"apply_on": "Item Code", "item_code": "_Test Item 2", "for_price_list": "_Test Price List",
+				"priority": 2}]):
+			frappe.get_doc(dict({
+				"doctype": "Pricing Rule",
+				"title": "_Test Pricing Rule {0}".format(i),
+				"selling": 1,
+				"price_or_discount": "Discount Percentage",
+				"discount_percentage": i + 1,
+			}, **rule)).insert()
+
+		for item_code in ("_Test Item", "_Test Item 2"):
+			for customer in ("_Test Customer", "_Test Customer 1"):
+				args = frappe._dict({
+					"transaction_type": "selling",
+					"item_code": item_code,
+					"customer": customer,
+					"company": "_Test Company",
+					"price_list": "_Test Price List",
+					"transaction_date": nowdate(),
+					"qty": 1
+				})
+				args.item_group, args.brand = frappe.db.get_value("Item", item_code, ["item_group", "brand"])
+				args.customer_group, args.territory = frappe.db.get_value("Customer", customer,
+					["customer_group", "territory"])
+
+				self.assertEquals([d.name for d in get_pricing_rules_from_index(frappe._dict(args))],
+					[d.name for d in get_pricing_rules(frappe._dict(args))])
+
+				# values are compared case-insensitively, as in MySQL
+				args.update({"item_code": item_code.upper(), "customer": customer.lower(),
+					"company": "_TEST COMPANY", "price_list": "_test price list"})
+				self.assertEquals([d.name for d in get_pricing_rules_from_index(frappe._dict(args))],
+					[d.name for d in get_pricing_rules(frappe._dict(args))])
+
+		frappe.db.sql("delete from `tabPricing Rule`")
+
+	def test_pricing_rule_index_cleared_on_save(self):
+		from erpnext.accounts.doctype.pricing_rule.pricing_rule import get_pricing_rule_index
+
+		frappe.db.sql("delete from `tabPricing Rule`")
+		clear_pricing_rule_index()
+
+		self.assertFalse(get_pricing_rule_index("selling").item_code.get("_test item"))
+		self.assertTrue(frappe.cache().hget("pricing_rule_index", "selling") is not None)
+
+		prule = frappe.get_doc({
+			"doctype": "Pricing Rule",
+			"title": "_Test Pricing Rule",
+			"apply_on": "Item Code",
+			"item_code": "_Test Item",
+			"selling": 1,
+			"price_or_discount": "Discount Percentage",
+			"discount_percentage": 10,
+			"company": "_Test Company"
+		}).insert()
+
+		self.assertTrue(frappe.cache().hget("pricing_rule_index", "selling") is None)
+		self.assertEquals([d.name for d in get_pricing_rule_index("selling").item_code.get("_test item")],
+			[prule.name])
+
+		prule.discount_percentage = 20
+		prule.save()
+		self.assertEquals(get_pricing_rule_index("selling").item_code["_test item"][0].discount_percentage, 20)
+
+		prule.delete()
+		self.assertFalse(get_pricing_rule_index("selling").item_code.get("_test item"))
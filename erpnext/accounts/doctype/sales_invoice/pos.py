@@ -4,22 +4,31 @@
 from __future__ import unicode_literals
 import frappe, json
 from frappe import _
-from frappe.utils import nowdate
+from frappe.utils import nowdate, cint, cstr, getdate, now_datetime, get_datetime_str
+from datetime import timedelta
 from erpnext.setup.utils import get_exchange_rate
 from erpnext.stock.get_item_details import get_pos_profile
-from erpnext.accounts.party import get_party_account_currency
 from erpnext.controllers.accounts_controller import get_taxes_and_charges
+from erpnext.utilities.tree_cache import get_root
+from erpnext.utilities import long_job_timeout
+
+# bump when the shape of synced items / customers changes, so that tills rebuild their copy
+POS_SYNC_VERSION = 1
 
 @frappe.whitelist()
-def get_pos_data():
+def get_pos_data(sync_token=None, sync_version=None, sync_key=None, paginate=0):
+	"""Returns the POS Profile defaults and master data for the offline POS.
+
+	With `paginate`, items and customers are not returned and must be pulled with
+	`get_pos_data_page`. With a `sync_token` issued by an earlier call (and the same
+	`sync_version` and `sync_key`), only records changed since then are returned, along with the
+	names of records that were removed."""
 	doc = frappe.new_doc('Sales Invoice')
 	doc.update_stock = 1;
 	doc.is_pos = 1;
-	pos_profile = get_pos_profile(doc.company) or {}
+	pos_profile = get_pos_profile_doc(doc.company)
 
-	if pos_profile.get('name'):
-		pos_profile = frappe.get_doc('POS Profile', pos_profile.get('name'))
-	else:
+	if not pos_profile.get('name'):
 		frappe.msgprint('<a href="#Form/POS Profile/New POS Profile">'
 			+ _("Welcome to POS: Create your POS Profile") + '</a>');
 
@@ -28,21 +37,98 @@ def get_pos_data():
 	default_print_format = pos_profile.get('print_format') or "Point of Sale"
 	print_template = frappe.db.get_value('Print Format', default_print_format, 'html')
 
-	return {
+	key = get_sync_key(doc, pos_profile)
+	if cint(sync_version) != POS_SYNC_VERSION or cstr(sync_key) != key:
+		sync_token = None
+
+	# validity of pricing rules is by date, so the first sync of a day reloads all of them
+	pricing_rule_token = sync_token if sync_token and getdate(sync_token) == getdate(nowdate()) else None
+
+	new_sync_token = get_sync_token()
+	pricing_rules, removed_pricing_rules = get_pricing_rules(doc, pricing_rule_token)
+
+	data = {
 		'doc': doc,
 		'default_customer': pos_profile.get('customer'),
-		'items': get_items(doc, pos_profile),
-		'customers': get_customers(pos_profile, doc),
-		'pricing_rules': get_pricing_rules(doc),
+		'pricing_rules': pricing_rules,
 		'print_template': print_template,
 		'write_off_account': pos_profile.get('write_off_account'),
 		'meta': {
 			'invoice': frappe.get_meta('Sales Invoice'),
 			'items': frappe.get_meta('Sales Invoice Item'),
 			'taxes': frappe.get_meta('Sales Taxes and Charges')
+		},
+		'sync': {
+			'version': POS_SYNC_VERSION,
+			'token': new_sync_token,
+			'key': key,
+			'delta': 1 if sync_token else 0,
+			'pricing_rules_delta': 1 if pricing_rule_token else 0,
+			'removed': {
+				'items': get_deleted_names('Item', sync_token),
+				'customers': get_deleted_names('Customer', sync_token),
+				'pricing_rules': removed_pricing_rules
+			}
 		}
 	}
 
+	if not cint(paginate):
+		data['items'] = get_items(doc, pos_profile)
+		data['customers'] = get_customers(pos_profile, doc)
+
+	return data
+
+@frappe.whitelist()
+def get_pos_data_page(section, sync_token=None, after=None, page_length=500):
+	"""Returns one page of `items` or `customers` for the offline POS, ordered by name.
+
+	Pass the `after` of the previous page to get the next one, until `more` is 0.
+	With `sync_token`, only records changed since the token are returned; records that
+	no longer qualify (disabled, template items, other currency) are listed in `removed`."""
+	doc = frappe.new_doc('Sales Invoice')
+	pos_profile = get_pos_profile_doc(doc.company)
+	set_currency_and_price_list(doc, pos_profile)
+	page_length = cint(page_length) or 500
+
+	if section == 'items':
+		records, removed, last = get_items_page(doc, pos_profile, sync_token, after, page_length)
+	elif section == 'customers':
+		records, removed, last = get_customers_page(doc, sync_token, after, page_length)
+	else:
+		frappe.throw(_("Invalid section {0}").format(section))
+
+	return {
+		'data': records,
+		'removed': removed,
+		'after': last or after,
+		'more': 1 if last and (len(records) + len(removed)) == page_length else 0
+	}
+
+def get_pos_profile_doc(company):
+	pos_profile = get_pos_profile(company) or {}
+	if pos_profile.get('name'):
+		pos_profile = frappe.get_doc('POS Profile', pos_profile.get('name'))
+
+	return pos_profile
+
+def get_sync_token():
+	"""Server time to pass as `sync_token` on the next sync. Backdated by the timeout of long
+	jobs, so that records committed later by transactions still running now, which may be
+	background jobs, are fetched again next time"""
+	return get_datetime_str(now_datetime() - timedelta(seconds=long_job_timeout))
+
+def get_sync_key(doc, pos_profile):
+	"""Synced data is only reusable while the profile it was built for stays the same"""
+	return "|".join([cstr(d) for d in (doc.company, doc.currency, doc.selling_price_list,
+		pos_profile.get('name'), pos_profile.get('modified'))])
+
+def get_deleted_names(doctype, sync_token):
+	if not sync_token:
+		return []
+
+	return frappe.db.sql_list("""select deleted_name from `tabDeleted Document`
+		where deleted_doctype=%s and creation >= %s""", (doctype, sync_token))
+
 def update_pos_profile_data(doc, pos_profile):
 	company_data = frappe.db.get_value('Company', doc.company, '*', as_dict=1)
 
@@ -50,11 +136,10 @@ def update_pos_profile_data(doc, pos_profile):
 	if doc.taxes_and_charges:
 		update_tax_table(doc)
 
-	doc.currency = pos_profile.get('currency') or company_data.default_currency
+	set_currency_and_price_list(doc, pos_profile, company_data.default_currency)
 	doc.conversion_rate = 1.0
 	if doc.currency != company_data.default_currency:
 		doc.conversion_rate = get_exchange_rate(doc.currency, company_data.default_currency)
-	doc.selling_price_list = pos_profile.get('selling_price_list') or frappe.db.get_value('Selling Settings', None, 'selling_price_list')
 	doc.naming_series = pos_profile.get('naming_series') or 'SINV-'
 	doc.letter_head = pos_profile.get('letter_head') or company_data.default_letter_head
 	doc.ignore_pricing_rule = pos_profile.get('ignore_pricing_rule') or 0
@@ -62,11 +147,10 @@ def update_pos_profile_data(doc, pos_profile):
 	doc.customer_group = pos_profile.get('customer_group') or get_root('Customer Group')
 	doc.territory = pos_profile.get('territory') or get_root('Territory')
 
-def get_root(table):
-	root = frappe.db.sql(""" select name from `tab%(table)s` having
-		min(lft)"""%{'table': table}, as_dict=1)
-
-	return root[0].name
+def set_currency_and_price_list(doc, pos_profile, default_currency=None):
+	doc.currency = pos_profile.get('currency') or default_currency \
+		or frappe.db.get_value('Company', doc.company, 'default_currency')
+	doc.selling_price_list = pos_profile.get('selling_price_list') or frappe.db.get_value('Selling Settings', None, 'selling_price_list')
 
 def update_multi_mode_option(doc, pos_profile):
 	from frappe.model import default_fields
@@ -99,118 +183,378 @@ def update_tax_table(doc):
 		doc.append('taxes', tax)
 
 def get_items(doc, pos_profile):
-	item_list = []
-	for item in frappe.get_all("Item", fields=["*"], filters={'disabled': 0, 'has_variants': 0}):
-		item_doc = frappe.get_doc('Item', item.name)
-		if item_doc.taxes:
-			item.taxes = json.dumps(dict(([d.tax_type, d.tax_rate] for d in
-						item_doc.get("taxes"))))
-
-		item.price_list_rate = frappe.db.get_value('Item Price', {'item_code': item.name,
-									'price_list': doc.selling_price_list}, 'price_list_rate') or 0
-		item.default_warehouse = pos_profile.get('warehouse') or item.default_warehouse or None
-		item.expense_account = pos_profile.get('expense_account') or item.expense_account
-		item.income_account = pos_profile.get('income_account') or item_doc.income_account
-		item.cost_center = pos_profile.get('cost_center') or item_doc.selling_cost_center
-		item.actual_qty = frappe.db.get_value('Bin', {'item_code': item.name,
-								'warehouse': item.default_warehouse}, 'actual_qty') or 0
-		item.serial_nos = get_serial_nos(item, pos_profile)
-		item.batch_nos = frappe.db.sql_list("""select name from `tabBatch` where expiry_date > curdate()
-			and item = %(item_code)s""", {'item_code': item.item_code})
-
-		item_list.append(item)
+	item_list, after = [], None
+	while True:
+		items, removed, after = get_items_page(doc, pos_profile, after=after, page_length=1000)
+		item_list.extend(items)
+		if not after:
+			break
 
 	return item_list
 
-def get_serial_nos(item, pos_profile):
-	cond = "1=1"
+def get_items_page(doc, pos_profile, sync_token=None, after=None, page_length=500):
+	"""Returns (items, names of removed items, name of the last item scanned).
+	Details of all items in the page are loaded with one query per table"""
+	conditions, values = [], {'price_list': doc.selling_price_list, 'after': after, 'since': sync_token}
+	if sync_token:
+		conditions.append("name in ({0})".format(get_changed_items_query(doc, sync_token, values)))
+	else:
+		conditions.append("disabled = 0 and has_variants = 0")
+
+	if after:
+		conditions.append("name > %(after)s")
+
+	items = frappe.db.sql("""select * from `tabItem` where {0} order by name limit {1}"""
+		.format(" and ".join(conditions), cint(page_length)), values, as_dict=1)
+
+	if not items:
+		return [], [], None
+
+	last = items[-1].name
+	removed = [d.name for d in items if d.disabled or d.has_variants]
+	items = [d for d in items if not (d.disabled or d.has_variants)]
+	if items:
+		set_item_details(items, doc, pos_profile)
+
+	return items, removed, last
+
+def get_changed_items_query(doc, sync_token, values):
+	"""Items whose own record, price, stock, serial nos or batches changed since `sync_token`"""
+	values['deleted_price_items'] = tuple(get_deleted_item_prices(doc.selling_price_list, sync_token)) or ('',)
+
+	return """select name from `tabItem` where modified >= %(since)s
+		union select item_code from `tabItem Price` where price_list = %(price_list)s and modified >= %(since)s
+		union select item_code from `tabBin` where modified >= %(since)s
+		union select item_code from `tabSerial No` where modified >= %(since)s
+		union select item from `tabBatch` where modified >= %(since)s
+		union select name from `tabItem` where name in %(deleted_price_items)s"""
+
+def get_deleted_item_prices(price_list, sync_token):
+	item_codes = []
+	for data in frappe.db.sql_list("""select data from `tabDeleted Document`
+		where deleted_doctype='Item Price' and creation >= %s""", sync_token):
+		item_price = json.loads(data)
+		if item_price.get('price_list') == price_list:
+			item_codes.append(item_price.get('item_code'))
+
+	return item_codes
+
+def set_item_details(items, doc, pos_profile):
+	item_codes = tuple([d.name for d in items])
+
+	taxes = {}
+	for d in frappe.db.sql("""select parent, tax_type, tax_rate from `tabItem Tax`
+		where parenttype='Item' and parent in %s order by parent, idx""", (item_codes,), as_dict=1):
+		taxes.setdefault(d.parent, []).append([d.tax_type, d.tax_rate])
+
+	price_list_rate = {}
+	for item_code, rate in frappe.db.sql("""select item_code, price_list_rate from `tabItem Price`
+		where price_list = %s and item_code in %s""", (doc.selling_price_list, item_codes)):
+		price_list_rate.setdefault(item_code, rate)
+
+	actual_qty = dict((tuple(d[:2]), d[2]) for d in frappe.db.sql("""select item_code, warehouse, actual_qty
+		from `tabBin` where item_code in %s""", (item_codes,)))
+
+	serial_nos = get_serial_nos(item_codes, pos_profile)
+
+	batch_nos = {}
+	for name, item_code in frappe.db.sql("""select name, item from `tabBatch`
+		where expiry_date > curdate() and item in %s""", (item_codes,)):
+		batch_nos.setdefault(item_code, []).append(name)
+
+	for item in items:
+		if item.name in taxes:
+			item.taxes = json.dumps(dict(taxes[item.name]))
+
+		item.price_list_rate = price_list_rate.get(item.name) or 0
+		item.default_warehouse = pos_profile.get('warehouse') or item.default_warehouse or None
+		item.expense_account = pos_profile.get('expense_account') or item.expense_account
+		item.income_account = pos_profile.get('income_account') or item.income_account
+		item.cost_center = pos_profile.get('cost_center') or item.selling_cost_center
+		item.actual_qty = actual_qty.get((item.name, item.default_warehouse)) or 0
+		item.serial_nos = serial_nos.get(item.item_code, {})
+		item.batch_nos = batch_nos.get(item.item_code, [])
+
+def get_serial_nos(item_codes, pos_profile):
+	cond, values = "", {'item_codes': item_codes}
 	if pos_profile.get('update_stock') and pos_profile.get('warehouse'):
-		cond = "warehouse = '{0}'".format(pos_profile.get('warehouse'))
+		cond = "and warehouse = %(warehouse)s"
+		values['warehouse'] = pos_profile.get('warehouse')
 
-	serial_nos = frappe.db.sql("""select name, warehouse from `tabSerial No` where {0}
-				and item_code = %(item_code)s""".format(cond), {'item_code': item.item_code}, as_dict=1)
+	serial_nos = frappe.db.sql("""select name, item_code, warehouse from `tabSerial No`
+		where item_code in %(item_codes)s {0}""".format(cond), values, as_dict=1)
 
 	serial_no_list = {}
 	for serial_no in serial_nos:
-		serial_no_list[serial_no.name] = serial_no.warehouse
+		serial_no_list.setdefault(serial_no.item_code, {})[serial_no.name] = serial_no.warehouse
 
 	return serial_no_list
 
 def get_customers(pos_profile, doc):
-	filters = {'disabled': 0}
-	customer_list = []
-	customers = frappe.get_all("Customer", fields=["*"], filters = filters)
+	customer_list, after = [], None
+	while True:
+		customers, removed, after = get_customers_page(doc, after=after, page_length=1000)
+		customer_list.extend(customers)
+		if not after:
+			break
 
+	return customer_list
+
+def get_customers_page(doc, sync_token=None, after=None, page_length=500):
+	"""Returns (customers, names of removed customers, name of the last customer scanned).
+	Customers billed in another currency than the POS are left out"""
+	conditions = ["modified >= %(since)s" if sync_token else "disabled = 0"]
+	if after:
+		conditions.append("name > %(after)s")
+
+	customers = frappe.db.sql("""select * from `tabCustomer` where {0} order by name limit {1}"""
+		.format(" and ".join(conditions), cint(page_length)), {'since': sync_token, 'after': after}, as_dict=1)
+
+	if not customers:
+		return [], [], None
+
+	currency = get_customer_currency(customers, doc.company)
+
+	customer_list, removed = [], []
 	for customer in customers:
-		customer_currency = get_party_account_currency('Customer', customer.name, doc.company) or doc.currency
-		if customer_currency == doc.currency:
+		if not customer.disabled and (currency.get(customer.name) or doc.currency) == doc.currency:
 			customer_list.append(customer)
-	return customer_list
+		else:
+			removed.append(customer.name)
+
+	return customer_list, removed, customers[-1].name
 
-def get_pricing_rules(doc):
-	pricing_rules = ""
+def get_customer_currency(customers, company):
+	"""Account currency of each customer, as per `erpnext.accounts.party.get_party_account_currency`"""
+	names = tuple([d.name for d in customers])
+
+	party_account = dict(frappe.db.sql("""select parent, account from `tabParty Account`
+		where parenttype='Customer' and company=%s and parent in %s""", (company, names)))
+	group_account = dict(frappe.db.sql("""select parent, account from `tabParty Account`
+		where parenttype='Customer Group' and company=%s""", company))
+	default_account = frappe.db.get_value("Company", company, "default_receivable_account")
+
+	# customers with posted entries keep the currency they were billed in
+	gle_currency = dict(frappe.db.sql("""select party, account_currency from `tabGL Entry`
+		where docstatus=1 and company=%s and party_type='Customer' and party in %s
+		group by party""", (company, names)))
+
+	account_map = {}
+	for customer in customers:
+		if customer.name not in gle_currency:
+			account_map[customer.name] = party_account.get(customer.name) \
+				or group_account.get(customer.customer_group) or default_account
+
+	account_currency = {}
+	accounts = tuple(set(filter(None, account_map.values())))
+	if accounts:
+		account_currency = dict(frappe.db.sql("""select name, account_currency from `tabAccount`
+			where name in %s""", (accounts,)))
+
+	currency = dict(gle_currency)
+	for name, account in account_map.items():
+		currency[name] = account_currency.get(account)
+
+	return currency
+
+def get_pricing_rules(doc, sync_token=None):
+	"""Returns (pricing rules, names of removed rules). With `sync_token`, only the rules
+	modified since are returned"""
+	pricing_rules, removed = [], []
 	if doc.ignore_pricing_rule == 0:
 		pricing_rules = frappe.db.sql(""" Select * from `tabPricing Rule` where docstatus < 2 and disable = 0
 						and selling = 1 and ifnull(company, '') in (%(company)s, '') and
 						ifnull(for_price_list, '') in (%(price_list)s, '')  and %(date)s between
-						ifnull(valid_from, '2000-01-01') and ifnull(valid_upto, '2500-12-31') order by priority desc, name desc""",
-						{'company': doc.company, 'price_list': doc.selling_price_list, 'date': nowdate()}, as_dict=1)
-	return pricing_rules
+						ifnull(valid_from, '2000-01-01') and ifnull(valid_upto, '2500-12-31') {0}
+						order by priority desc, name desc""".format("and modified >= %(since)s" if sync_token else ""),
+						{'company': doc.company, 'price_list': doc.selling_price_list, 'date': nowdate(),
+							'since': sync_token}, as_dict=1)
+
+	if sync_token:
+		valid = [d.name for d in pricing_rules]
+		removed = [name for name in frappe.db.sql_list("""select name from `tabPricing Rule`
+			where modified >= %s""", sync_token) if name not in valid]
+		removed += get_deleted_names('Pricing Rule', sync_token)
+
+	return pricing_rules, removed
 
 @frappe.whitelist()
 def make_invoice(doc_list):
+	"""Creates Sales Invoices uploaded by the offline POS. Returns the offline names
+	that are synced, including the ones synced earlier"""
+	return sync_invoices(get_invoice_list(doc_list))
+
+@frappe.whitelist()
+def enqueue_invoices(doc_list):
+	"""Queues Sales Invoices uploaded by the offline POS to be created in the background.
+	Returns the job id to poll with `get_invoice_sync_status`"""
+	invoices = get_invoice_list(doc_list)
+	job_id = frappe.generate_hash(length=10)
+	set_invoice_sync_status(job_id, {'status': 'Queued', 'user': frappe.session.user,
+		'total': len(invoices), 'processed': 0, 'synced': []})
+
+	frappe.enqueue('erpnext.accounts.doctype.sales_invoice.pos.sync_invoices', queue='long',
+		timeout=long_job_timeout, invoices=invoices, job_id=job_id, user=frappe.session.user)
+
+	return job_id
+
+@frappe.whitelist()
+def get_invoice_sync_status(job_id):
+	status = frappe.cache().hget('pos_invoice_sync', job_id)
+	if not status or status.get('user') != frappe.session.user:
+		return None
+
+	return status
+
+def set_invoice_sync_status(job_id, status):
+	if job_id:
+		frappe.cache().hset('pos_invoice_sync', job_id, status)
+
+def get_invoice_list(doc_list):
+	"""Returns [(offline name, invoice)] in upload order, without repeated names"""
 	if isinstance(doc_list, basestring):
 		doc_list = json.loads(doc_list)
 
-	name_list = []
-
+	invoices, names = [], set()
 	for docs in doc_list:
 		for name, doc in docs.items():
-			if not frappe.db.exists('Sales Invoice', {'offline_pos_name': name}):
-				validate_customer(doc)
-				validate_item(doc)
-				si_doc = frappe.new_doc('Sales Invoice')
-				si_doc.offline_pos_name = name
-				si_doc.update(doc)
-				submit_invoice(si_doc, name)
-				name_list.append(name)
-
-	return name_list
-
-def validate_customer(doc):
-	if not frappe.db.exists('Customer', doc.get('customer')):
-		customer_doc = frappe.new_doc('Customer')
-		customer_doc.customer_name = doc.get('customer')
-		customer_doc.customer_type = 'Company'
-		customer_doc.customer_group = doc.get('customer_group')
-		customer_doc.territory = doc.get('territory')
-		customer_doc.save(ignore_permissions = True)
-		frappe.db.commit()
-		doc['customer'] = customer_doc.name
+			if name not in names:
+				names.add(name)
+				invoices.append((name, doc))
+
+	return invoices
+
+def sync_invoices(invoices, job_id=None, user=None, group_size=50):
+	"""Creates and submits Sales Invoices for the uploaded invoices not synced earlier.
+
+	Missing customers and items are created once for all invoices. Invoices are
+	submitted in order of posting, `group_size` to a transaction, and reposting of
+	future stock and GL entries is queued per item / warehouse and done at the end"""
+	if user:
+		frappe.set_user(user)
 
-	return doc
+	status = {'status': 'In Progress', 'user': frappe.session.user, 'total': len(invoices),
+		'processed': 0, 'synced': []}
+	set_invoice_sync_status(job_id, status)
 
-def validate_item(doc):
-	for item in doc.get('items'):
-		if not frappe.db.exists('Item', item.get('item_code')):
+	try:
+		status['synced'] = sync_invoices_in_groups(invoices, status, job_id, group_size)
+	except Exception:
+		status['status'] = 'Failed'
+		set_invoice_sync_status(job_id, status)
+		raise
+
+	status.update({'status': 'Completed', 'processed': len(status['synced'])})
+	set_invoice_sync_status(job_id, status)
+
+	return status['synced']
+
+def sync_invoices_in_groups(invoices, status, job_id=None, group_size=50):
+	synced = get_synced_invoices([name for name, doc in invoices])
+	status['synced'] = list(synced)
+
+	invoices = [(name, doc) for name, doc in invoices if name not in synced]
+	if invoices:
+		create_missing_customers(invoices)
+		create_missing_items(invoices)
+		commit()
+
+	invoices.sort(key=lambda d: (getdate(d[1].get('posting_date') or nowdate()),
+		d[1].get('posting_time') or ''))
+
+	frappe.flags.defer_future_repost = True
+	try:
+		for i in xrange(0, len(invoices), group_size):
+			group = invoices[i:i + group_size]
+
+			# another upload of the same invoices may have synced some of them meanwhile
+			synced = get_synced_invoices([name for name, doc in group])
+			for name, doc in group:
+				if name not in synced:
+					si_doc = frappe.new_doc('Sales Invoice')
+					si_doc.offline_pos_name = name
+					si_doc.update(doc)
+					submit_invoice(si_doc, name)
+
+				status['synced'].append(name)
+
+			commit()
+			status['processed'] = len(status['synced'])
+			set_invoice_sync_status(job_id, status)
+	finally:
+		frappe.flags.defer_future_repost = False
+
+	repost_future_entries(invoices)
+
+	return status['synced']
+
+def get_synced_invoices(names):
+	if not names:
+		return set()
+
+	return set(frappe.db.sql_list("""select offline_pos_name from `tabSales Invoice`
+		where offline_pos_name in %s""", (tuple(names),)))
+
+def create_missing_customers(invoices):
+	customers = {}
+	for name, doc in invoices:
+		if doc.get('customer'):
+			customers.setdefault(doc.get('customer'), doc)
+
+	if not customers:
+		return
+
+	existing = set(frappe.db.sql_list("""select name from `tabCustomer` where name in %s""",
+		(tuple(customers.keys()),)))
+
+	customer_map = {}
+	for customer, doc in customers.items():
+		if customer not in existing:
+			customer_doc = frappe.new_doc('Customer')
+			customer_doc.customer_name = customer
+			customer_doc.customer_type = 'Company'
+			customer_doc.customer_group = doc.get('customer_group')
+			customer_doc.territory = doc.get('territory')
+			customer_doc.save(ignore_permissions = True)
+			customer_map[customer] = customer_doc.name
+
+	for name, doc in invoices:
+		if doc.get('customer') in customer_map:
+			doc['customer'] = customer_map[doc.get('customer')]
+
+def create_missing_items(invoices):
+	items = {}
+	for name, doc in invoices:
+		for item in doc.get('items') or []:
+			if item.get('item_code'):
+				items.setdefault(item.get('item_code'), item)
+
+	if not items:
+		return
+
+	existing = set(frappe.db.sql_list("""select name from `tabItem` where name in %s""",
+		(tuple(items.keys()),)))
+
+	for item_code, item in items.items():
+		if item_code not in existing:
 			item_doc = frappe.new_doc('Item')
-			item_doc.name = item.get('item_code')
-			item_doc.item_code = item.get('item_code')
+			item_doc.name = item_code
+			item_doc.item_code = item_code
 			item_doc.item_name = item.get('item_name')
 			item_doc.description = item.get('description')
 			item_doc.default_warehouse = item.get('warehouse')
 			item_doc.stock_uom = item.get('stock_uom')
 			item_doc.item_group = item.get('item_group')
 			item_doc.save(ignore_permissions=True)
-			frappe.db.commit()
 
 def submit_invoice(si_doc, name):
+	frappe.db.sql("savepoint pos_invoice")
 	try:
 		si_doc.insert()
 		si_doc.submit()
 	except Exception, e:
 		if frappe.message_log: frappe.message_log.pop()
-		frappe.db.rollback()
+		frappe.db.sql("rollback to savepoint pos_invoice")
 		save_invoice(e, si_doc, name)
 
 def save_invoice(e, si_doc, name):
@@ -223,4 +567,29 @@ def make_scheduler_log(e, sales_invoice):
 	scheduler_log = frappe.new_doc('Scheduler Log')
 	scheduler_log.error = e
 	scheduler_log.sales_invoice = sales_invoice
-	scheduler_log.save(ignore_permissions=True)
\ No newline at end of file
+	scheduler_log.save(ignore_permissions=True)
+
+def repost_future_entries(invoices):
+	"""Reposts future entries queued while syncing, once per item / warehouse,
+	unless reposting is left to the scheduler as per Stock Settings"""
+	if not invoices or cint(frappe.db.get_single_value("Stock Settings",
+		"repost_future_entries_in_background")):
+		return
+
+	# item / warehouse of the stock posted, also where the warehouse came from the POS Profile
+	pairs = frappe.db.sql("""select distinct sle.item_code, sle.warehouse
+		from `tabStock Ledger Entry` sle, `tabSales Invoice` si
+		where sle.voucher_type='Sales Invoice' and sle.voucher_no=si.name
+			and si.offline_pos_name in %s""", (tuple([name for name, doc in invoices]),))
+
+	for i in xrange(0, len(pairs), 500):
+		chunk = pairs[i:i + 500]
+		for repost in frappe.db.sql_list("""select name from `tabRepost Item Valuation`
+			where status='Queued' and (item_code, warehouse) in ({0})
+			order by posting_date, posting_time, creation""".format(", ".join(["(%s, %s)"] * len(chunk))),
+			tuple(v for pair in chunk for v in pair)):
+			frappe.get_doc("Repost Item Valuation", repost).repost()
+
+def commit():
+	if not frappe.flags.in_test:
+		frappe.db.commit()
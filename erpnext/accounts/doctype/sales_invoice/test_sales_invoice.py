@@ -479,6 +479,44 @@ class TestSalesInvoice(unittest.TestCase):
 
 		self.pos_gl_entry(si, pos, 330)
 
+		# uploading again only acknowledges the invoice
+		self.assertEquals(make_invoice(invoice_data + invoice_data), ['09052016142'])
+		self.assertEquals(len(frappe.get_all('Sales Invoice', filters = {'offline_pos_name': '09052016142'})), 1)
+
+	def test_pos_data_sync(self):
+		from erpnext.accounts.doctype.sales_invoice.pos import get_pos_data, get_pos_data_page
+
+		self.make_pos_profile()
+
+		data = get_pos_data()
+		expected_items = frappe.get_all("Item", filters={"disabled": 0, "has_variants": 0})
+		self.assertEquals(sorted([d.name for d in data["items"]]), sorted([d.name for d in expected_items]))
+
+		# paginated sync returns the same items
+		items, after = [], None
+		while True:
+			page = get_pos_data_page("items", after=after, page_length=2)
+			items.extend(page["data"])
+			after = page["after"]
+			if not page["more"]:
+				break
+
+		self.assertEquals([d.name for d in items], sorted([d.name for d in data["items"]]))
+		for item in items:
+			self.assertEquals(item, [d for d in data["items"] if d.name == item.name][0])
+
+		# delta sync returns items whose price changed
+		sync_token = get_pos_data(paginate=1)["sync"]["token"]
+		item_price = frappe.db.get_value("Item Price",
+			{"item_code": "_Test Item", "price_list": "_Test Price List"}, ["name", "price_list_rate"], as_dict=1)
+		frappe.db.set_value("Item Price", item_price.name, "price_list_rate", 123.0)
+
+		page = get_pos_data_page("items", sync_token=sync_token)
+		self.assertEquals([d.price_list_rate for d in page["data"] if d.name == "_Test Item"], [123.0])
+
+		frappe.db.set_value("Item Price", item_price.name, "price_list_rate", item_price.price_list_rate)
+		frappe.db.sql("delete from `tabPOS Profile`")
+
 	def pos_gl_entry(self, si, pos, cash_amount):
 		# check stock ledger entries
 		sle = frappe.db.sql("""select * from `tabStock Ledger Entry`
@@ -865,6 +903,25 @@ class TestSalesInvoice(unittest.TestCase):
 		self.assertEquals(si.base_grand_total, 859.44)
 		self.assertEquals(si.grand_total, 859.44)
 
+	def test_taxes_and_totals_same_as_row_by_row(self):
+		from erpnext.controllers.taxes_and_totals import calculate_taxes_and_totals
+		from erpnext.tests.benchmarks.taxes_and_totals import calculate_row_by_row, get_values
+
+		# test_records[2] has Actual and On Previous Row Amount / Total taxes,
+		# test_records[3] has them included in the print rate
+		for record, discount in ((test_records[2], {}), (test_records[3], {}),
+			(test_records[2], {"apply_discount_on": "Grand Total", "additional_discount_percentage": 5}),
+			(test_records[3], {"apply_discount_on": "Grand Total", "discount_amount": 50})):
+
+			values = []
+			for calculate in (calculate_row_by_row, calculate_taxes_and_totals):
+				si = frappe.copy_doc(record)
+				si.update(discount)
+				calculate(si)
+				values.append(get_values(si))
+
+			self.assertEquals(values[0], values[1])
+
 	def test_multi_currency_gle(self):
 		set_perpetual_inventory(0)
 		si = create_sales_invoice(customer="_Test Customer USD", debit_to="_Test Receivable USD - _TC",
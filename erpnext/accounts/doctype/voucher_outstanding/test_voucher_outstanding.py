@@ -0,0 +1,40 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.accounts.utils import get_outstanding_invoices
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
+from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding \
+	import rebuild_outstanding_index, verify_outstanding_index
+
+class TestVoucherOutstanding(unittest.TestCase):
+	def get_outstanding(self, voucher_no):
+		for d in get_outstanding_invoices("Customer", "_Test Customer", "Debtors - _TC"):
+			if d.voucher_no == voucher_no:
+				return d.outstanding_amount
+
+	def test_outstanding_on_payment_and_cancel(self):
+		rebuild_outstanding_index("Customer", "_Test Customer")
+
+		si = create_sales_invoice(qty=1, rate=100)
+		self.assertEqual(self.get_outstanding(si.name), 100)
+
+		pe = get_payment_entry("Sales Invoice", si.name, party_amount=40, bank_account="_Test Cash - _TC")
+		pe.reference_no = "1"
+		pe.reference_date = "2016-01-01"
+		pe.insert()
+		pe.submit()
+
+		self.assertEqual(self.get_outstanding(si.name), 60)
+		self.assertEqual(verify_outstanding_index("Customer", "_Test Customer"), [])
+
+		pe.cancel()
+		self.assertEqual(self.get_outstanding(si.name), 100)
+
+		si.cancel()
+		self.assertEqual(self.get_outstanding(si.name), None)
+		self.assertFalse(frappe.db.exists("Voucher Outstanding", {"voucher_no": si.name}))
+		self.assertEqual(verify_outstanding_index("Customer", "_Test Customer"), [])
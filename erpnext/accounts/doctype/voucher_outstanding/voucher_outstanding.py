@@ -0,0 +1,209 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt, cstr, getdate, now
+from frappe.model.document import Document
+
+class VoucherOutstanding(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabVoucher Outstanding`
+		where Key_name="outstanding_key" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabVoucher Outstanding`
+			add unique index outstanding_key(party_type, party, account, voucher_type, voucher_no)""")
+
+def get_invoice_amount(gle):
+	'''Amount the GL Entry adds to its own voucher, if the voucher can have an outstanding'''
+	if not (gle.get("party_type") and gle.get("party")):
+		return 0.0
+
+	if gle.get("voucher_type") == "Payment Entry" \
+		or (gle.get("voucher_type") == "Journal Entry" and gle.get("against_voucher")):
+		return 0.0
+
+	amount = flt(gle.get("debit_in_account_currency")) - flt(gle.get("credit_in_account_currency"))
+	if gle.get("party_type") != "Customer":
+		amount = -amount
+
+	return amount if amount > 0 else 0.0
+
+def get_payment_amount(gle):
+	'''Amount the GL Entry pays against its `against_voucher`'''
+	if not (gle.get("party_type") and gle.get("party")
+		and gle.get("against_voucher_type") and gle.get("against_voucher")):
+		return 0.0
+
+	amount = flt(gle.get("credit_in_account_currency")) - flt(gle.get("debit_in_account_currency"))
+	if gle.get("party_type") != "Customer":
+		amount = -amount
+
+	return amount if amount > 0 else 0.0
+
+def update_outstanding_index(gl_entries, cancel=False):
+	'''Add posted (or subtract cancelled) GL Entries to invoice and payment amounts per voucher'''
+	outstanding = {}
+	for gle in gl_entries:
+		invoice_amount = get_invoice_amount(gle)
+		if invoice_amount:
+			key = (gle.get("party_type"), gle.get("party"), gle.get("account"),
+				gle.get("voucher_type"), gle.get("voucher_no"))
+			posting_date, amount, paid = outstanding.get(key, (None, 0.0, 0.0))
+			outstanding[key] = (getdate(gle.get("posting_date")), amount + invoice_amount, paid)
+
+		payment_amount = get_payment_amount(gle)
+		if payment_amount:
+			key = (gle.get("party_type"), gle.get("party"), gle.get("account"),
+				gle.get("against_voucher_type"), gle.get("against_voucher"))
+			posting_date, amount, paid = outstanding.get(key, (None, 0.0, 0.0))
+			outstanding[key] = (posting_date, amount, paid + payment_amount)
+
+	if not outstanding:
+		return
+
+	factor = -1 if cancel else 1
+	timestamp, user = now(), frappe.session.user
+
+	values = []
+	for key, (posting_date, invoice_amount, payment_amount) in outstanding.items():
+		values.extend([frappe.generate_hash(length=10), timestamp, timestamp, user, user]
+			+ list(key) + [posting_date, factor * invoice_amount, factor * payment_amount])
+
+	frappe.db.sql("""insert into `tabVoucher Outstanding`
+		(name, creation, modified, owner, modified_by, party_type, party, account,
+			voucher_type, voucher_no, posting_date, invoice_amount, payment_amount)
+		values {0}
+		on duplicate key update invoice_amount = invoice_amount + values(invoice_amount),
+			payment_amount = payment_amount + values(payment_amount),
+			posting_date = ifnull(posting_date, values(posting_date)),
+			modified = values(modified)""".format(", ".join(["(%s)" % ", ".join(["%s"] * 13)] * len(outstanding))),
+		tuple(values))
+
+	if cancel:
+		# vouchers left at zero by cancelled entries
+		keys = outstanding.keys()
+		frappe.db.sql("""delete from `tabVoucher Outstanding`
+			where abs(invoice_amount) < 0.005 and abs(payment_amount) < 0.005
+			and (party_type, party, account, voucher_type, voucher_no) in ({0})""".format(
+				", ".join(["(%s)" % ", ".join(["%s"] * 5)] * len(keys))), tuple(v for key in keys for v in key))
+
+def get_outstanding_vouchers(party_type, party, account, condition=None):
+	'''Vouchers of the party with invoice amount more than payments, in posting order.
+		`condition` may refer to `posting_date`, `invoice_amount` and `payment_amount`'''
+	return frappe.db.sql("""select voucher_no, voucher_type, posting_date, invoice_amount, payment_amount
+		from `tabVoucher Outstanding`
+		where party_type = %(party_type)s and party = %(party)s and account = %(account)s
+			and (invoice_amount - payment_amount) > 0.005 {condition}
+		order by posting_date, voucher_no""".format(condition=condition or ""),
+		{"party_type": party_type, "party": party, "account": account}, as_dict=True)
+
+def get_index_query(party_type=None, party=None, account=None):
+	'''Query to aggregate `tabGL Entry` in the shape of Voucher Outstanding'''
+	conditions = "party_type is not null and party_type != '' and party is not null and party != ''"
+	if party_type:
+		conditions += " and party_type=%(party_type)s"
+	if party:
+		conditions += " and party=%(party)s"
+	if account:
+		conditions += " and account=%(account)s"
+
+	invoice_amount = """if(party_type='Customer', debit_in_account_currency - credit_in_account_currency,
+		credit_in_account_currency - debit_in_account_currency)"""
+	payment_amount = """if(party_type='Customer', credit_in_account_currency - debit_in_account_currency,
+		debit_in_account_currency - credit_in_account_currency)"""
+
+	return """select party_type, party, account, voucher_type, voucher_no,
+			min(posting_date) as posting_date, sum(invoice_amount) as invoice_amount,
+			sum(payment_amount) as payment_amount
+		from (
+			select party_type, party, account, voucher_type, voucher_no, posting_date,
+				{invoice_amount} as invoice_amount, 0 as payment_amount
+			from `tabGL Entry`
+			where {conditions} and {invoice_amount} > 0
+				and ((voucher_type = 'Journal Entry' and (against_voucher = '' or against_voucher is null))
+					or (voucher_type not in ('Journal Entry', 'Payment Entry')))
+			union all
+			select party_type, party, account, against_voucher_type, against_voucher, null,
+				0, {payment_amount}
+			from `tabGL Entry`
+			where {conditions} and {payment_amount} > 0
+				and against_voucher_type is not null and against_voucher_type != ''
+				and against_voucher is not null and against_voucher != ''
+		) gle
+		group by party_type, party, account, voucher_type, voucher_no""".format(conditions=conditions,
+			invoice_amount=invoice_amount, payment_amount=payment_amount)
+
+def rebuild_outstanding_index(party_type=None, party=None):
+	'''Rebuild Voucher Outstanding from `tabGL Entry`
+
+	bench --site [site] execute erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding.rebuild_outstanding_index'''
+	aggregate_outstanding(party_type, party)
+	frappe.db.commit()
+
+def aggregate_outstanding(party_type=None, party=None, account=None):
+	'''Replace vouchers of the party / account with the sums of their GL Entries'''
+	args = {"party_type": party_type, "party": party, "account": account}
+	conditions = []
+	for key in ("party_type", "party", "account"):
+		if args[key]:
+			conditions.append("{0}=%({0})s".format(key))
+
+	frappe.db.sql("""delete from `tabVoucher Outstanding` {0}""".format(
+		"where " + " and ".join(conditions) if conditions else ""), args)
+
+	frappe.db.sql("""insert into `tabVoucher Outstanding`
+		(name, creation, modified, owner, modified_by, party_type, party, account,
+			voucher_type, voucher_no, posting_date, invoice_amount, payment_amount)
+		select substr(md5(uuid()), 1, 10), now(), now(), 'Administrator', 'Administrator',
+			party_type, party, account, voucher_type, voucher_no, posting_date, invoice_amount, payment_amount
+		from ({0}) outstanding""".format(get_index_query(party_type, party, account)), args)
+
+def rename_outstanding_index(doctype, old, new, merge=False):
+	'''Vouchers of a renamed party or account. GL Entries of a merged one are
+		aggregated again, as their vouchers now share keys'''
+	if doctype == "Account":
+		if merge:
+			frappe.db.sql("""delete from `tabVoucher Outstanding` where account=%s""", old)
+			aggregate_outstanding(account=new)
+		else:
+			frappe.db.sql("""update `tabVoucher Outstanding` set account=%s where account=%s""", (new, old))
+	elif merge:
+		frappe.db.sql("""delete from `tabVoucher Outstanding` where party_type=%s and party=%s""",
+			(doctype, old))
+		aggregate_outstanding(doctype, new)
+	else:
+		frappe.db.sql("""update `tabVoucher Outstanding` set party=%s
+			where party_type=%s and party=%s""", (new, doctype, old))
+
+def verify_outstanding_index(party_type=None, party=None):
+	'''Returns vouchers that do not match `tabGL Entry` as list of
+		(key, [invoice, payment] as per index, [invoice, payment] as per GL Entry)'''
+	def _get_map(data):
+		out = {}
+		for d in data:
+			key = (d.party_type, d.party, d.account, d.voucher_type, cstr(d.voucher_no))
+			out[key] = [flt(d.invoice_amount, 3), flt(d.payment_amount, 3)]
+		return out
+
+	args = {"party_type": party_type, "party": party}
+	conditions = ""
+	if party_type:
+		conditions += " and party_type=%(party_type)s"
+	if party:
+		conditions += " and party=%(party)s"
+
+	expected = _get_map(frappe.db.sql(get_index_query(party_type, party), args, as_dict=1))
+	actual = _get_map(frappe.db.sql("""select party_type, party, account, voucher_type, voucher_no,
+			invoice_amount, payment_amount
+		from `tabVoucher Outstanding`
+		where (invoice_amount != 0 or payment_amount != 0) {0}""".format(conditions), args, as_dict=1))
+
+	mismatched = []
+	for key in set(expected.keys() + actual.keys()):
+		if expected.get(key, [0.0, 0.0]) != actual.get(key, [0.0, 0.0]):
+			mismatched.append((key, actual.get(key), expected.get(key)))
+
+	return mismatched
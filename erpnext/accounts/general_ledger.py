@@ -3,9 +3,10 @@
 
 from __future__ import unicode_literals
 import frappe
-from frappe.utils import flt, cstr, cint
+from frappe.utils import flt, cstr, cint, now
 from frappe import _
-from frappe.model.meta import get_field_precision
+from frappe.model import no_value_fields
+from erpnext.utilities.precision import get_field_precision, get_company_default_currency
 from erpnext.accounts.doctype.budget.budget import validate_expense_against_budget
 
 
@@ -49,10 +50,12 @@ def process_gl_map(gl_map, merge_entries=True):
 
 def merge_similar_entries(gl_map):
 	merged_gl_map = []
+	merged_entries = {}
 	for entry in gl_map:
 		# if there is already an entry in this account then just add it
 		# to that entry
-		same_head = check_if_in_list(entry, merged_gl_map)
+		key = get_merge_key(entry)
+		same_head = merged_entries.get(key)
 		if same_head:
 			same_head.debit	= flt(same_head.debit) + flt(entry.debit)
 			same_head.debit_in_account_currency	= \
@@ -61,31 +64,78 @@ def merge_similar_entries(gl_map):
 			same_head.credit_in_account_currency = \
 				flt(same_head.credit_in_account_currency) + flt(entry.credit_in_account_currency)
 		else:
+			merged_entries[key] = entry
 			merged_gl_map.append(entry)
 
 	# filter zero debit and credit entries
 	merged_gl_map = filter(lambda x: flt(x.debit, 9)!=0 or flt(x.credit, 9)!=0, merged_gl_map)
 	return merged_gl_map
 
-def check_if_in_list(gle, gl_map):
-	for e in gl_map:
-		if e.account == gle.account \
-			and cstr(e.get('party_type'))==cstr(gle.get('party_type')) \
-			and cstr(e.get('party'))==cstr(gle.get('party')) \
-			and cstr(e.get('against_voucher'))==cstr(gle.get('against_voucher')) \
-			and cstr(e.get('against_voucher_type')) == cstr(gle.get('against_voucher_type')) \
-			and cstr(e.get('cost_center')) == cstr(gle.get('cost_center')) \
-			and cstr(e.get('project')) == cstr(gle.get('project')):
-				return e
+def get_merge_key(gle):
+	"""Entries with the same key are merged into one"""
+	return (gle.account, cstr(gle.get('party_type')), cstr(gle.get('party')),
+		cstr(gle.get('against_voucher')), cstr(gle.get('against_voucher_type')),
+		cstr(gle.get('cost_center')), cstr(gle.get('project')))
 
 def save_entries(gl_map, adv_adj, update_outstanding):
 	validate_account_for_auto_accounting_for_stock(gl_map)
 	round_off_debit_credit(gl_map)
 
-	for entry in gl_map:
-		make_entry(entry, adv_adj, update_outstanding)
-		# check against budget
-		validate_expense_against_budget(entry)
+	if has_gl_entry_doc_events():
+		# hooks must run for every GL Entry document
+		gl_entries = []
+		for entry in gl_map:
+			gl_entries.append(make_entry(entry, adv_adj, update_outstanding))
+			# check against budget
+			validate_expense_against_budget(entry)
+	else:
+		gl_entries = make_entries_in_bulk(gl_map, adv_adj, update_outstanding)
+
+	update_ledger_summaries(gl_entries)
+
+def update_ledger_summaries(gl_entries, cancel=False):
+	"""Keep tables derived from `tabGL Entry` in sync with posted or deleted GL Entries"""
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import update_period_balances
+	from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint \
+		import invalidate_checkpoints
+	from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding \
+		import update_outstanding_index
+	from erpnext.utilities.report_pages import bump_ledger_version
+
+	update_period_balances(gl_entries, cancel)
+	invalidate_checkpoints(gl_entries)
+	update_outstanding_index(gl_entries, cancel)
+	bump_ledger_version("GL Entry")
+
+def rename_in_ledger_summaries(doc, method=None, old=None, new=None, merge=False):
+	"""Keep tables derived from `tabGL Entry` in sync with a renamed account, cost center or party.
+	Called via hooks"""
+	from erpnext.accounts.doctype.account_period_balance.account_period_balance \
+		import rename_period_balances
+	from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint \
+		import rename_checkpoints
+	from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding \
+		import rename_outstanding_index
+
+	if doc.doctype in ("Account", "Cost Center"):
+		rename_period_balances(doc.doctype, old, new, merge)
+
+	if doc.doctype in ("Account", "Customer", "Supplier"):
+		rename_checkpoints(doc.doctype, old, new, merge)
+		rename_outstanding_index(doc.doctype, old, new, merge)
+
+def delete_voucher_gl_entries(voucher_type, voucher_no):
+	"""Delete GL Entries of a voucher and remove them from ledger summaries"""
+	gl_entries = frappe.db.sql("""select * from `tabGL Entry`
+		where voucher_type=%s and voucher_no=%s for update""", (voucher_type, voucher_no), as_dict=True)
+
+	if gl_entries:
+		update_ledger_summaries(gl_entries, cancel=True)
+		frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
+			(voucher_type, voucher_no))
+
+	return gl_entries
 
 def make_entry(args, adv_adj, update_outstanding):
 	args.update({"doctype": "GL Entry"})
@@ -94,6 +144,160 @@ def make_entry(args, adv_adj, update_outstanding):
 	gle.insert()
 	gle.run_method("on_update_with_args", adv_adj, update_outstanding)
 	gle.submit()
+	return gle
+
+def has_gl_entry_doc_events():
+	"""True if an app hooks into GL Entry events. Handlers for all doctypes ("*", registered by
+	frappe for notifications and feeds) are not run for GL Entries inserted in bulk"""
+	for doctypes in (frappe.get_hooks("doc_events") or {}):
+		if doctypes == "GL Entry" or (isinstance(doctypes, (list, tuple)) and "GL Entry" in doctypes):
+			return True
+
+	return False
+
+def make_entries_in_bulk(gl_map, adv_adj, update_outstanding):
+	"""Validate the whole gl_map once, insert all GL Entries with multi-row inserts and
+		update outstanding amounts and budgets once per voucher / account"""
+	from erpnext.accounts.doctype.gl_entry.gl_entry import update_outstanding_amt, validate_balance_type
+
+	validate_gl_map(gl_map, adv_adj)
+	insert_gl_entries(gl_map)
+
+	for account in set([d.account for d in gl_map]):
+		validate_balance_type(account, adv_adj)
+
+	if update_outstanding == 'Yes':
+		for against in set([(d.account, d.party_type, d.party, d.against_voucher_type, d.against_voucher)
+			for d in gl_map if d.against_voucher
+				and d.against_voucher_type in ('Journal Entry', 'Sales Invoice', 'Purchase Invoice')]):
+				update_outstanding_amt(*against)
+
+	budget_checked = []
+	for entry in gl_map:
+		key = (entry.account, entry.cost_center, entry.fiscal_year)
+		if key not in budget_checked:
+			validate_expense_against_budget(entry)
+			budget_checked.append(key)
+
+	return gl_map
+
+def validate_gl_map(gl_map, adv_adj=False):
+	"""Run the validations of GL Entry on distinct accounts, cost centers and parties"""
+	from erpnext.accounts.doctype.gl_entry.gl_entry import check_freezing_date, validate_frozen_account
+	from erpnext.accounts.party import validate_party_frozen_disabled, validate_party_gle_currency
+	from erpnext.accounts.utils import get_fiscal_year
+	from erpnext.setup.doctype.company.company import get_company_currency
+	from erpnext.exceptions import InvalidAccountCurrency
+
+	for entry in gl_map:
+		for k in ('account', 'voucher_type', 'voucher_no', 'company'):
+			if not entry.get(k):
+				frappe.throw(_("{0} is required").format(_(frappe.get_meta("GL Entry").get_label(k))))
+
+	accounts = get_details_for("Account", [d.account for d in gl_map], ["is_group", "docstatus",
+		"company", "account_type", "report_type", "account_currency", "freeze_account"])
+	cost_centers = get_details_for("Cost Center", [d.cost_center for d in gl_map if d.cost_center],
+		["company"])
+
+	for entry in gl_map:
+		account = accounts.get(entry.account)
+		if not account:
+			frappe.throw(_("Account {0} does not exist").format(entry.account))
+
+		if account.account_type in ["Receivable", "Payable"] and not (entry.party_type and entry.party):
+			frappe.throw(_("Party Type and Party is required for Receivable / Payable account {0}").format(entry.account))
+
+		# Zero value transaction is not allowed
+		if not (flt(entry.debit) or flt(entry.credit)):
+			frappe.throw(_("Either debit or credit amount is required for {0}").format(entry.account))
+
+		if account.report_type == "Profit and Loss":
+			if not entry.cost_center and entry.voucher_type != 'Period Closing Voucher':
+				frappe.throw(_("Cost Center is required for 'Profit and Loss' account {0}")
+					.format(entry.account))
+
+			if entry.is_opening == 'Yes':
+				frappe.throw(_("'Profit and Loss' type account {0} not allowed in Opening Entry").format(entry.account))
+		else:
+			entry.cost_center = None
+			entry.project = None
+
+		if entry.cost_center and cost_centers.get(entry.cost_center, {}).get("company") != entry.company:
+			frappe.throw(_("Cost Center {0} does not belong to Company {1}").format(entry.cost_center, entry.company))
+
+		company_currency = get_company_currency(entry.company)
+		if not entry.account_currency:
+			entry.account_currency = company_currency
+
+		if (account.account_currency or company_currency) != entry.account_currency:
+			frappe.throw(_("Accounting Entry for {0} can only be made in currency: {1}")
+				.format(entry.account, (account.account_currency or company_currency)), InvalidAccountCurrency)
+
+		if not entry.fiscal_year:
+			entry.fiscal_year = get_fiscal_year(entry.posting_date, company=entry.company)[0]
+
+		if account.is_group==1:
+			frappe.throw(_("Account {0} cannot be a Group").format(entry.account))
+
+		if account.docstatus==2:
+			frappe.throw(_("Account {0} is inactive").format(entry.account))
+
+		if account.company != entry.company:
+			frappe.throw(_("Account {0} does not belong to Company {1}").format(entry.account, entry.company))
+
+	for party_type, party, company, account_currency in set([(d.party_type, d.party, d.company,
+		d.account_currency) for d in gl_map if d.party_type and d.party]):
+			validate_party_frozen_disabled(party_type, party)
+			validate_party_gle_currency(party_type, party, company, account_currency)
+
+	for account in accounts:
+		validate_frozen_account(account, adv_adj)
+
+	for posting_date in set([d.posting_date for d in gl_map]):
+		check_freezing_date(posting_date, adv_adj)
+
+def get_details_for(doctype, names, fields):
+	"""Returns dict of name: details for the given names, fetched in one query"""
+	names = list(set(names))
+	if not names:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, {0} from `tab{1}`
+		where name in ({2})""".format(", ".join(fields), doctype, ", ".join(["%s"] * len(names))),
+		tuple(names), as_dict=1))
+
+def insert_gl_entries(gl_map, chunk_size=500):
+	"""Insert validated GL Entries as submitted documents using multi-row inserts"""
+	meta = frappe.get_meta("GL Entry")
+	fields = [df.fieldname for df in meta.get("fields") if df.fieldtype not in no_value_fields]
+	columns = ["name", "owner", "creation", "modified", "modified_by", "docstatus", "idx"] + fields
+
+	timestamp, user = now(), frappe.session.user
+	names = get_gl_entry_names(len(gl_map))
+
+	rows = []
+	for name, entry in zip(names, gl_map):
+		entry.name = name
+		rows.append([name, user, timestamp, timestamp, user, 1, 0] + [entry.get(f) for f in fields])
+
+	row_placeholder = "({0})".format(", ".join(["%s"] * len(columns)))
+	for i in xrange(0, len(rows), chunk_size):
+		chunk = rows[i:i + chunk_size]
+		frappe.db.sql("""insert into `tabGL Entry` ({0}) values {1}""".format(
+			", ".join("`{0}`".format(c) for c in columns), ", ".join([row_placeholder] * len(chunk))),
+			tuple(value for row in chunk for value in row))
+
+def get_gl_entry_names(count):
+	"""Reserve `count` consecutive names from the GL Entry naming series `GL.#######`"""
+	current = frappe.db.sql("select current from `tabSeries` where name='GL.' for update")
+	if current and current[0][0] is not None:
+		current = current[0][0]
+		frappe.db.sql("update `tabSeries` set current = current + %s where name='GL.'", count)
+	else:
+		current = 0
+		frappe.db.sql("insert into `tabSeries` (name, current) values ('GL.', %s)", count)
+
+	return ["GL.{0:07d}".format(cint(current) + i) for i in xrange(1, count + 1)]
 
 def validate_account_for_auto_accounting_for_stock(gl_map):
 	if cint(frappe.db.get_single_value("Accounts Settings", "auto_accounting_for_stock")) \
@@ -107,8 +311,7 @@ def validate_account_for_auto_accounting_for_stock(gl_map):
 						.format(entry.account), StockAccountInvalidTransaction)
 
 def round_off_debit_credit(gl_map):
-	precision = get_field_precision(frappe.get_meta("GL Entry").get_field("debit"),
-		currency=frappe.db.get_value("Company", gl_map[0].company, "default_currency", cache=True))
+	precision = get_field_precision("GL Entry", "debit", get_company_default_currency(gl_map[0].company))
 
 	debit_credit_diff = 0.0
 	for entry in gl_map:
@@ -176,8 +379,8 @@ def delete_gl_entries(gl_entries=None, voucher_type=None, voucher_no=None,
 	if gl_entries:
 		check_freezing_date(gl_entries[0]["posting_date"], adv_adj)
 
-	frappe.db.sql("""delete from `tabGL Entry` where voucher_type=%s and voucher_no=%s""",
-		(voucher_type or gl_entries[0]["voucher_type"], voucher_no or gl_entries[0]["voucher_no"]))
+	delete_voucher_gl_entries(voucher_type or gl_entries[0]["voucher_type"],
+		voucher_no or gl_entries[0]["voucher_no"])
 
 	for entry in gl_entries:
 		validate_frozen_account(entry["account"], adv_adj)
@@ -197,26 +197,120 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 
 	get_data_from_server: function(callback){
 		var me = this;
+		var master_data = this.get_master_data_from_localstorage();
+
+		frappe.dom.freeze(__("Master data syncing, it might take some time"));
 		frappe.call({
 			method: "erpnext.accounts.doctype.sales_invoice.pos.get_pos_data",
-			freeze: true,
-			freeze_message: __("Master data syncing, it might take some time"),
+			args: {
+				paginate: 1,
+				sync_token: master_data.token || null,
+				sync_version: master_data.version || null,
+				sync_key: master_data.key || null
+			},
+			callback: function(r){
+				var sync = r.message.sync;
+				if(!sync.delta) {
+					master_data = {items: [], customers: [], pricing_rules: []};
+				}
+
+				master_data.pricing_rules = sync.pricing_rules_delta ?
+					me.sort_pricing_rules(me.merge_records(master_data.pricing_rules,
+						r.message.pricing_rules, sync.removed.pricing_rules)) : r.message.pricing_rules;
+
+				me.sync_master_data("items", sync, master_data, function(){
+					me.sync_master_data("customers", sync, master_data, function(){
+						frappe.dom.unfreeze();
+						master_data.version = sync.version;
+						master_data.key = sync.key;
+						master_data.token = sync.token;
+						me.set_master_data_in_localstorage(master_data);
+
+						window.items = master_data.items;
+						window.customers = master_data.customers;
+						window.pricing_rules = master_data.pricing_rules;
+						window.meta = r.message.meta;
+						window.print_template = r.message.print_template;
+						me.default_customer = r.message.default_customer || null;
+						me.write_off_account = r.message.write_off_account;
+						localStorage.setItem('doc', JSON.stringify(r.message.doc));
+						if(callback){
+							callback();
+						}
+					})
+				})
+			},
+			error: function() {
+				frappe.dom.unfreeze();
+			}
+		})
+	},
+
+	sync_master_data: function(section, sync, master_data, callback, after){
+		// pull items / customers page by page, only the changed ones if synced earlier
+		var me = this;
+		if(!after) {
+			master_data[section] = this.merge_records(master_data[section], [], sync.removed[section]);
+		}
+
+		frappe.call({
+			method: "erpnext.accounts.doctype.sales_invoice.pos.get_pos_data_page",
+			args: {
+				section: section,
+				sync_token: sync.delta ? master_data.token : null,
+				after: after || null,
+				page_length: 500
+			},
 			callback: function(r){
-				window.items = r.message.items;
-				window.customers = r.message.customers;
-				window.pricing_rules = r.message.pricing_rules;
-				window.meta = r.message.meta;
-				window.print_template = r.message.print_template;
-				me.default_customer = r.message.default_customer || null;
-				me.write_off_account = r.message.write_off_account;
-				localStorage.setItem('doc', JSON.stringify(r.message.doc));
-				if(callback){
+				master_data[section] = me.merge_records(master_data[section], r.message.data, r.message.removed);
+				if(r.message.more) {
+					me.sync_master_data(section, sync, master_data, callback, r.message.after);
+				} else {
 					callback();
 				}
+			},
+			error: function() {
+				frappe.dom.unfreeze();
 			}
 		})
 	},
 
+	merge_records: function(records, updated, removed){
+		var names = {};
+		$.each((removed || []).concat($.map(updated || [], function(d) { return d.name; })), function(i, name){
+			names[name] = true;
+		})
+
+		return $.grep(records || [], function(d){
+			return !names[d.name];
+		}).concat(updated || []);
+	},
+
+	sort_pricing_rules: function(pricing_rules){
+		// same order as the server: priority desc, name desc
+		return pricing_rules.sort(function(a, b){
+			var a_key = [a.priority || "", a.name], b_key = [b.priority || "", b.name];
+			return a_key[0] == b_key[0] ? (a_key[1] < b_key[1] ? 1 : -1) : (a_key[0] < b_key[0] ? 1 : -1);
+		})
+	},
+
+	get_master_data_from_localstorage: function(){
+		try{
+			return JSON.parse(localStorage.getItem('pos_master_data')) || {};
+		}catch(e){
+			return {}
+		}
+	},
+
+	set_master_data_in_localstorage: function(master_data){
+		try{
+			localStorage.setItem('pos_master_data', JSON.stringify(master_data));
+		}catch(e){
+			// too large to keep, next load will be a full sync
+			localStorage.removeItem('pos_master_data');
+		}
+	},
+
 	save_previous_entry : function(){
 		if(this.frm.doc.items.length > 0){
 			this.create_invoice()
@@ -842,24 +936,56 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 
 	sync_sales_invoice: function(){
 		var me = this;
+
+		if(this.sync_job_id) {
+			// previous upload is still being processed in the background
+			this.check_invoice_sync_status();
+			return;
+		}
+
 		this.si_docs = this.get_submitted_invoice();
 
 		if(this.si_docs.length){
 			frappe.call({
-				method: "erpnext.accounts.doctype.sales_invoice.pos.make_invoice",
+				method: "erpnext.accounts.doctype.sales_invoice.pos.enqueue_invoices",
 				args: {
 					doc_list: me.si_docs
 				},
 				callback: function(r){
 					if(r.message){
-						me.removed_items = r.message;
-						me.remove_doc_from_localstorage();
+						me.sync_job_id = r.message;
 					}
 				}
 			})
 		}
 	},
 
+	check_invoice_sync_status: function(){
+		var me = this;
+		frappe.call({
+			method: "erpnext.accounts.doctype.sales_invoice.pos.get_invoice_sync_status",
+			args: {
+				job_id: me.sync_job_id
+			},
+			callback: function(r){
+				if(!r.message) {
+					// job lost, upload again
+					me.sync_job_id = null;
+					return;
+				}
+
+				if(r.message.synced.length){
+					me.removed_items = r.message.synced;
+					me.remove_doc_from_localstorage();
+				}
+
+				if(in_list(["Completed", "Failed"], r.message.status)) {
+					me.sync_job_id = null;
+				}
+			}
+		})
+	},
+
 	get_submitted_invoice: function(){
 		var invoices = [];
 		var index = 1;
@@ -867,7 +993,7 @@ erpnext.pos.PointOfSale = erpnext.taxes_and_totals.extend({
 		if(docs){
 			invoices = $.map(docs, function(data){
 				for(key in data){
-					if(data[key].docstatus == 1 && index < 50){
+					if(data[key].docstatus == 1 && index < 500){
 						index++
 						return data
 					}
@@ -140,9 +140,9 @@ class ReceivablePayableReport(object):
 		return data
 
 	def get_entries_after(self, report_date, party_type):
-		# returns a distinct list
-		return list(set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type)
-			if getdate(e.posting_date) > report_date]))
+		# returns a distinct set
+		return set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type)
+			if getdate(e.posting_date) > report_date])
 
 	def get_entries_till(self, report_date, party_type):
 		# returns a generator
@@ -166,9 +166,10 @@ class ReceivablePayableReport(object):
 
 	def get_outstanding_amount(self, gle, report_date, dr_or_cr):
 		payment_amount = 0.0
-		for e in self.get_gl_entries_for(gle.party, gle.party_type, gle.voucher_type, gle.voucher_no):
-			if getdate(e.posting_date) <= report_date and e.name!=gle.name:
-				payment_amount += (flt(e.credit if gle.party_type == "Customer" else e.debit) - flt(e.get(dr_or_cr)))
+		for name, amount in self.get_payments_against(gle.party, gle.party_type, gle.voucher_type,
+			gle.voucher_no, report_date, dr_or_cr):
+			if name!=gle.name:
+				payment_amount += amount
 
 		return flt(gle.get(dr_or_cr)) - flt(gle.credit if gle.party_type == "Customer" else gle.debit) - payment_amount
 
@@ -242,20 +243,24 @@ class ReceivablePayableReport(object):
 
 		return " and ".join(conditions), values
 
-	def get_gl_entries_for(self, party, party_type, against_voucher_type, against_voucher):
-		if not hasattr(self, "gl_entries_map"):
-			self.gl_entries_map = {}
+	def get_payments_against(self, party, party_type, against_voucher_type, against_voucher,
+		report_date, dr_or_cr):
+		'''Return `(name, amount)` of entries up to the report date adjusted against the voucher.
+
+		All entries are grouped by party and against voucher in one pass, with the signed
+		amount precomputed, so each voucher costs one dict lookup.'''
+		if not hasattr(self, "payments_map"):
+			reverse_dr_or_cr = "credit" if party_type == "Customer" else "debit"
+
+			self.payments_map = {}
 			for gle in self.get_gl_entries(party_type):
-				if gle.against_voucher_type and gle.against_voucher:
-					self.gl_entries_map.setdefault(gle.party, {})\
-						.setdefault(gle.against_voucher_type, {})\
-						.setdefault(gle.against_voucher, [])\
-						.append(gle)
-
-		return self.gl_entries_map.get(party, {})\
-			.get(against_voucher_type, {})\
-			.get(against_voucher, [])
-			
+				if gle.against_voucher_type and gle.against_voucher \
+					and getdate(gle.posting_date) <= report_date:
+					self.payments_map.setdefault((gle.party, gle.against_voucher_type, gle.against_voucher), [])\
+						.append((gle.name, flt(gle.get(reverse_dr_or_cr)) - flt(gle.get(dr_or_cr))))
+
+		return self.payments_map.get((party, against_voucher_type, against_voucher), [])
+
 	def get_chart_data(self, columns, data):
 		ageing_columns = columns[self.ageing_col_idx_start : self.ageing_col_idx_start+4]
 		
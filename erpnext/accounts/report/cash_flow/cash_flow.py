@@ -6,6 +6,7 @@ import frappe
 from frappe import _
 from erpnext.accounts.report.financial_statements import (get_period_list, get_columns, get_data)
 from erpnext.accounts.report.profit_and_loss_statement.profit_and_loss_statement import get_net_profit_loss
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import can_use_period_balances
 
 
 def execute(filters=None):
@@ -103,14 +104,24 @@ def get_account_type_based_data(company, account_type, period_list, accumulated_
 	data = {}
 	total = 0
 	for period in period_list:
-		gl_sum = frappe.db.sql_list("""
-			select sum(credit) - sum(debit)
-			from `tabGL Entry`
-			where company=%s and posting_date >= %s and posting_date <= %s 
-				and voucher_type != 'Period Closing Voucher'
-				and account in ( SELECT name FROM tabAccount WHERE account_type = %s)
-		""", (company, period["year_start_date"] if accumulated_values else period['from_date'], 
-			period['to_date'], account_type))
+		from_date = period["year_start_date"] if accumulated_values else period['from_date']
+
+		if can_use_period_balances(from_date, period['to_date']):
+			gl_sum = frappe.db.sql_list("""
+				select sum(credit) - sum(debit)
+				from `tabAccount Period Balance`
+				where company=%s and period_start_date >= %s and period_start_date <= %s
+					and is_period_closing = 0
+					and account in ( SELECT name FROM tabAccount WHERE account_type = %s)
+			""", (company, from_date, period['to_date'], account_type))
+		else:
+			gl_sum = frappe.db.sql_list("""
+				select sum(credit) - sum(debit)
+				from `tabGL Entry`
+				where company=%s and posting_date >= %s and posting_date <= %s 
+					and voucher_type != 'Period Closing Voucher'
+					and account in ( SELECT name FROM tabAccount WHERE account_type = %s)
+			""", (company, from_date, period['to_date'], account_type))
 		
 		if gl_sum and gl_sum[0]:
 			amount = gl_sum[0]
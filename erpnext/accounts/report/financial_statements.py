@@ -6,6 +6,8 @@ import frappe
 from frappe import _
 from frappe.utils import (flt, getdate, get_first_day, get_last_day,
 	add_months, add_days, formatdate)
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import (can_use_period_balances,
+	get_period_balances)
 
 def get_period_list(fiscal_year, periodicity):
 	"""Get a list of dict {"from_date": from_date, "to_date": to_date, "key": key, "label": label}
@@ -264,6 +266,14 @@ def sort_root_accounts(roots):
 def set_gl_entries_by_account(company, from_date, to_date, root_lft, root_rgt, gl_entries_by_account,
 		ignore_closing_entries=False):
 	"""Returns a dict like { "account": [gl entries], ... }"""
+	if can_use_period_balances(from_date, to_date):
+		# whole months, read monthly balances instead of every GL Entry
+		for entry in get_period_balances(company, from_date, to_date, root_lft, root_rgt,
+			ignore_closing_entries=ignore_closing_entries):
+				gl_entries_by_account.setdefault(entry.account, []).append(entry)
+
+		return gl_entries_by_account
+
 	additional_conditions = []
 
 	if ignore_closing_entries:
@@ -81,6 +81,12 @@ frappe.query_reports["General Ledger"] = {
 			"label": __("Group by Account"),
 			"fieldtype": "Check",
 		},
+		{
+			"fieldname":"page",
+			"label": __("Page"),
+			"fieldtype": "Int",
+			"description": __("Show one page of 500 entries, leave blank for all")
+		},
 		{
 			"fieldname":"letter_head",
 			"label": __("Letter Head"),
@@ -2,15 +2,17 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
+import json
+from itertools import groupby
 import frappe
-from frappe.utils import flt, getdate, cstr
+from frappe.utils import flt, cint
 from frappe import _
 from erpnext.accounts.utils import get_account_currency
+from erpnext.utilities.tree_cache import get_descendants_condition
+from erpnext.utilities.report_pages import get_page, validate_report_permission
 
 def execute(filters=None):
-	account_details = {}
-	for acc in frappe.db.sql("""select name, is_group from tabAccount""", as_dict=1):
-		account_details.setdefault(acc.name, acc)
+	account_details = get_account_details(filters)
 
 	validate_filters(filters, account_details)
 
@@ -20,10 +22,25 @@ def execute(filters=None):
 
 	columns = get_columns(filters)
 
-	res = get_result(filters, account_details)
+	if cint(filters.get("page")):
+		page = get_page("General Ledger", "GL Entry", filters, filters.page, get_ledger_page,
+			resume_cursor)
+	else:
+		page = get_full_ledger(filters)
+
+	res = get_result_as_list(get_data_with_opening_closing(filters, page), filters)
 
 	return columns, res
 
+def get_account_details(filters):
+	account_details = {}
+	if filters.get("account"):
+		account = frappe.db.get_value("Account", filters.account, ["name", "is_group"], as_dict=1)
+		if account:
+			account_details[account.name] = account
+
+	return account_details
+
 def validate_filters(filters, account_details):
 	if filters.get("account") and not account_details.get(filters.account):
 		frappe.throw(_("Account {0} does not exists").format(filters.account))
@@ -93,44 +110,10 @@ def get_columns(filters):
 
 	return columns
 
-def get_result(filters, account_details):
-	gl_entries = get_gl_entries(filters)
-
-	data = get_data_with_opening_closing(filters, account_details, gl_entries)
-
-	result = get_result_as_list(data, filters)
-
-	return result
-
-def get_gl_entries(filters):
-	select_fields = """, sum(debit_in_account_currency) as debit_in_account_currency,
-		sum(credit_in_account_currency) as credit_in_account_currency""" \
-		if filters.get("show_in_account_currency") else ""
-
-	group_by_condition = "group by voucher_type, voucher_no, account, cost_center" \
-		if filters.get("group_by_voucher") else "group by name"
-
-	gl_entries = frappe.db.sql("""
-		select 
-			posting_date, account, party_type, party,
-			sum(debit) as debit, sum(credit) as credit,
-			voucher_type, voucher_no, cost_center, project,
-			remarks, against, is_opening {select_fields}
-		from `tabGL Entry`
-		where company=%(company)s {conditions}
-		{group_by_condition}
-		order by posting_date, account"""\
-		.format(select_fields=select_fields, conditions=get_conditions(filters),
-			group_by_condition=group_by_condition), filters, as_dict=1)
-
-	return gl_entries
-
-def get_conditions(filters):
+def get_conditions(filters, date_condition=True):
 	conditions = []
 	if filters.get("account"):
-		lft, rgt = frappe.db.get_value("Account", filters["account"], ["lft", "rgt"])
-		conditions.append("""account in (select name from tabAccount
-			where lft>=%s and rgt<=%s and docstatus<2)""" % (lft, rgt))
+		conditions.append(get_descendants_condition("Account", filters["account"], "account"))
 
 	if filters.get("voucher_no"):
 		conditions.append("voucher_no=%(voucher_no)s")
@@ -141,7 +124,7 @@ def get_conditions(filters):
 	if filters.get("party"):
 		conditions.append("party=%(party)s")
 
-	if not (filters.get("account") or filters.get("party") or filters.get("group_by_account")):
+	if date_condition and not (filters.get("account") or filters.get("party") or filters.get("group_by_account")):
 		conditions.append("posting_date >=%(from_date)s")
 
 	from frappe.desk.reportview import build_match_conditions
@@ -150,119 +133,71 @@ def get_conditions(filters):
 
 	return "and {}".format(" and ".join(conditions)) if conditions else ""
 
-def get_data_with_opening_closing(filters, account_details, gl_entries):
+def get_data_with_opening_closing(filters, page):
+	'''Report rows for a page of the ledger, with the opening on the first page and totals and
+	closing on the last page. If grouped by account, the opening of each account is added where
+	its entries start and its totals and closing where they end'''
 	data = []
-	gle_map = initialize_gle_map(gl_entries)
-
-	opening, total_debit, total_credit, opening_in_account_currency, total_debit_in_account_currency, \
-		total_credit_in_account_currency, gle_map = get_accountwise_gle(filters, gl_entries, gle_map)
 
 	# Opening for filtered account
-	if filters.get("account") or filters.get("party"):
-		data += [get_balance_row(_("Opening"), opening, opening_in_account_currency), {}]
+	if page["opening"] and (filters.get("account") or filters.get("party")):
+		data += [get_balance_row(_("Opening"), page["opening"].balance,
+			page["opening"].balance_in_account_currency), {}]
 
 	if filters.get("group_by_account"):
-		for acc, acc_dict in gle_map.items():
-			if acc_dict.entries:
-				# Opening for individual ledger, if grouped by account
-				data.append(get_balance_row(_("Opening"), acc_dict.opening,
-					acc_dict.opening_in_account_currency))
-
-				data += acc_dict.entries
-
-				# Totals and closing for individual ledger, if grouped by account
-				account_closing = acc_dict.opening + acc_dict.total_debit - acc_dict.total_credit
-				account_closing_in_account_currency = acc_dict.opening_in_account_currency \
-					+ acc_dict.total_debit_in_account_currency - acc_dict.total_credit_in_account_currency
-
-				data += [{"account": "'" + _("Totals") + "'", "debit": acc_dict.total_debit,
-					"credit": acc_dict.total_credit},
-					get_balance_row(_("Closing (Opening + Totals)"),
-						account_closing, account_closing_in_account_currency), {}]
+		groups = [(account, list(entries))
+			for account, entries in groupby(page["entries"], key=lambda gle: gle.account)]
+
+		# accounts with their last entry on this page
+		closed_accounts = [account for account, entries in groups
+			if account != groups[-1][0] or page["next_account"] != account]
+		account_totals = get_totals(filters, closed_accounts)
+
+		for account, entries in groups:
+			# Opening for individual ledger, if grouped by account
+			if account in page["account_openings"]:
+				opening = page["account_openings"][account]
+				data.append(get_balance_row(_("Opening"), opening.balance,
+					opening.balance_in_account_currency))
+
+			data += entries
+
+			# Totals and closing for individual ledger, if grouped by account
+			if account in account_totals:
+				data += [{"account": "'" + _("Totals") + "'", "debit": account_totals[account].debit,
+					"credit": account_totals[account].credit},
+					get_balance_row(_("Closing (Opening + Totals)"), entries[-1].balance,
+						entries[-1].balance_in_account_currency), {}]
 
 	else:
-		for gl in gl_entries:
-			if gl.posting_date >= getdate(filters.from_date) and gl.posting_date <= getdate(filters.to_date) \
-					and gl.is_opening == "No":
-				data.append(gl)
+		data += page["entries"]
 
+	if page["cursor"]:
+		return data
 
 	# Total debit and credit between from and to date
-	if total_debit or total_credit:
+	totals = get_totals(filters)
+	if totals.debit or totals.credit:
 		data.append({
 			"account": "'" + _("Totals") + "'",
-			"debit": total_debit,
-			"credit": total_credit,
-			"debit_in_account_currency": total_debit_in_account_currency,
-			"credit_in_account_currency": total_credit_in_account_currency
+			"debit": totals.debit,
+			"credit": totals.credit,
+			"debit_in_account_currency": totals.debit_in_account_currency,
+			"credit_in_account_currency": totals.credit_in_account_currency
 		})
 
 	# Closing for filtered account
 	if filters.get("account") or filters.get("party"):
-		closing = opening + total_debit - total_credit
-		closing_in_account_currency = opening_in_account_currency + \
-			total_debit_in_account_currency - total_credit_in_account_currency
+		opening = page["opening"] or get_opening_balance(filters)
+		closing = opening.balance + totals.debit - totals.credit
+		closing_in_account_currency = opening.balance_in_account_currency + \
+			totals.debit_in_account_currency - totals.credit_in_account_currency
 
 		data.append(get_balance_row(_("Closing (Opening + Totals)"),
 			closing, closing_in_account_currency))
 
 	return data
 
-def initialize_gle_map(gl_entries):
-	gle_map = frappe._dict()
-	for gle in gl_entries:
-		gle_map.setdefault(gle.account, frappe._dict({
-			"opening": 0,
-			"opening_in_account_currency": 0,
-			"entries": [],
-			"total_debit": 0,
-			"total_debit_in_account_currency": 0,
-			"total_credit": 0,
-			"total_credit_in_account_currency": 0,
-			"closing": 0,
-			"closing_in_account_currency": 0
-		}))
-	return gle_map
-
-def get_accountwise_gle(filters, gl_entries, gle_map):
-	opening, total_debit, total_credit = 0, 0, 0
-	opening_in_account_currency, total_debit_in_account_currency, total_credit_in_account_currency = 0, 0, 0
-
-	from_date, to_date = getdate(filters.from_date), getdate(filters.to_date)
-	for gle in gl_entries:
-		amount = flt(gle.debit, 3) - flt(gle.credit, 3)
-		amount_in_account_currency = flt(gle.debit_in_account_currency, 3) - flt(gle.credit_in_account_currency, 3)
-
-		if (filters.get("account") or filters.get("party") or filters.get("group_by_account")) \
-				and (gle.posting_date < from_date or cstr(gle.is_opening) == "Yes"):
-
-			gle_map[gle.account].opening += amount
-			if filters.get("show_in_account_currency"):
-				gle_map[gle.account].opening_in_account_currency += amount_in_account_currency
-
-			if filters.get("account") or filters.get("party"):
-				opening += amount
-				if filters.get("show_in_account_currency"):
-					opening_in_account_currency += amount_in_account_currency
-
-		elif gle.posting_date <= to_date:
-			gle_map[gle.account].entries.append(gle)
-			gle_map[gle.account].total_debit += flt(gle.debit, 3)
-			gle_map[gle.account].total_credit += flt(gle.credit, 3)
-
-			total_debit += flt(gle.debit, 3)
-			total_credit += flt(gle.credit, 3)
-
-			if filters.get("show_in_account_currency"):
-				gle_map[gle.account].total_debit_in_account_currency += flt(gle.debit_in_account_currency, 3)
-				gle_map[gle.account].total_credit_in_account_currency += flt(gle.credit_in_account_currency, 3)
-
-				total_debit_in_account_currency += flt(gle.debit_in_account_currency, 3)
-				total_credit_in_account_currency += flt(gle.credit_in_account_currency, 3)
-
-	return opening, total_debit, total_credit, opening_in_account_currency, \
-		total_debit_in_account_currency, total_credit_in_account_currency, gle_map
-
 def get_balance_row(label, balance, balance_in_account_currency=None):
 	balance_row = {
 		"account": "'" + label + "'",
@@ -293,3 +228,269 @@ def get_result_as_list(data, filters):
 		result.append(row)
 
 	return result
+
+@frappe.whitelist()
+def get_ledger_page(filters, cursor=None, page_length=500):
+	'''Return one page of ledger rows with a running balance.
+
+	The opening balance is computed with a single aggregate query on the first call
+	and then carried forward in the cursor, so every page costs one indexed range
+	scan however large the ledger is. Rows are grouped by voucher and ordered by account
+	first as per the filters. If grouped by account, the balance runs from the opening of
+	each account, given in `account_openings` for the accounts that start on the page.
+	Pass the returned `cursor` back to fetch the next page; it is `None` after the last page.'''
+	validate_report_permission("GL Entry")
+
+	if isinstance(filters, basestring):
+		filters = json.loads(filters)
+	filters = frappe._dict(filters)
+
+	if isinstance(cursor, basestring):
+		cursor = json.loads(cursor)
+
+	if not cursor:
+		validate_filters(filters, get_account_details(filters))
+		validate_party(filters)
+	filters = set_account_currency(filters)
+
+	if cursor:
+		cursor = frappe._dict(cursor)
+		opening = None
+	else:
+		opening = get_opening_balance(filters)
+		cursor = frappe._dict({
+			"key": None,
+			"account": None,
+			"balance": opening.balance,
+			"balance_in_account_currency": opening.balance_in_account_currency
+		})
+
+	page_length = cint(page_length) or 500
+	entries = get_ledger_entries(filters, cursor.key, page_length + 1)
+
+	has_more = len(entries) > page_length
+	next_account = entries[page_length].account if has_more else None
+	entries = entries[:page_length]
+
+	account_openings = {}
+	if filters.get("group_by_account"):
+		account_openings = get_opening_balance(filters,
+			list(set([gle.account for gle in entries if gle.account != cursor.account])))
+
+	account = cursor.account
+	balance, balance_in_account_currency = flt(cursor.balance), flt(cursor.balance_in_account_currency)
+	for gle in entries:
+		if gle.account != account and gle.account in account_openings:
+			balance = account_openings[gle.account].balance
+			balance_in_account_currency = account_openings[gle.account].balance_in_account_currency
+		account = gle.account
+
+		balance += flt(gle.debit, 3) - flt(gle.credit, 3)
+		gle.balance = balance
+
+		if filters.get("show_in_account_currency"):
+			balance_in_account_currency += flt(gle.debit_in_account_currency, 3) \
+				- flt(gle.credit_in_account_currency, 3)
+			gle.balance_in_account_currency = balance_in_account_currency
+
+	next_cursor = None
+	if has_more:
+		next_cursor = {
+			"key": get_key(entries[-1], filters),
+			"account": account,
+			"balance": balance,
+			"balance_in_account_currency": balance_in_account_currency
+		}
+
+	return {
+		"opening": opening,
+		"account_openings": account_openings,
+		"entries": entries,
+		"next_account": next_account,
+		"cursor": next_cursor
+	}
+
+def get_full_ledger(filters):
+	'''All pages of the ledger as one page'''
+	ledger = {"opening": None, "account_openings": {}, "entries": [], "next_account": None,
+		"cursor": None}
+
+	for page in stream_ledger(filters):
+		ledger["opening"] = ledger["opening"] or page["opening"]
+		ledger["account_openings"].update(page["account_openings"])
+		ledger["entries"] += page["entries"]
+
+	return ledger
+
+def resume_cursor(filters, cursor):
+	'''`cursor` with the balance up to its key computed from the ledger as it is now, for a
+	cursor that was cached while other entries may have been posted or cancelled'''
+	cursor = frappe._dict(cursor)
+	key_fields = get_key_fields(filters)
+
+	values = filters.copy()
+	values.update(dict(("cursor_{0}".format(i), v) for i, v in enumerate(cursor.key)))
+
+	account_condition = ""
+	if filters.get("group_by_account"):
+		opening = get_opening_balance(filters, [cursor.account])[cursor.account]
+		account_condition = "and account = %(cursor_account)s"
+		values["cursor_account"] = cursor.account
+	else:
+		opening = get_opening_balance(filters)
+
+	balance = frappe.db.sql("""
+		select sum(round(debit, 3) - round(credit, 3)),
+			sum(round(debit_in_account_currency, 3) - round(credit_in_account_currency, 3))
+		from `tabGL Entry`
+		where company=%(company)s and posting_date between %(from_date)s and %(to_date)s
+			and ifnull(is_opening, 'No') = 'No' {conditions} {account_condition} {keyset_condition}""".format(
+			conditions=get_conditions(filters, date_condition=False), account_condition=account_condition,
+			keyset_condition=get_keyset_condition(key_fields, upto=True)), values)
+
+	cursor.balance = opening.balance + flt(balance[0][0])
+	cursor.balance_in_account_currency = opening.balance_in_account_currency + \
+		(flt(balance[0][1]) if filters.get("show_in_account_currency") else 0.0)
+
+	return cursor
+
+def stream_ledger(filters, page_length=500):
+	'''Yield pages of ledger rows until the ledger is exhausted'''
+	cursor = None
+	while True:
+		page = get_ledger_page(filters, cursor, page_length)
+		yield page
+
+		cursor = page["cursor"]
+		if not cursor:
+			break
+
+def get_opening_balance(filters, accounts=None):
+	'''Balance before from date, with opening entries. By account if `accounts` are given'''
+	select_fields = ", sum(debit_in_account_currency) - sum(credit_in_account_currency)" \
+		if filters.get("show_in_account_currency") else ", 0"
+
+	values = filters.copy()
+	account_condition, group_by_condition = "", ""
+	if accounts is not None:
+		openings = dict((account, frappe._dict({"balance": 0.0, "balance_in_account_currency": 0.0}))
+			for account in accounts)
+		if not accounts:
+			return openings
+
+		account_condition = "and account in %(accounts)s"
+		group_by_condition = "group by account"
+		values["accounts"] = tuple(accounts)
+
+	opening = frappe.db.sql("""
+		select account, sum(debit) - sum(credit) {select_fields}
+		from `tabGL Entry`
+		where company=%(company)s and (posting_date < %(from_date)s or is_opening = 'Yes')
+			{conditions} {account_condition}
+		{group_by_condition}""".format(select_fields=select_fields,
+			conditions=get_conditions(filters, date_condition=False),
+			account_condition=account_condition, group_by_condition=group_by_condition), values)
+
+	if accounts is not None:
+		for account, balance, balance_in_account_currency in opening:
+			openings[account] = frappe._dict({"balance": flt(balance),
+				"balance_in_account_currency": flt(balance_in_account_currency)})
+		return openings
+
+	return frappe._dict({
+		"balance": flt(opening[0][1]) if opening else 0.0,
+		"balance_in_account_currency": flt(opening[0][2]) if opening else 0.0
+	})
+
+def get_totals(filters, accounts=None):
+	'''Total debit and credit between from and to date. By account if `accounts` are given'''
+	values = filters.copy()
+	account_condition, group_by_condition = "", ""
+	if accounts is not None:
+		if not accounts:
+			return {}
+
+		account_condition = "and account in %(accounts)s"
+		group_by_condition = "group by account"
+		values["accounts"] = tuple(accounts)
+
+	totals = frappe.db.sql("""
+		select account, sum(debit) as debit, sum(credit) as credit,
+			sum(debit_in_account_currency) as debit_in_account_currency,
+			sum(credit_in_account_currency) as credit_in_account_currency
+		from `tabGL Entry`
+		where company=%(company)s and posting_date between %(from_date)s and %(to_date)s
+			and ifnull(is_opening, 'No') = 'No' {conditions} {account_condition}
+		{group_by_condition}""".format(conditions=get_conditions(filters, date_condition=False),
+			account_condition=account_condition, group_by_condition=group_by_condition), values, as_dict=1)
+
+	for d in totals:
+		for field in ("debit", "credit", "debit_in_account_currency", "credit_in_account_currency"):
+			d[field] = flt(d[field], 3)
+
+	if accounts is not None:
+		return dict((d.account, d) for d in totals)
+
+	return totals[0]
+
+def get_key_fields(filters):
+	'''Columns the ledger is ordered by, unique for each row of the page'''
+	if filters.get("group_by_voucher"):
+		key_fields = ["posting_date", "voucher_type", "voucher_no", "account", "ifnull(cost_center, '')"]
+	else:
+		key_fields = ["posting_date", "name"]
+
+	if filters.get("group_by_account"):
+		key_fields = ["account"] + [f for f in key_fields if f != "account"]
+
+	return key_fields
+
+def get_key(gle, filters):
+	return [gle.get("key_{0}".format(i)) for i in xrange(len(get_key_fields(filters)))]
+
+def get_keyset_condition(key_fields, upto=False):
+	'''Rows after the cursor, `(key fields) > (cursor)` written out so that an index on the first
+	key field is used. Rows up to and including the cursor if `upto`'''
+	conditions = []
+	for i, field in enumerate(key_fields):
+		conditions.append(" and ".join(["{0} = %(cursor_{1})s".format(f, j) for j, f in enumerate(key_fields[:i])]
+			+ ["{0} > %(cursor_{1})s".format(field, i)]))
+
+	return "and {0} {1} %(cursor_0)s and {2}({3})".format(key_fields[0], "<=" if upto else ">=",
+		"not " if upto else "", " or ".join("({0})".format(c) for c in conditions))
+
+def get_ledger_entries(filters, key, limit):
+	key_fields = get_key_fields(filters)
+
+	values = filters.copy()
+	keyset_condition = ""
+	if key:
+		keyset_condition = get_keyset_condition(key_fields)
+		values.update(dict(("cursor_{0}".format(i), v) for i, v in enumerate(key)))
+
+	if filters.get("group_by_voucher"):
+		amount_fields = "sum(debit) as debit, sum(credit) as credit"
+		if filters.get("show_in_account_currency"):
+			amount_fields += """, sum(debit_in_account_currency) as debit_in_account_currency,
+				sum(credit_in_account_currency) as credit_in_account_currency"""
+		group_by_condition = "group by {0}".format(", ".join(key_fields))
+	else:
+		amount_fields = "debit, credit"
+		if filters.get("show_in_account_currency"):
+			amount_fields += ", debit_in_account_currency, credit_in_account_currency"
+		group_by_condition = ""
+
+	return frappe.db.sql("""
+		select
+			{key_fields}, posting_date, account, party_type, party, {amount_fields},
+			voucher_type, voucher_no, cost_center, project, remarks, against
+		from `tabGL Entry`
+		where company=%(company)s and posting_date between %(from_date)s and %(to_date)s
+			and ifnull(is_opening, 'No') = 'No' {conditions} {keyset_condition}
+		{group_by_condition}
+		order by {order_by}
+		limit {limit}""".format(
+			key_fields=", ".join("{0} as key_{1}".format(f, i) for i, f in enumerate(key_fields)),
+			amount_fields=amount_fields, conditions=get_conditions(filters, date_condition=False),
+			keyset_condition=keyset_condition, group_by_condition=group_by_condition,
+			order_by=", ".join(key_fields), limit=cint(limit)), values, as_dict=1)
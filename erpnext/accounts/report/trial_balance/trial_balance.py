@@ -7,6 +7,7 @@ from frappe import _
 from frappe.utils import flt, getdate, formatdate, cstr
 from erpnext.accounts.report.financial_statements \
 	import filter_accounts, set_gl_entries_by_account, filter_out_zero_value_rows
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import can_use_period_balances
 
 value_fields = ("opening_debit", "opening_credit", "debit", "credit", "closing_debit", "closing_credit")
 
@@ -87,22 +88,32 @@ def get_opening_balances(filters):
 
 
 def get_rootwise_opening_balances(filters, report_type):
-	additional_conditions = " and posting_date >= %(year_start_date)s" \
+	if can_use_period_balances(filters.from_date, None) and (report_type != "Profit and Loss"
+		or can_use_period_balances(filters.year_start_date, None)):
+		# monthly balances are enough when the dates are month starts
+		table, date_field = "`tabAccount Period Balance`", "period_start_date"
+		closing_condition = " and is_period_closing = 0"
+	else:
+		table, date_field = "`tabGL Entry`", "posting_date"
+		closing_condition = " and ifnull(voucher_type, '')!='Period Closing Voucher'"
+
+	additional_conditions = " and {0} >= %(year_start_date)s".format(date_field) \
 		if report_type == "Profit and Loss" else ""
 
 	if not flt(filters.with_period_closing_entry):
-		additional_conditions += " and ifnull(voucher_type, '')!='Period Closing Voucher'"
+		additional_conditions += closing_condition
 
 	gle = frappe.db.sql("""
 		select
 			account, sum(debit) as opening_debit, sum(credit) as opening_credit
-		from `tabGL Entry`
+		from {table}
 		where
 			company=%(company)s
 			{additional_conditions}
-			and (posting_date < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
+			and ({date_field} < %(from_date)s or ifnull(is_opening, 'No') = 'Yes')
 			and account in (select name from `tabAccount` where report_type=%(report_type)s)
-		group by account""".format(additional_conditions=additional_conditions),
+		group by account""".format(table=table, date_field=date_field,
+			additional_conditions=additional_conditions),
 		{
 			"company": filters.company,
 			"from_date": filters.from_date,
@@ -4,7 +4,7 @@
 from __future__ import unicode_literals
 
 import frappe
-from frappe.utils import nowdate, cstr, flt, cint, now, getdate
+from frappe.utils import nowdate, cstr, flt, cint, now, getdate, add_days
 from frappe import throw, _
 from frappe.utils import formatdate
 
@@ -12,6 +12,7 @@ from frappe.utils import formatdate
 from erpnext.accounts.doctype.account.account import get_account_currency
 import frappe.defaults
 from erpnext.accounts.report.financial_statements import sort_root_accounts
+from erpnext.utilities.tree_cache import get_descendants_condition
 
 class FiscalYearError(frappe.ValidationError): pass
 
@@ -64,9 +65,8 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 		party = frappe.form_dict.get("party")
 
 	cond = []
-	if date:
-		cond.append("posting_date <= '%s'" % frappe.db.escape(cstr(date)))
-	else:
+	upto_date = date
+	if not date:
 		# get balance of all entries that exist
 		date = nowdate()
 
@@ -82,6 +82,7 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 			# hence, assuming balance as 0.0
 			return 0.0
 
+	is_pl_account = False
 	if account:
 		acc = frappe.get_doc("Account", account)
 
@@ -89,16 +90,11 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 			acc.check_permission("read")
 
 		# for pl accounts, get balance within a fiscal year
-		if acc.report_type == 'Profit and Loss':
-			cond.append("posting_date >= '%s' and voucher_type != 'Period Closing Voucher'" \
-				% year_start_date)
+		is_pl_account = acc.report_type == 'Profit and Loss'
 
 		# different filter for group and ledger - improved performance
 		if acc.is_group:
-			cond.append("""exists (
-				select name from `tabAccount` ac where ac.name = gle.account
-				and ac.lft >= %s and ac.rgt <= %s
-			)""" % (acc.lft, acc.rgt))
+			cond.append(get_descendants_condition("Account", acc.name, "gle.account"))
 
 			# If group and currency same as company,
 			# always return balance based on debit and credit in company currency
@@ -115,17 +111,21 @@ def get_balance_on(account=None, date=None, party_type=None, party=None, company
 		cond.append("""gle.company = "%s" """ % (frappe.db.escape(company, percent=False)))
 
 	if account or (party_type and party):
-		if in_account_currency:
-			select_field = "sum(debit_in_account_currency) - sum(credit_in_account_currency)"
-		else:
-			select_field = "sum(debit) - sum(credit)"
-		bal = frappe.db.sql("""
-			SELECT {0}
-			FROM `tabGL Entry` gle
-			WHERE {1}""".format(select_field, " and ".join(cond)))[0][0]
+		from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint \
+			import get_balance_upto
+
+		# running balance from the latest month end checkpoint plus entries after it
+		key = {"account": account, "company": company}
+		if party_type and party:
+			key.update({"party_type": party_type, "party": party})
+
+		bal = get_balance_upto(key, cond, upto_date, exclude_period_closing=is_pl_account)
+
+		if is_pl_account:
+			opening = get_balance_upto(key, cond, add_days(year_start_date, -1), exclude_period_closing=True)
+			bal = (bal[0] - opening[0], bal[1] - opening[1])
 
-		# if bal is None, return 0
-		return flt(bal)
+		return flt(bal[1] if in_account_currency else bal[0])
 
 @frappe.whitelist()
 def add_ac(args=None):
@@ -328,6 +328,14 @@ def unlink_ref_doc_from_payment_entries(ref_type, ref_no):
 	remove_ref_doc_link_from_jv(ref_type, ref_no)
 	remove_ref_doc_link_from_pe(ref_type, ref_no)
 	
+	from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding import update_outstanding_index
+
+	# move unlinked payments out of the outstanding of the reference document
+	gl_entries = frappe.db.sql("""select * from `tabGL Entry`
+		where against_voucher_type=%s and against_voucher=%s
+		and voucher_no != ifnull(against_voucher, '') for update""", (ref_type, ref_no), as_dict=True)
+	update_outstanding_index(gl_entries, cancel=True)
+
 	frappe.db.sql("""update `tabGL Entry`
 		set against_voucher_type=null, against_voucher=null,
 		modified=%s, modified_by=%s
@@ -335,6 +343,10 @@ def unlink_ref_doc_from_payment_entries(ref_type, ref_no):
 		and voucher_no != ifnull(against_voucher, '')""",
 		(now(), frappe.session.user, ref_type, ref_no))
 
+	for gle in gl_entries:
+		gle.against_voucher_type, gle.against_voucher = None, None
+	update_outstanding_index(gl_entries)
+
 def remove_ref_doc_link_from_jv(ref_type, ref_no):
 	linked_jv = frappe.db.sql_list("""select parent from `tabJournal Entry Account`
 		where reference_type=%s and reference_name=%s and docstatus < 2""", (ref_type, ref_no))
@@ -453,49 +465,15 @@ def get_stock_rbnb_difference(posting_date, company):
 	return flt(stock_rbnb) + flt(sys_bal)
 
 def get_outstanding_invoices(party_type, party, account, condition=None):
+	"""Returns vouchers of the party with an outstanding amount, read from Voucher Outstanding.
+		`condition` may refer to `posting_date`, `invoice_amount` and `payment_amount`"""
+	from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding import get_outstanding_vouchers
+
 	outstanding_invoices = []
 	precision = frappe.get_precision("Sales Invoice", "outstanding_amount")
 
-	if party_type=="Customer":
-		dr_or_cr = "debit_in_account_currency - credit_in_account_currency"
-		payment_dr_or_cr = "payment_gl_entry.credit_in_account_currency - payment_gl_entry.debit_in_account_currency"
-	else:
-		dr_or_cr = "credit_in_account_currency - debit_in_account_currency"
-		payment_dr_or_cr = "payment_gl_entry.debit_in_account_currency - payment_gl_entry.credit_in_account_currency"
-
-	invoice_list = frappe.db.sql("""
-		select
-			voucher_no,	voucher_type, posting_date, ifnull(sum({dr_or_cr}), 0) as invoice_amount,
-			(
-				select ifnull(sum({payment_dr_or_cr}), 0)
-				from `tabGL Entry` payment_gl_entry
-				where payment_gl_entry.against_voucher_type = invoice_gl_entry.voucher_type
-					and payment_gl_entry.against_voucher = invoice_gl_entry.voucher_no
-					and payment_gl_entry.party_type = invoice_gl_entry.party_type
-					and payment_gl_entry.party = invoice_gl_entry.party
-					and payment_gl_entry.account = invoice_gl_entry.account
-					and {payment_dr_or_cr} > 0
-			) as payment_amount
-		from
-			`tabGL Entry` invoice_gl_entry
-		where
-			party_type = %(party_type)s and party = %(party)s 
-			and account = %(account)s and {dr_or_cr} > 0
-			{condition}
-			and ((voucher_type = 'Journal Entry'
-					and (against_voucher = '' or against_voucher is null))
-				or (voucher_type not in ('Journal Entry', 'Payment Entry')))
-		group by voucher_type, voucher_no
-		having (invoice_amount - payment_amount) > 0.005
-		order by posting_date, name""".format(
-			dr_or_cr = dr_or_cr,
-			payment_dr_or_cr = payment_dr_or_cr,
-			condition = condition or ""
-		), {
-			"party_type": party_type,
-			"party": party,
-			"account": account,
-		}, as_dict=True)
+	invoice_list = get_outstanding_vouchers(party_type, party, account, condition)
+	due_dates = get_due_dates(invoice_list)
 
 	for d in invoice_list:
 		outstanding_invoices.append(frappe._dict({
@@ -505,13 +483,30 @@ def get_outstanding_invoices(party_type, party, account, condition=None):
 			'invoice_amount': flt(d.invoice_amount),
 			'payment_amount': flt(d.payment_amount),
 			'outstanding_amount': flt(d.invoice_amount - d.payment_amount, precision),
-			'due_date': frappe.db.get_value(d.voucher_type, d.voucher_no, "due_date"),
+			'due_date': due_dates.get((d.voucher_type, d.voucher_no)),
 		}))
 		
 	outstanding_invoices = sorted(outstanding_invoices, key=lambda k: k['due_date'] or getdate(nowdate()))
 	
 	return outstanding_invoices
 
+def get_due_dates(vouchers):
+	"""Returns {(voucher_type, voucher_no): due_date} with one query per voucher type"""
+	voucher_nos = {}
+	for d in vouchers:
+		voucher_nos.setdefault(d.voucher_type, []).append(d.voucher_no)
+
+	due_dates = {}
+	for voucher_type, names in voucher_nos.items():
+		if not frappe.get_meta(voucher_type).has_field("due_date"):
+			continue
+
+		for name, due_date in frappe.db.sql("""select name, due_date from `tab{0}`
+			where name in ({1})""".format(voucher_type, ", ".join(["%s"] * len(names))), tuple(names)):
+			due_dates[(voucher_type, name)] = due_date
+
+	return due_dates
+
 
 def get_account_name(account_type=None, root_type=None, is_group=None, account_currency=None, company=None):
 	"""return account based on matching conditions"""
@@ -12,6 +12,7 @@ from erpnext.controllers.recurring_document import convert_to_recurring, validat
 from erpnext.controllers.sales_and_purchase_return import validate_return
 from erpnext.accounts.party import get_party_account_currency, validate_party_frozen_disabled
 from erpnext.exceptions import InvalidCurrency
+from erpnext.utilities.precision import get_company_default_currency
 
 force_item_fields = ("item_group", "barcode", "brand", "stock_uom")
 
@@ -589,7 +590,7 @@ def get_taxes_and_charges(master_doctype, master_name):
 def validate_conversion_rate(currency, conversion_rate, conversion_rate_label, company):
 	"""common validation for currency and price list currency"""
 
-	company_currency = frappe.db.get_value("Company", company, "default_currency", cache=True)
+	company_currency = get_company_default_currency(company)
 
 	if not conversion_rate:
 		throw(_("{0} is mandatory. Maybe Currency Exchange record is not created for {1} to {2}.").format(
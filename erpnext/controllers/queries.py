@@ -6,6 +6,7 @@ import frappe
 from frappe.desk.reportview import get_match_cond
 from frappe.model.db_query import DatabaseQuery
 from frappe.utils import nowdate
+from erpnext.utilities.doctype.search_index.search_index import get_search_index_condition
 
 def get_filters_cond(doctype, filters, conditions):
 	if filters:
@@ -95,7 +96,7 @@ def customer_query(doctype, txt, searchfield, start, page_len, filters):
 		where docstatus < 2
 			and ({key} like %(txt)s
 				or customer_name like %(txt)s) and disabled=0
-			{mcond}
+			{scond} {mcond}
 		order by
 			if(locate(%(_txt)s, name), locate(%(_txt)s, name), 99999),
 			if(locate(%(_txt)s, customer_name), locate(%(_txt)s, customer_name), 99999),
@@ -104,6 +105,7 @@ def customer_query(doctype, txt, searchfield, start, page_len, filters):
 		limit %(start)s, %(page_len)s""".format(**{
 			"fields": fields,
 			"key": searchfield,
+			"scond": get_search_index_condition("Customer", txt, searchfield),
 			"mcond": get_match_cond(doctype)
 		}), {
 			'txt': "%%%s%%" % txt,
@@ -125,7 +127,7 @@ def supplier_query(doctype, txt, searchfield, start, page_len, filters):
 		where docstatus < 2
 			and ({key} like %(txt)s
 				or supplier_name like %(txt)s) and disabled=0
-			{mcond}
+			{scond} {mcond}
 		order by
 			if(locate(%(_txt)s, name), locate(%(_txt)s, name), 99999),
 			if(locate(%(_txt)s, supplier_name), locate(%(_txt)s, supplier_name), 99999),
@@ -134,6 +136,7 @@ def supplier_query(doctype, txt, searchfield, start, page_len, filters):
 		limit %(start)s, %(page_len)s """.format(**{
 			'field': fields,
 			'key': searchfield,
+			'scond': get_search_index_condition("Supplier", txt, searchfield),
 			'mcond':get_match_cond(doctype)
 		}), {
 			'txt': "%%%s%%" % txt,
@@ -180,13 +183,14 @@ def item_query(doctype, txt, searchfield, start, page_len, filters, as_dict=Fals
 				or tabItem.item_group LIKE %(txt)s
 				or tabItem.item_name LIKE %(txt)s
 				or tabItem.description LIKE %(txt)s)
-			{fcond} {mcond}
+			{scond} {fcond} {mcond}
 		order by
 			if(locate(%(_txt)s, name), locate(%(_txt)s, name), 99999),
 			if(locate(%(_txt)s, item_name), locate(%(_txt)s, item_name), 99999),
 			idx desc,
 			name, item_name
 		limit %(start)s, %(page_len)s """.format(key=searchfield,
+			scond=get_search_index_condition("Item", txt, searchfield, "tabItem.name"),
 			fcond=get_filters_cond(doctype, filters, conditions).replace('%', '%%'),
 			mcond=get_match_cond(doctype).replace('%', '%%')),
 			{
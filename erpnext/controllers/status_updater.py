@@ -119,19 +119,19 @@ class StatusUpdater(Document):
 				# if target_ref_field is not specified, the programmer does not want to validate qty / amount
 				continue
 
-			# get unique transactions to update
+			# rows fetched while updating qty, else fetch them now
+			target_rows = args.get("target_rows")
+			if target_rows is None:
+				target_rows = self.get_target_rows(args)
+
 			for d in self.get_all_children():
 				if d.doctype == args['source_dt'] and d.get(args["join_field"]):
-					args['name'] = d.get(args['join_field'])
+					item = target_rows.get(d.get(args['join_field']))
 
 					# get all qty where qty > target_field
-					item = frappe.db.sql("""select item_code, `{target_ref_field}`,
-						`{target_field}`, parenttype, parent from `tab{target_dt}`
-						where `{target_ref_field}` < `{target_field}`
-						and name=%s and docstatus=1""".format(**args),
-						args['name'], as_dict=1)
-					if item:
-						item = item[0]
+					if item and item.docstatus == 1 \
+						and item[args['target_ref_field']] < item[args['target_field']]:
+						item = frappe._dict(item)
 						item['idx'] = d.idx
 						item['target_ref_field'] = args['target_ref_field'].replace('_', ' ')
 
@@ -145,6 +145,24 @@ class StatusUpdater(Document):
 						else:
 							self.check_overflow_with_tolerance(item, args)
 
+	def get_target_rows(self, args):
+		"""Returns target rows linked from this document's rows as a dict by name"""
+		detail_ids = self.get_detail_ids(args)
+		if not detail_ids:
+			return {}
+
+		target_rows = frappe.db.sql("""select name, item_code, docstatus, parenttype, parent,
+				`{target_ref_field}`, `{target_field}`
+			from `tab{target_dt}` where name in %(detail_ids)s""".format(**args),
+			{"detail_ids": detail_ids}, as_dict=1)
+
+		return dict((d.name, d) for d in target_rows)
+
+	def get_detail_ids(self, args):
+		"""Unique values of `join_field` in this document's `source_dt` rows"""
+		return tuple(set(d.get(args['join_field']) for d in self.get_all_children()
+			if d.doctype == args['source_dt'] and d.get(args['join_field'])))
+
 	def check_overflow_with_tolerance(self, item, args):
 		"""
 			Checks if there is overflow condering a relaxation tolerance
@@ -182,9 +200,9 @@ class StatusUpdater(Document):
 		for args in self.status_updater:
 			# condition to include current record (if submit or no if cancel)
 			if self.docstatus == 1:
-				args['cond'] = ' or parent="%s"' % self.name.replace('"', '\"')
+				args['cond'] = ' or parent=%(parent)s'
 			else:
-				args['cond'] = ' and parent!="%s"' % self.name.replace('"', '\"')
+				args['cond'] = ' and parent!=%(parent)s'
 
 			self._update_children(args, update_modified)
 
@@ -192,78 +210,115 @@ class StatusUpdater(Document):
 				self._update_percent_field_in_targets(args, update_modified)
 
 	def _update_children(self, args, update_modified):
-		"""Update quantities or amount in child table"""
-		for d in self.get_all_children():
-			if d.doctype != args['source_dt']:
-				continue
+		"""Update quantities or amount in child table
 
-			self._update_modified(args, update_modified)
+			Totals of all target rows are computed in one grouped query and set in one update.
+			The target rows are kept in `args["target_rows"]` for `validate_qty`"""
+		args['target_rows'] = {}
 
-			# updates qty in the child table
-			args['detail_id'] = d.get(args['join_field'])
+		detail_ids = self.get_detail_ids(args)
+		if not detail_ids:
+			return
+
+		self._update_modified(args, update_modified)
 
-			args['second_source_condition'] = ""
-			if args.get('second_source_dt') and args.get('second_source_field') \
-					and args.get('second_join_field'):
-				if not args.get("second_source_extra_cond"):
-					args["second_source_extra_cond"] = ""
+		if not args.get("extra_cond"): args["extra_cond"] = ""
+
+		args['second_source_query'] = ""
+		if args.get('second_source_dt') and args.get('second_source_field') \
+				and args.get('second_join_field'):
+			if not args.get("second_source_extra_cond"):
+				args["second_source_extra_cond"] = ""
+
+			args['second_source_query'] = """union all
+				select `{second_join_field}`, sum({second_source_field})
+				from `tab{second_source_dt}`
+				where `{second_join_field}` in %(detail_ids)s
+				and (`tab{second_source_dt}`.docstatus=1) {second_source_extra_cond}
+				group by `{second_join_field}`""".format(**args)
+
+		args['ref_fields'] = ""
+		if args.get('target_ref_field'):
+			args['ref_fields'] = """, target.item_code, target.docstatus, target.parenttype,
+				target.parent, target.`{target_ref_field}`""".format(**args)
+
+		target_rows = frappe.db.sql("""select target.name, ifnull(source.total, 0) as total {ref_fields}
+			from `tab{target_dt}` target
+			left join (
+				select detail_id, sum(qty) as total from (
+					select `{join_field}` as detail_id, ifnull(sum({source_field}), 0) as qty
+					from `tab{source_dt}`
+					where `{join_field}` in %(detail_ids)s
+					and (docstatus=1 {cond}) {extra_cond}
+					group by `{join_field}`
+					{second_source_query}
+				) source_rows
+				group by detail_id
+			) source on source.detail_id = target.name
+			where target.name in %(detail_ids)s""".format(**args),
+			{"detail_ids": detail_ids, "parent": self.name}, as_dict=1)
+
+		if not target_rows:
+			return
 
-				args['second_source_condition'] = """ + ifnull((select sum(%(second_source_field)s)
-					from `tab%(second_source_dt)s`
-					where `%(second_join_field)s`="%(detail_id)s"
-					and (`tab%(second_source_dt)s`.docstatus=1) %(second_source_extra_cond)s), 0) """ % args
+		values = []
+		for d in target_rows:
+			d[args['target_field']] = d.total
+			values.extend([d.name, d.total])
 
-			if args['detail_id']:
-				if not args.get("extra_cond"): args["extra_cond"] = ""
+		frappe.db.sql("""update `tab{target_dt}`
+			set `{target_field}` = case name {cases} end
+			{update_modified}
+			where name in %s""".format(cases=" ".join(["when %s then %s"] * len(target_rows)), **args),
+			tuple(values) + (detail_ids,))
 
-				frappe.db.sql("""update `tab%(target_dt)s`
-					set %(target_field)s = (
-						(select ifnull(sum(%(source_field)s), 0)
-							from `tab%(source_dt)s` where `%(join_field)s`="%(detail_id)s"
-							and (docstatus=1 %(cond)s) %(extra_cond)s)
-						%(second_source_condition)s
-					)
-					%(update_modified)s
-					where name='%(detail_id)s'""" % args)
+		args['target_rows'] = dict((d.name, d) for d in target_rows)
 
 	def _update_percent_field_in_targets(self, args, update_modified=True):
 		"""Update percent field in parent transaction"""
 		distinct_transactions = set([d.get(args['percent_join_field'])
 			for d in self.get_all_children(args['source_dt'])])
 
-		for name in distinct_transactions:
-			if name:
-				args['name'] = name
-				self._update_percent_field(args, update_modified)
+		self._update_percent_fields(args, [name for name in distinct_transactions if name],
+			update_modified)
 
 	def _update_percent_field(self, args, update_modified=True):
 		"""Update percent field in parent transaction"""
+		self._update_percent_fields(args, [args['name']], update_modified)
+
+	def _update_percent_fields(self, args, names, update_modified=True):
+		"""Update percent and status field of all `names` in one query each"""
+		if not names:
+			return
 
 		self._update_modified(args, update_modified)
+		names = tuple(names)
 
 		if args.get('target_parent_field'):
-			frappe.db.sql("""update `tab%(target_parent_dt)s`
-				set %(target_parent_field)s = round(
-					ifnull((select
-						ifnull(sum(if(%(target_ref_field)s > %(target_field)s, %(target_field)s, %(target_ref_field)s)), 0)
-						/ sum(%(target_ref_field)s) * 100
-					from `tab%(target_dt)s` where parent="%(name)s"), 0), 2)
-					%(update_modified)s
-				where name='%(name)s'""" % args)
+			frappe.db.sql("""update `tab{target_parent_dt}` target_parent
+				left join (
+					select parent, ifnull(sum(if(`{target_ref_field}` > `{target_field}`,
+						`{target_field}`, `{target_ref_field}`)), 0) / sum(`{target_ref_field}`) * 100 as per
+					from `tab{target_dt}` where parent in %(names)s group by parent
+				) target on target.parent = target_parent.name
+				set target_parent.`{target_parent_field}` = round(ifnull(target.per, 0), 2)
+					{update_modified}
+				where target_parent.name in %(names)s""".format(**args), {"names": names})
 
 		# update field
 		if args.get('status_field'):
-			frappe.db.sql("""update `tab%(target_parent_dt)s`
-				set %(status_field)s = if(%(target_parent_field)s<0.001,
-					'Not %(keyword)s', if(%(target_parent_field)s>=99.99,
-					'Fully %(keyword)s', 'Partly %(keyword)s'))
-				where name='%(name)s'""" % args)
+			frappe.db.sql("""update `tab{target_parent_dt}`
+				set `{status_field}` = if(`{target_parent_field}`<0.001,
+					'Not {keyword}', if(`{target_parent_field}`>=99.99,
+					'Fully {keyword}', 'Partly {keyword}'))
+				where name in %(names)s""".format(**args), {"names": names})
 
 		if update_modified:
-			target = frappe.get_doc(args["target_parent_dt"], args["name"])
-			target.set_status(update=True)
-			target.notify_update()
-			notify_status(target)
+			for name in names:
+				target = frappe.get_doc(args["target_parent_dt"], name)
+				target.set_status(update=True)
+				target.notify_update()
+				notify_status(target)
 
 	def _update_modified(self, args, update_modified):
 		args['update_modified'] = ''
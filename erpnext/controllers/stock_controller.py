@@ -7,8 +7,10 @@ from frappe.utils import cint, flt, cstr
 from frappe import msgprint, _
 import frappe.defaults
 from erpnext.accounts.utils import get_fiscal_year
-from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries, process_gl_map
+from erpnext.accounts.general_ledger import make_gl_entries, delete_gl_entries, process_gl_map, \
+	delete_voucher_gl_entries
 from erpnext.controllers.accounts_controller import AccountsController
+from erpnext.stock.utils import repost_future_in_background
 
 class StockController(AccountsController):
 	def make_gl_entries(self, repost_future_gle=True):
@@ -22,7 +24,8 @@ class StockController(AccountsController):
 				gl_entries = self.get_gl_entries(warehouse_account)
 				make_gl_entries(gl_entries)
 
-			if repost_future_gle:
+			# with background reposting, future vouchers are reposted by the queued job
+			if repost_future_gle and not repost_future_in_background():
 				items, warehouses = self.get_items_and_warehouses()
 				update_gl_entries_after(self.posting_date, self.posting_time, warehouses, items,
 					warehouse_account)
@@ -252,8 +255,7 @@ class StockController(AccountsController):
 def update_gl_entries_after(posting_date, posting_time, for_warehouses=None, for_items=None,
 		warehouse_account=None):
 	def _delete_gl_entries(voucher_type, voucher_no):
-		frappe.db.sql("""delete from `tabGL Entry`
-			where voucher_type=%s and voucher_no=%s""", (voucher_type, voucher_no))
+		delete_voucher_gl_entries(voucher_type, voucher_no)
 
 	if not warehouse_account:
 		warehouse_account = get_warehouse_account()
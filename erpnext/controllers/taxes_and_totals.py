@@ -7,6 +7,7 @@ import frappe
 from frappe import _, scrub
 from frappe.utils import cint, flt, round_based_on_smallest_currency_fraction
 from erpnext.setup.utils import get_company_currency
+from erpnext.utilities.precision import get_precision
 from erpnext.controllers.accounts_controller import validate_conversion_rate, \
 	validate_taxes_and_charges, validate_inclusive_tax
 
@@ -57,15 +58,15 @@ class calculate_taxes_and_totals(object):
 					item.rate = 0.0
 				elif not item.rate:
 					item.rate = flt(item.price_list_rate *
-						(1.0 - (item.discount_percentage / 100.0)), item.precision("rate"))
+						(1.0 - (item.discount_percentage / 100.0)), get_precision(item, "rate"))
 
 				if item.doctype in ['Quotation Item', 'Sales Order Item', 'Delivery Note Item', 'Sales Invoice Item']:
 					item.total_margin = self.calculate_margin(item)
-					item.rate = flt(item.total_margin * (1.0 - (item.discount_percentage / 100.0)), item.precision("rate"))\
+					item.rate = flt(item.total_margin * (1.0 - (item.discount_percentage / 100.0)), get_precision(item, "rate"))\
 						if item.total_margin > 0 else item.rate
 
 				item.net_rate = item.rate
-				item.amount = flt(item.rate * item.qty,	item.precision("amount"))
+				item.amount = flt(item.rate * item.qty,	get_precision(item, "amount"))
 				item.net_amount = item.amount
 
 				self._set_in_company_currency(item, ["price_list_rate", "rate", "net_rate", "amount", "net_amount"])
@@ -75,7 +76,7 @@ class calculate_taxes_and_totals(object):
 	def _set_in_company_currency(self, doc, fields):
 		"""set values in base currency"""
 		for f in fields:
-			val = flt(flt(doc.get(f), doc.precision(f)) * self.doc.conversion_rate, doc.precision("base_" + f))
+			val = flt(flt(doc.get(f), get_precision(doc, f)) * self.doc.conversion_rate, get_precision(doc, "base_" + f))
 			doc.set("base_" + f, val)
 
 	def initialize_taxes(self):
@@ -102,59 +103,67 @@ class calculate_taxes_and_totals(object):
 		if not any((cint(tax.included_in_print_rate) for tax in self.doc.get("taxes"))):
 			return
 
+		taxes = self.doc.get("taxes")
+		charge_types = [tax.charge_type for tax in taxes]
+		included = [cint(tax.included_in_print_rate) for tax in taxes]
+		row_ids = [cint(tax.row_id) - 1 for tax in taxes]
+		signs = [(-1.0 if (tax.add_deduct_tax == "Deduct") else 1.0)
+			if getattr(tax, "add_deduct_tax", None) else 1 for tax in taxes]
+
+		# fractions of the current item, per tax row
+		tax_fractions = [tax.tax_fraction_for_current_item for tax in taxes]
+		grand_total_fractions = [tax.grand_total_fraction_for_current_item for tax in taxes]
+
+		tax_rates_cache = {}
 		for item in self.doc.get("items"):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+			tax_rates = self.get_item_tax_rates(item.item_tax_rate, tax_rates_cache)
 			cumulated_tax_fraction = 0
-			for i, tax in enumerate(self.doc.get("taxes")):
-				tax.tax_fraction_for_current_item = self.get_current_tax_fraction(tax, item_tax_map)
+			for i in xrange(len(taxes)):
+				# tax fraction for calculating tax exclusive amount from tax inclusive amount
+				current_tax_fraction = 0
+				if included[i]:
+					if charge_types[i] == "On Net Total":
+						current_tax_fraction = tax_rates[i] / 100.0
+					elif charge_types[i] == "On Previous Row Amount":
+						current_tax_fraction = (tax_rates[i] / 100.0) * tax_fractions[row_ids[i]]
+					elif charge_types[i] == "On Previous Row Total":
+						current_tax_fraction = (tax_rates[i] / 100.0) * grand_total_fractions[row_ids[i]]
+
+				current_tax_fraction *= signs[i]
+				tax_fractions[i] = current_tax_fraction
 
 				if i==0:
-					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
+					grand_total_fractions[i] = 1 + current_tax_fraction
 				else:
-					tax.grand_total_fraction_for_current_item = \
-						self.doc.get("taxes")[i-1].grand_total_fraction_for_current_item \
-						+ tax.tax_fraction_for_current_item
+					grand_total_fractions[i] = grand_total_fractions[i-1] + current_tax_fraction
 
-				cumulated_tax_fraction += tax.tax_fraction_for_current_item
+				cumulated_tax_fraction += current_tax_fraction
 
 			if cumulated_tax_fraction and not self.discount_amount_applied and item.qty:
-				item.net_amount = flt(item.amount / (1 + cumulated_tax_fraction), item.precision("net_amount"))
-				item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate"))
-				item.discount_percentage = flt(item.discount_percentage, item.precision("discount_percentage"))
+				item.net_amount = flt(item.amount / (1 + cumulated_tax_fraction), get_precision(item, "net_amount"))
+				item.net_rate = flt(item.net_amount / item.qty, get_precision(item, "net_rate"))
+				item.discount_percentage = flt(item.discount_percentage, get_precision(item, "discount_percentage"))
 
 				self._set_in_company_currency(item, ["net_rate", "net_amount"])
 
+		for i, tax in enumerate(taxes):
+			tax.tax_fraction_for_current_item = tax_fractions[i]
+			tax.grand_total_fraction_for_current_item = grand_total_fractions[i]
+
 	def _load_item_tax_rate(self, item_tax_rate):
 		return json.loads(item_tax_rate) if item_tax_rate else {}
 
-	def get_current_tax_fraction(self, tax, item_tax_map):
-		"""
-			Get tax fraction for calculating tax exclusive amount
-			from tax inclusive amount
-		"""
-		current_tax_fraction = 0
-
-		if cint(tax.included_in_print_rate):
-			tax_rate = self._get_tax_rate(tax, item_tax_map)
-
-			if tax.charge_type == "On Net Total":
-				current_tax_fraction = tax_rate / 100.0
-
-			elif tax.charge_type == "On Previous Row Amount":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].tax_fraction_for_current_item
-
-			elif tax.charge_type == "On Previous Row Total":
-				current_tax_fraction = (tax_rate / 100.0) * \
-					self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+	def get_item_tax_rates(self, item_tax_rate, cache):
+		"""Rate of each tax row for items with this `item_tax_rate`, parsed once per distinct value"""
+		if item_tax_rate not in cache:
+			item_tax_map = self._load_item_tax_rate(item_tax_rate)
+			cache[item_tax_rate] = [self._get_tax_rate(tax, item_tax_map) for tax in self.doc.get("taxes")]
 
-		if getattr(tax, "add_deduct_tax", None):
-			current_tax_fraction *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
-		return current_tax_fraction
+		return cache[item_tax_rate]
 
 	def _get_tax_rate(self, tax, item_tax_map):
 		if item_tax_map.has_key(tax.account_head):
-			return flt(item_tax_map.get(tax.account_head), self.doc.precision("rate", tax))
+			return flt(item_tax_map.get(tax.account_head), get_precision(self.doc, "rate", tax))
 		else:
 			return tax.rate
 
@@ -170,111 +179,132 @@ class calculate_taxes_and_totals(object):
 		self.doc.round_floats_in(self.doc, ["total", "base_total", "net_total", "base_net_total"])
 
 	def calculate_taxes(self):
-		# maintain actual tax rate based on idx
-		actual_tax_dict = dict([[tax.idx, flt(tax.tax_amount, tax.precision("tax_amount"))]
-			for tax in self.doc.get("taxes") if tax.charge_type == "Actual"])
+		"""Calculate tax amounts item by item, row by row.
 
-		for n, item in enumerate(self.doc.get("items")):
-			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+		Values that only depend on the tax row (charge type, precisions, sign) are looked up once,
+		and amounts of the current item are kept in lists indexed by tax row. The arithmetic and
+		rounding of each step is the same as applying one tax row to one item at a time."""
+		taxes, items = self.doc.get("taxes"), self.doc.get("items")
+		if not (taxes and items):
+			return
+
+		conversion_rate = self.doc.conversion_rate
+		net_total = self.doc.net_total
+		accumulate_tax_amount = not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total")
+
+		charge_types = [tax.charge_type for tax in taxes]
+		row_ids = [cint(tax.row_id) - 1 for tax in taxes]
+		tax_amount_precision = [get_precision(tax, "tax_amount") for tax in taxes]
+		total_precision = [get_precision(tax, "total") for tax in taxes]
+		base_tax_amount_precision = [get_precision(tax, "base_tax_amount") for tax in taxes]
+
+		# taxes for valuation are not added in total, deducted taxes are subtracted
+		total_factors = []
+		for tax in taxes:
+			factor = 1.0
+			if getattr(tax, "category", None):
+				factor = 0.0 if (tax.category == "Valuation") else 1.0
+				factor *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+			total_factors.append(factor)
+
+		# actual tax is distributed on net amount, divisional loss is adjusted in the last item
+		actual_tax_amounts = [flt(tax.tax_amount, get_precision(tax, "tax_amount"))
+			if tax.charge_type == "Actual" else 0.0 for tax in taxes]
+		actual_tax_balance = list(actual_tax_amounts)
+
+		tax_amounts = [tax.tax_amount for tax in taxes]
+		tax_amounts_after_discount_amount = [tax.tax_amount_after_discount_amount for tax in taxes]
+		totals = [tax.total for tax in taxes]
+		item_wise_tax_details = [tax.item_wise_tax_detail for tax in taxes]
+
+		# tax_amount and grand total of the current item, used by 'On Previous Row' taxes
+		tax_amounts_for_current_item = [tax.tax_amount_for_current_item for tax in taxes]
+		grand_totals_for_current_item = [tax.grand_total_for_current_item for tax in taxes]
+
+		tax_rates_cache = {}
+		last_item = len(items) - 1
+		for n, item in enumerate(items):
+			tax_rates = self.get_item_tax_rates(item.item_tax_rate, tax_rates_cache)
+			item_net_amount = item.net_amount
+			key = item.item_code or item.item_name
+
+			for i in xrange(len(taxes)):
+				charge_type, tax_rate = charge_types[i], tax_rates[i]
 
-			for i, tax in enumerate(self.doc.get("taxes")):
 				# tax_amount represents the amount of tax for the current step
-				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
+				current_tax_amount = 0.0
+				if charge_type == "Actual":
+					current_tax_amount = item_net_amount*actual_tax_amounts[i] / net_total if net_total else 0.0
+				elif charge_type == "On Net Total":
+					current_tax_amount = (tax_rate / 100.0) * item_net_amount
+				elif charge_type == "On Previous Row Amount":
+					current_tax_amount = (tax_rate / 100.0) * tax_amounts_for_current_item[row_ids[i]]
+				elif charge_type == "On Previous Row Total":
+					current_tax_amount = (tax_rate / 100.0) * grand_totals_for_current_item[row_ids[i]]
+
+				current_tax_amount = flt(current_tax_amount, tax_amount_precision[i])
+
+				# store tax breakup for each item
+				item_wise_tax_amount = current_tax_amount*conversion_rate
+				if item_wise_tax_details[i].get(key):
+					item_wise_tax_amount += item_wise_tax_details[i][key][1]
+
+				item_wise_tax_details[i][key] = [tax_rate, flt(item_wise_tax_amount, base_tax_amount_precision[i])]
 
 				# Adjust divisional loss to the last item
-				if tax.charge_type == "Actual":
-					actual_tax_dict[tax.idx] -= current_tax_amount
-					if n == len(self.doc.get("items")) - 1:
-						current_tax_amount += actual_tax_dict[tax.idx]
+				if charge_type == "Actual":
+					actual_tax_balance[i] -= current_tax_amount
+					if n == last_item:
+						current_tax_amount += actual_tax_balance[i]
 
 				# accumulate tax amount into tax.tax_amount
-				if tax.charge_type != "Actual" and \
-					not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
-						tax.tax_amount += current_tax_amount
+				elif accumulate_tax_amount:
+					tax_amounts[i] += current_tax_amount
 
-				# store tax_amount for current item as it will be used for
-				# charge type = 'On Previous Row Amount'
-				tax.tax_amount_for_current_item = current_tax_amount
+				tax_amounts_for_current_item[i] = current_tax_amount
 
 				# set tax after discount
-				tax.tax_amount_after_discount_amount += current_tax_amount
+				tax_amounts_after_discount_amount[i] += current_tax_amount
 
-				if getattr(tax, "category", None):
-					# if just for valuation, do not add the tax amount in total
-					# hence, setting it as 0 for further steps
-					current_tax_amount = 0.0 if (tax.category == "Valuation") \
-						else current_tax_amount
-
-					current_tax_amount *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
-
-				# Calculate tax.total viz. grand total till that step
-				# note: grand_total_for_current_item contains the contribution of
-				# item's amount, previously applied tax and the current tax on that item
+				# grand total till this step, with the item's amount and taxes applied so far
 				if i==0:
-					tax.grand_total_for_current_item = flt(item.net_amount + current_tax_amount, tax.precision("total"))
+					grand_total_for_current_item = flt(item_net_amount + current_tax_amount * total_factors[i],
+						total_precision[i])
 				else:
-					tax.grand_total_for_current_item = \
-						flt(self.doc.get("taxes")[i-1].grand_total_for_current_item + current_tax_amount, tax.precision("total"))
-
-				# in tax.total, accumulate grand total of each item
-				tax.total += tax.grand_total_for_current_item
-
-				# set precision in the last item iteration
-				if n == len(self.doc.get("items")) - 1:
-					self.round_off_totals(tax)
-
-					# adjust Discount Amount loss in last tax iteration
-					if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
-						and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
-							self.adjust_discount_amount_loss(tax)
+					grand_total_for_current_item = flt(grand_totals_for_current_item[i-1]
+						+ current_tax_amount * total_factors[i], total_precision[i])
 
+				grand_totals_for_current_item[i] = grand_total_for_current_item
 
+				# in tax.total, accumulate grand total of each item
+				totals[i] += grand_total_for_current_item
 
-	def get_current_tax_amount(self, item, tax, item_tax_map):
-		tax_rate = self._get_tax_rate(tax, item_tax_map)
-		current_tax_amount = 0.0
-
-		if tax.charge_type == "Actual":
-			# distribute the tax amount proportionally to each item row
-			actual = flt(tax.tax_amount, tax.precision("tax_amount"))
-			current_tax_amount = item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
-
-		elif tax.charge_type == "On Net Total":
-			current_tax_amount = (tax_rate / 100.0) * item.net_amount
-		elif tax.charge_type == "On Previous Row Amount":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].tax_amount_for_current_item
-		elif tax.charge_type == "On Previous Row Total":
-			current_tax_amount = (tax_rate / 100.0) * \
-				self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_for_current_item
-
-		current_tax_amount = flt(current_tax_amount, tax.precision("tax_amount"))
-
-		self.set_item_wise_tax(item, tax, tax_rate, current_tax_amount)
-
-		return current_tax_amount
+		for i, tax in enumerate(taxes):
+			tax.tax_amount = tax_amounts[i]
+			tax.tax_amount_after_discount_amount = tax_amounts_after_discount_amount[i]
+			tax.total = totals[i]
+			tax.tax_amount_for_current_item = tax_amounts_for_current_item[i]
+			tax.grand_total_for_current_item = grand_totals_for_current_item[i]
 
-	def set_item_wise_tax(self, item, tax, tax_rate, current_tax_amount):
-		# store tax breakup for each item
-		key = item.item_code or item.item_name
-		item_wise_tax_amount = current_tax_amount*self.doc.conversion_rate
-		if tax.item_wise_tax_detail.get(key):
-			item_wise_tax_amount += tax.item_wise_tax_detail[key][1]
+			self.round_off_totals(tax)
 
-		tax.item_wise_tax_detail[key] = [tax_rate,flt(item_wise_tax_amount, tax.precision("base_tax_amount"))]
+		# adjust Discount Amount loss in last tax
+		if self.discount_amount_applied and self.doc.discount_amount \
+			and self.doc.apply_discount_on == "Grand Total":
+				self.adjust_discount_amount_loss(taxes[-1])
 
 	def round_off_totals(self, tax):
-		tax.total = flt(tax.total, tax.precision("total"))
-		tax.tax_amount = flt(tax.tax_amount, tax.precision("tax_amount"))
-		tax.tax_amount_after_discount_amount = flt(tax.tax_amount_after_discount_amount, tax.precision("tax_amount"))
+		tax.total = flt(tax.total, get_precision(tax, "total"))
+		tax.tax_amount = flt(tax.tax_amount, get_precision(tax, "tax_amount"))
+		tax.tax_amount_after_discount_amount = flt(tax.tax_amount_after_discount_amount, get_precision(tax, "tax_amount"))
 
 		self._set_in_company_currency(tax, ["total", "tax_amount", "tax_amount_after_discount_amount"])
 
 	def adjust_discount_amount_loss(self, tax):
 		discount_amount_loss = self.doc.grand_total - flt(self.doc.discount_amount) - tax.total
 		tax.tax_amount_after_discount_amount = flt(tax.tax_amount_after_discount_amount +
-			discount_amount_loss, tax.precision("tax_amount"))
-		tax.total = flt(tax.total + discount_amount_loss, tax.precision("total"))
+			discount_amount_loss, get_precision(tax, "tax_amount"))
+		tax.total = flt(tax.total + discount_amount_loss, get_precision(tax, "total"))
 
 		self._set_in_company_currency(tax, ["total", "tax_amount_after_discount_amount"])
 
@@ -284,7 +314,7 @@ class calculate_taxes_and_totals(object):
 			last_tax = self.doc.get("taxes")[-1]
 			diff = self.doc.total - flt(last_tax.total, self.doc.precision("grand_total"))
 
-			if diff and abs(diff) <= (2.0 / 10**last_tax.precision("tax_amount")):
+			if diff and abs(diff) <= (2.0 / 10**get_precision(last_tax, "tax_amount")):
 				last_tax.tax_amount += diff
 				last_tax.tax_amount_after_discount_amount += diff
 				last_tax.total += diff
@@ -360,7 +390,7 @@ class calculate_taxes_and_totals(object):
 					distributed_amount = flt(self.doc.discount_amount) * \
 						item.net_amount / total_for_discount_amount
 
-					item.net_amount = flt(item.net_amount - distributed_amount, item.precision("net_amount"))
+					item.net_amount = flt(item.net_amount - distributed_amount, get_precision(item, "net_amount"))
 					net_total += item.net_amount
 
 					# discount amount rounding loss adjustment if no taxes
@@ -369,9 +399,9 @@ class calculate_taxes_and_totals(object):
 							discount_amount_loss = flt(self.doc.total - net_total - self.doc.discount_amount,
 								self.doc.precision("net_total"))
 							item.net_amount = flt(item.net_amount + discount_amount_loss,
-								item.precision("net_amount"))
+								get_precision(item, "net_amount"))
 
-					item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate")) if item.qty else 0
+					item.net_rate = flt(item.net_amount / item.qty, get_precision(item, "net_rate")) if item.qty else 0
 
 					self._set_in_company_currency(item, ["net_rate", "net_amount"])
 
@@ -398,7 +428,7 @@ class calculate_taxes_and_totals(object):
 
 	def calculate_total_advance(self):
 		if self.doc.docstatus < 2:
-			total_allocated_amount = sum([flt(adv.allocated_amount, adv.precision("allocated_amount"))
+			total_allocated_amount = sum([flt(adv.allocated_amount, get_precision(adv, "allocated_amount"))
 				for adv in self.doc.get("advances")])
 
 			self.doc.total_advance = flt(total_allocated_amount, self.doc.precision("total_advance"))
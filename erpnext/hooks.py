@@ -148,6 +148,29 @@ doc_events = {
 	"Address": {
 		"validate": "erpnext.shopping_cart.cart.set_customer_in_address"
 	},
+	("DocType", "Property Setter", "Custom Field", "Currency", "Company", "System Settings",
+		"Global Defaults"): {
+		"on_update": "erpnext.utilities.precision.clear_precision_registry",
+		"on_trash": "erpnext.utilities.precision.clear_precision_registry",
+		"after_rename": "erpnext.utilities.precision.clear_precision_registry"
+	},
+	("Item", "Customer", "Supplier"): {
+		"on_update": "erpnext.utilities.doctype.search_index.search_index.update_search_index",
+		"on_trash": "erpnext.utilities.doctype.search_index.search_index.update_search_index",
+		"after_rename": "erpnext.utilities.doctype.search_index.search_index.update_search_index"
+	},
+	"Item Group": {
+		"after_rename": "erpnext.utilities.doctype.search_index.search_index.update_item_group_in_index"
+	},
+	("Account", "Cost Center", "Customer", "Supplier"): {
+		"after_rename": "erpnext.accounts.general_ledger.rename_in_ledger_summaries"
+	},
+	("Item Group", "Customer Group", "Territory", "Warehouse", "Account", "Cost Center",
+		"Sales Person"): {
+		"on_update": "erpnext.utilities.tree_cache.clear_tree_cache",
+		"on_trash": "erpnext.utilities.tree_cache.clear_tree_cache",
+		"after_rename": "erpnext.utilities.tree_cache.clear_tree_cache"
+	},
 
 	# bubble transaction notification on master
 	('Opportunity', 'Quotation', 'Sales Order', 'Delivery Note', 'Sales Invoice',
@@ -165,8 +188,13 @@ doc_events = {
 }
 
 scheduler_events = {
+	"all": [
+		"erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.repost_entries",
+		"erpnext.stock.doctype.bin.bin.update_item_projected_qty_for_modified_bins"
+	],
 	"hourly": [
-		"erpnext.controllers.recurring_document.create_recurring_documents"
+		"erpnext.controllers.recurring_document.create_recurring_documents",
+		"erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint.build_checkpoints"
 	],
 	"daily": [
 		"erpnext.stock.reorder_item.reorder_item",
@@ -175,7 +203,8 @@ scheduler_events = {
 		"erpnext.accounts.doctype.fiscal_year.fiscal_year.auto_create_fiscal_year",
 		"erpnext.hr.doctype.employee.employee.send_birthday_reminders",
 		"erpnext.projects.doctype.task.task.set_tasks_as_overdue",
-		"erpnext.accounts.doctype.asset.depreciation.post_depreciation_entries"
+		"erpnext.accounts.doctype.asset.depreciation.post_depreciation_entries",
+		"erpnext.manufacturing.doctype.bom.bom_cost.update_bom_costs_daily"
 	]
 }
 
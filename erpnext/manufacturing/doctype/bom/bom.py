@@ -6,8 +6,8 @@ import frappe
 from frappe.utils import cint, cstr, flt
 from frappe import _
 from frappe.model.document import Document
-
-from operator import itemgetter
+from erpnext.manufacturing.doctype.bom.bom_explosion import (BOMGraph, update_exploded_items,
+	get_exploded_item_rows, write_exploded_items)
 
 form_grid_templates = {
 	"items": "templates/form_grid/item_grid.html"
@@ -243,28 +243,18 @@ class BOM(Document):
 						bom_list.append(b[0])
 
 	def update_cost_and_exploded_items(self, bom_list=[]):
-		bom_list = self.traverse_tree(bom_list)
-		for bom in bom_list:
-			bom_obj = frappe.get_doc("BOM", bom)
-			bom_obj.on_update()
+		graph = BOMGraph([self.name])
+		update_exploded_items(graph.order, graph)
 
-		return bom_list
+		return self.traverse_tree(bom_list, graph)
+
+	def traverse_tree(self, bom_list=[], graph=None):
+		"""This BOM and the BOMs of its sub-assemblies, sub-assemblies first"""
+		bom_list = list(bom_list)
+		for bom in (graph or BOMGraph([self.name])).order:
+			if bom not in bom_list:
+				bom_list.append(bom)
 
-	def traverse_tree(self, bom_list=[]):
-		def _get_children(bom_no):
-			return [cstr(d[0]) for d in frappe.db.sql("""select bom_no from `tabBOM Item`
-				where parent = %s and ifnull(bom_no, '') != ''""", bom_no)]
-
-		count = 0
-		if self.name not in bom_list:
-			bom_list.append(self.name)
-
-		while(count < len(bom_list)):
-			for child_bom in _get_children(bom_list[count]):
-				if child_bom not in bom_list:
-					bom_list.append(child_bom)
-			count += 1
-		bom_list.reverse()
 		return bom_list
 
 	def calculate_cost(self):
@@ -305,58 +295,13 @@ class BOM(Document):
 
 	def get_exploded_items(self):
 		""" Get all raw materials including items from child bom"""
-		self.cur_exploded_items = {}
-		for d in self.get('items'):
-			if d.bom_no:
-				self.get_child_exploded_items(d.bom_no, d.qty)
-			else:
-				self.add_to_cur_exploded_items(frappe._dict({
-					'item_code'		: d.item_code,
-					'item_name'		: d.item_name,
-					'description'	: d.description,
-					'image'			: d.image,
-					'stock_uom'		: d.stock_uom,
-					'qty'			: flt(d.qty),
-					'rate'			: flt(d.rate),
-				}))
-
-	def add_to_cur_exploded_items(self, args):
-		if self.cur_exploded_items.get(args.item_code):
-			self.cur_exploded_items[args.item_code]["qty"] += args.qty
-		else:
-			self.cur_exploded_items[args.item_code] = args
-
-	def get_child_exploded_items(self, bom_no, qty):
-		""" Add all items from Flat BOM of child BOM"""
-		# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
-		child_fb_items = frappe.db.sql("""select bom_item.item_code, bom_item.item_name, bom_item.description,
-			bom_item.stock_uom, bom_item.qty, bom_item.rate,
-			bom_item.qty / ifnull(bom.quantity, 1) as qty_consumed_per_unit
-			from `tabBOM Explosion Item` bom_item, tabBOM bom
-			where bom_item.parent = bom.name and bom.name = %s and bom.docstatus = 1""", bom_no, as_dict = 1)
-
-		for d in child_fb_items:
-			self.add_to_cur_exploded_items(frappe._dict({
-				'item_code'				: d['item_code'],
-				'item_name'				: d['item_name'],
-				'description'			: d['description'],
-				'stock_uom'				: d['stock_uom'],
-				'qty'					: d['qty_consumed_per_unit']*qty,
-				'rate'					: flt(d['rate']),
-			}))
+		self.cur_exploded_items = BOMGraph([self.name]).get_exploded_items(self.name)
 
 	def add_exploded_items(self):
 		"Add items to Flat BOM table"
-		frappe.db.sql("""delete from `tabBOM Explosion Item` where parent=%s""", self.name)
-		self.set('exploded_items', [])
-		for d in sorted(self.cur_exploded_items, key=itemgetter(0)):
-			ch = self.append('exploded_items', {})
-			for i in self.cur_exploded_items[d].keys():
-				ch.set(i, self.cur_exploded_items[d][i])
-			ch.amount = flt(ch.qty) * flt(ch.rate)
-			ch.qty_consumed_per_unit = flt(ch.qty) / flt(self.quantity)
-			ch.docstatus = self.docstatus
-			ch.db_insert()
+		rows = get_exploded_item_rows(self.cur_exploded_items, self.quantity, self.docstatus)
+		write_exploded_items({self.name: rows})
+		self.set('exploded_items', rows)
 
 	def validate_bom_links(self):
 		if not self.is_active:
@@ -0,0 +1,200 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Costs of all BOMs updated in one pass over the BOM graph, sub-assemblies first.
+
+Raw material rates are fetched for all items at once, as per the "Rate Of Materials
+Based On" of each BOM. Rows with a sub-assembly are costed at the unit cost of its BOM
+computed in the same pass. Operating costs are kept as they are.
+
+	bench --site site execute erpnext.manufacturing.doctype.bom.bom_cost.update_bom_costs --kwargs "{'dry_run': 1}"
+
+returns the changes without updating anything.'''
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import flt, cint, now
+from erpnext.manufacturing.doctype.bom.bom_explosion import BOMGraph, update_exploded_items
+from erpnext.utilities.precision import (get_field_precision, get_company_default_currency,
+	get_default_currency)
+
+def update_bom_costs(dry_run=False):
+	'''Update rates and amounts of BOM Items, costs of BOMs and their exploded items.
+	Returns the changes as a list of `{bom, item_code, field, old, new}`'''
+	graph = BOMGraph()
+	changes = rollup_costs(graph, get_raw_material_rates(graph))
+
+	if not cint(dry_run):
+		write_costs(graph, changes)
+		update_exploded_items(graph=graph)
+
+	return changes
+
+def update_bom_costs_daily():
+	if cint(frappe.db.get_value("Manufacturing Settings", None, "update_bom_costs_automatically")):
+		update_bom_costs()
+		frappe.db.commit()
+
+def rollup_costs(graph, rates):
+	'''Set new rates and amounts on the items of `graph` and new costs on its BOMs,
+	returns what changed'''
+	changes = []
+
+	def add_change(bom, item_code, field, old, new, precision):
+		if flt(old, precision) != flt(new, precision):
+			changes.append(frappe._dict({"bom": bom.name, "item_code": item_code, "field": field,
+				"old": flt(old, precision), "new": flt(new, precision)}))
+
+	unit_costs = {}
+	for name in graph.order:
+		bom = graph.boms[name]
+		rate_precision, amount_precision, qty_precision, cost_precision = get_precisions(bom.company)
+
+		raw_material_cost = 0
+		for d in bom["items"]:
+			if d.bom_no:
+				rate = unit_costs.get(d.bom_no, 0)
+			else:
+				rate = get_rm_rate(bom, d.item_code, rates) or flt(d.rate)
+
+			amount = flt(rate, rate_precision) * flt(d.qty, qty_precision)
+			add_change(bom, d.item_code, "rate", d.rate, rate, rate_precision)
+			add_change(bom, d.item_code, "amount", d.amount, amount, amount_precision)
+			d.rate, d.amount = rate, amount
+
+			raw_material_cost += amount
+
+		total_cost = flt(bom.operating_cost) + raw_material_cost
+		add_change(bom, None, "raw_material_cost", bom.raw_material_cost, raw_material_cost, cost_precision)
+		add_change(bom, None, "total_cost", bom.total_cost, total_cost, cost_precision)
+		bom.raw_material_cost, bom.total_cost = raw_material_cost, total_cost
+
+		# as per BOM.get_bom_unitcost
+		if cint(bom.is_active) and flt(bom.quantity):
+			unit_costs[name] = total_cost / flt(bom.quantity)
+
+	return changes
+
+def get_precisions(company):
+	'''Precisions of BOM Item rate, amount and qty and of BOM total cost'''
+	currency = company and get_company_default_currency(company) or get_default_currency()
+	return (get_field_precision("BOM Item", "rate", currency),
+		get_field_precision("BOM Item", "amount", currency),
+		get_field_precision("BOM Item", "qty"),
+		get_field_precision("BOM", "total_cost", currency))
+
+def get_rm_rate(bom, item_code, rates):
+	'''Rate of a raw material as per the BOM, as in `BOM.get_rm_rate`'''
+	if bom.rm_cost_as_per == "Valuation Rate":
+		return rates["Valuation Rate"].get(item_code)
+	elif bom.rm_cost_as_per == "Last Purchase Rate":
+		return rates["Last Purchase Rate"].get(item_code)
+	elif bom.rm_cost_as_per == "Price List" and bom.buying_price_list:
+		return rates["Price List"].get((bom.buying_price_list, item_code))
+
+def get_raw_material_rates(graph):
+	'''Rates of all raw materials in `graph`, fetched together for each method'''
+	valuation, last_purchase, price_list = set(), set(), {}
+	for bom in graph.boms.values():
+		for d in bom["items"]:
+			if d.bom_no:
+				continue
+
+			if bom.rm_cost_as_per == "Valuation Rate":
+				valuation.add(d.item_code)
+			elif bom.rm_cost_as_per == "Last Purchase Rate":
+				last_purchase.add(d.item_code)
+			elif bom.rm_cost_as_per == "Price List" and bom.buying_price_list:
+				price_list.setdefault(bom.buying_price_list, set()).add(d.item_code)
+
+	return {
+		"Valuation Rate": get_valuation_rates(list(valuation)),
+		"Last Purchase Rate": get_last_purchase_rates(list(last_purchase)),
+		"Price List": get_price_list_rates(price_list)
+	}
+
+def get_valuation_rates(item_codes, chunk_size=1000):
+	'''Weighted average valuation rate of all warehouses, else the last valuation rate,
+	as in `BOM.get_valuation_rate`'''
+	rates = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		for item_code, actual_qty, stock_value in frappe.db.sql("""select item_code,
+				sum(actual_qty), sum(stock_value)
+			from `tabBin` where item_code in %s group by item_code""",
+			(tuple(item_codes[i:i + chunk_size]),)):
+			if flt(actual_qty):
+				rates[item_code] = flt(stock_value) / flt(actual_qty)
+
+	missing = [item_code for item_code in item_codes if flt(rates.get(item_code)) <= 0]
+	for i in xrange(0, len(missing), chunk_size):
+		last_rates = {}
+		for item_code, valuation_rate in frappe.db.sql("""select sle.item_code, sle.valuation_rate
+			from `tabStock Ledger Entry` sle,
+				(select item_code, max(timestamp(posting_date, posting_time)) as posting_datetime
+					from `tabStock Ledger Entry`
+					where item_code in %s and valuation_rate > 0
+					group by item_code) last_sle
+			where sle.item_code = last_sle.item_code and sle.valuation_rate > 0
+				and timestamp(sle.posting_date, sle.posting_time) = last_sle.posting_datetime
+			order by sle.name desc""", (tuple(missing[i:i + chunk_size]),)):
+			last_rates.setdefault(item_code, flt(valuation_rate))
+
+		rates.update(last_rates)
+
+	return rates
+
+def get_last_purchase_rates(item_codes, chunk_size=1000):
+	rates = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		rates.update(frappe.db.sql("""select name, last_purchase_rate from `tabItem`
+			where name in %s""", (tuple(item_codes[i:i + chunk_size]),)))
+
+	return rates
+
+def get_price_list_rates(items_by_price_list, chunk_size=1000):
+	'''Rates keyed by `(price_list, item_code)`'''
+	rates = {}
+	for price_list, item_codes in items_by_price_list.items():
+		item_codes = list(item_codes)
+		for i in xrange(0, len(item_codes), chunk_size):
+			for item_code, price_list_rate in frappe.db.sql("""select item_code, price_list_rate
+				from `tabItem Price` where price_list = %s and item_code in %s""",
+				(price_list, tuple(item_codes[i:i + chunk_size]))):
+				rates.setdefault((price_list, item_code), flt(price_list_rate))
+
+	return rates
+
+def write_costs(graph, changes, chunk_size=500):
+	'''Write rates and amounts of BOM Items and costs of BOMs that changed'''
+	changed_boms = set([d.bom for d in changes])
+	changed_items = set([(d.bom, d.item_code) for d in changes if d.item_code])
+
+	items = [d for bom in changed_boms for d in graph.boms[bom]["items"]
+		if (bom, d.item_code) in changed_items]
+	for i in xrange(0, len(items), chunk_size):
+		bulk_update("BOM Item", [(d.bom_item, {"rate": d.rate, "amount": d.amount})
+			for d in items[i:i + chunk_size]])
+
+	boms = list(changed_boms)
+	timestamp = now()
+	for i in xrange(0, len(boms), chunk_size):
+		bulk_update("BOM", [(bom, {"raw_material_cost": graph.boms[bom].raw_material_cost,
+			"total_cost": graph.boms[bom].total_cost, "modified": timestamp})
+			for bom in boms[i:i + chunk_size]])
+
+def bulk_update(doctype, rows):
+	'''Set values of many documents in one query, `rows` is a list of `(name, {field: value})`'''
+	if not rows:
+		return
+
+	fields = rows[0][1].keys()
+	names = tuple(name for name, values in rows)
+
+	values = []
+	for field in fields:
+		for name, row_values in rows:
+			values.extend([name, row_values[field]])
+
+	frappe.db.sql("""update `tab{0}` set {1} where name in %s""".format(doctype,
+		", ".join("`{0}` = case name {1} end".format(field, " ".join(["when %s then %s"] * len(rows)))
+			for field in fields)), tuple(values) + (names,))
@@ -0,0 +1,267 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Exploded items (raw materials with sub-assemblies flattened) of BOMs, computed from
+the BOM graph instead of the stored explosion of each sub-assembly BOM.
+
+`BOMGraph` loads BOMs and their items, either all of them in one query or the BOMs
+below a given set, one query per level. Explosions are memoized per BOM, so a
+sub-assembly used by many BOMs is flattened once. `update_exploded_items` writes
+only the explosions that changed, with bulk deletes and inserts.'''
+
+from __future__ import unicode_literals
+import frappe
+from frappe import _
+from frappe.utils import flt, cstr, now
+
+bom_fields = ("quantity", "docstatus", "is_active", "company", "rm_cost_as_per", "buying_price_list",
+	"operating_cost", "raw_material_cost", "total_cost")
+
+explosion_fields = ("item_code", "item_name", "description", "image", "stock_uom", "qty", "rate",
+	"amount", "qty_consumed_per_unit")
+
+class BOMGraph(object):
+	'''BOMs (not cancelled) with their items and the sub-assembly BOMs they use'''
+	def __init__(self, boms=None):
+		self.boms = {}
+		self.parents = {}
+		self._exploded = {}
+
+		if boms is None:
+			self.add_items(get_bom_items())
+		else:
+			self.load_descendants(boms)
+
+		self.order = self.get_topological_order()
+
+	def load_descendants(self, boms):
+		'''Load `boms` and all BOMs below them, one query per level'''
+		loaded, pending = set(), set(boms)
+		while pending:
+			loaded.update(pending)
+			new_boms = self.add_items(get_bom_items(pending))
+			pending = set([d.bom_no for bom in new_boms for d in self.boms[bom]["items"]
+				if d.bom_no and d.bom_no not in loaded])
+
+	def add_items(self, items):
+		'''Add rows from `get_bom_items`, returns the names of the BOMs added'''
+		new_boms = []
+		for d in items:
+			if d.parent not in self.boms:
+				self.boms[d.parent] = frappe._dict(dict([(f, d.get(f)) for f in bom_fields],
+					name=d.parent, items=[]))
+				new_boms.append(d.parent)
+
+			if d.item_code:
+				self.boms[d.parent]["items"].append(d)
+
+		for bom in new_boms:
+			for d in self.boms[bom]["items"]:
+				if d.bom_no:
+					self.parents.setdefault(d.bom_no, set()).add(bom)
+
+		return new_boms
+
+	def get_children(self, bom):
+		'''Loaded sub-assembly BOMs of `bom`'''
+		children = []
+		for d in self.boms[bom]["items"]:
+			if d.bom_no and d.bom_no in self.boms and d.bom_no not in children:
+				children.append(d.bom_no)
+
+		return children
+
+	def get_topological_order(self):
+		'''BOM names with every sub-assembly BOM before the BOMs using it'''
+		order, state = [], {}
+		for root in sorted(self.boms):
+			if root in state:
+				continue
+
+			state[root] = "visiting"
+			stack = [(root, iter(self.get_children(root)))]
+			while stack:
+				bom, children = stack[-1]
+				for child in children:
+					if state.get(child) == "visiting":
+						frappe.throw(_("BOM recursion: {0} cannot be parent or child of {1}").format(child, bom))
+
+					if child not in state:
+						state[child] = "visiting"
+						stack.append((child, iter(self.get_children(child))))
+						break
+				else:
+					stack.pop()
+					state[bom] = "done"
+					order.append(bom)
+
+		return order
+
+	def get_ancestors(self, boms, include_self=True):
+		'''BOMs using any of `boms` at any level'''
+		ancestors = set(boms) if include_self else set()
+		pending = list(boms)
+		while pending:
+			for parent in self.parents.get(pending.pop(), ()):
+				if parent not in ancestors:
+					ancestors.add(parent)
+					pending.append(parent)
+
+		return [bom for bom in self.order if bom in ancestors]
+
+	def get_exploded_items(self, bom):
+		'''Raw materials of `bom` by item code, for the quantity of the BOM.
+		Items of sub-assemblies are included only if their BOM is submitted'''
+		if bom not in self._exploded:
+			exploded = {}
+			for d in self.boms[bom]["items"]:
+				if d.bom_no:
+					child = self.boms.get(d.bom_no)
+					if not child or child.docstatus != 1:
+						continue
+
+					factor = flt(d.qty) / (flt(child.quantity) or 1)
+					for item in self.get_exploded_items(d.bom_no).values():
+						add_exploded_item(exploded, item, item.qty * factor, with_image=False)
+				else:
+					add_exploded_item(exploded, d, flt(d.qty))
+
+			self._exploded[bom] = exploded
+
+		return self._exploded[bom]
+
+	def get_exploded_item_rows(self, bom):
+		bom = self.boms[bom]
+		return get_exploded_item_rows(self.get_exploded_items(bom.name), bom.quantity, bom.docstatus)
+
+def get_bom_items(boms=None):
+	condition = "and bom.name in %(boms)s" if boms else ""
+	return frappe.db.sql("""select bom.name as parent, {0},
+			bom_item.name as bom_item, bom_item.item_code, bom_item.item_name, bom_item.description,
+			bom_item.image, bom_item.stock_uom, bom_item.qty, bom_item.rate, bom_item.amount,
+			bom_item.bom_no
+		from `tabBOM` bom left join `tabBOM Item` bom_item
+			on bom_item.parent = bom.name and bom_item.parenttype = 'BOM'
+		where bom.docstatus < 2 {1}
+		order by bom.name, bom_item.idx""".format(", ".join("bom." + f for f in bom_fields), condition),
+		{"boms": tuple(boms or ())}, as_dict=1)
+
+def add_exploded_item(exploded, item, qty, with_image=True):
+	'''Add `qty` of `item`, the details of the first occurence of an item are kept'''
+	if item.item_code in exploded:
+		exploded[item.item_code].qty += qty
+	else:
+		exploded[item.item_code] = frappe._dict({
+			"item_code": item.item_code,
+			"item_name": item.item_name,
+			"description": item.description,
+			"image": item.image if with_image else None,
+			"stock_uom": item.stock_uom,
+			"qty": qty,
+			"rate": flt(item.rate)
+		})
+
+def get_exploded_item_rows(exploded_items, quantity, docstatus):
+	'''Rows of the BOM Explosion Item table, ordered by item code'''
+	rows = []
+	for item_code in sorted(exploded_items):
+		d = exploded_items[item_code]
+		rows.append(frappe._dict({
+			"idx": len(rows) + 1,
+			"item_code": d.item_code,
+			"item_name": d.item_name,
+			"description": d.description,
+			"image": d.image,
+			"stock_uom": d.stock_uom,
+			"qty": flt(d.qty),
+			"rate": flt(d.rate),
+			"amount": flt(d.qty) * flt(d.rate),
+			"qty_consumed_per_unit": flt(d.qty) / flt(quantity),
+			"docstatus": docstatus
+		}))
+
+	return rows
+
+def update_exploded_items(boms=None, graph=None):
+	'''Recompute the exploded items of `boms` (all BOMs if not set) and write the ones
+	that changed. Returns the names of BOMs that were updated'''
+	if not graph:
+		graph = BOMGraph(boms)
+
+	if boms is None:
+		boms = graph.order
+
+	return write_exploded_items(dict((bom, graph.get_exploded_item_rows(bom))
+		for bom in boms if bom in graph.boms))
+
+def write_exploded_items(rows_by_bom, chunk_size=500):
+	'''Replace the BOM Explosion Item rows of BOMs where they differ from `rows_by_bom`.
+	Rows that are unchanged keep their names, which are set in `rows_by_bom`'''
+	existing = get_existing_rows(rows_by_bom.keys())
+
+	changed = []
+	for bom, rows in rows_by_bom.iteritems():
+		old_rows = existing.get(bom, [])
+		if is_same(rows, old_rows):
+			for row, old_row in zip(rows, old_rows):
+				row.name = old_row.name
+		else:
+			changed.append(bom)
+
+	if not changed:
+		return changed
+
+	for i in xrange(0, len(changed), chunk_size):
+		frappe.db.sql("""delete from `tabBOM Explosion Item` where parent in %s""",
+			(tuple(changed[i:i + chunk_size]),))
+
+	columns = ("name", "creation", "modified", "modified_by", "owner", "docstatus",
+		"parent", "parentfield", "parenttype", "idx") + explosion_fields
+	timestamp, user = now(), frappe.session.user
+
+	values = []
+	for bom in changed:
+		for row in rows_by_bom[bom]:
+			row.update({"name": frappe.generate_hash(length=10), "parent": bom,
+				"parentfield": "exploded_items", "parenttype": "BOM"})
+			values.append([row.name, timestamp, timestamp, user, user, row.docstatus,
+				bom, "exploded_items", "BOM", row.idx] + [row.get(f) for f in explosion_fields])
+
+	for i in xrange(0, len(values), chunk_size):
+		chunk = values[i:i + chunk_size]
+		frappe.db.sql("""insert into `tabBOM Explosion Item` ({0}) values {1}""".format(
+			", ".join("`{0}`".format(c) for c in columns),
+			", ".join(["({0})".format(", ".join(["%s"] * len(columns)))] * len(chunk))),
+			tuple(v for row in chunk for v in row))
+
+	return changed
+
+def get_existing_rows(boms, chunk_size=500):
+	existing = {}
+	boms = list(boms)
+	for i in xrange(0, len(boms), chunk_size):
+		for d in frappe.db.sql("""select name, parent, idx, docstatus, {0}
+			from `tabBOM Explosion Item` where parent in %s
+			order by parent, idx""".format(", ".join(explosion_fields)),
+			(tuple(boms[i:i + chunk_size]),), as_dict=1):
+			existing.setdefault(d.parent, []).append(d)
+
+	return existing
+
+def is_same(rows, old_rows):
+	'''True if `rows` would be stored as `old_rows`'''
+	if len(rows) != len(old_rows):
+		return False
+
+	for row, old_row in zip(rows, old_rows):
+		if row.idx != old_row.idx or row.docstatus != old_row.docstatus:
+			return False
+
+		for f in explosion_fields:
+			if f in ("qty", "rate", "amount", "qty_consumed_per_unit"):
+				if flt(row.get(f), 6) != flt(old_row.get(f), 6):
+					return False
+			elif cstr(row.get(f)) != cstr(old_row.get(f)):
+				return False
+
+	return True
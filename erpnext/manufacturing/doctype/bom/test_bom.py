@@ -5,7 +5,7 @@
 from __future__ import unicode_literals
 import unittest
 import frappe
-from frappe.utils import cstr
+from frappe.utils import cstr, flt
 
 test_records = frappe.get_test_records('BOM')
 
@@ -46,6 +46,52 @@ class TestBOM(unittest.TestCase):
 		bom.save()
 
 		self.assertTrue(_get_default_bom_in_item(), bom.name)
-		
+
+	def test_exploded_items(self):
+		from erpnext.manufacturing.doctype.bom.bom_explosion import BOMGraph, update_exploded_items
+
+		bom = frappe.get_doc("BOM", get_default_bom())
+		expected = {}
+		for d in bom.items:
+			if d.bom_no:
+				child = frappe.get_doc("BOM", d.bom_no)
+				for c in child.items:
+					expected[c.item_code] = expected.get(c.item_code, 0) + c.qty / child.quantity * d.qty
+			else:
+				expected[d.item_code] = expected.get(d.item_code, 0) + d.qty
+
+		exploded = BOMGraph([bom.name]).get_exploded_items(bom.name)
+		self.assertEquals(dict((d.item_code, flt(d.qty, 6)) for d in exploded.values()),
+			dict((item_code, flt(qty, 6)) for item_code, qty in expected.items()))
+
+		self.assertEquals(sorted([(d.item_code, flt(d.qty, 6)) for d in bom.exploded_items]),
+			sorted([(d.item_code, flt(d.qty, 6)) for d in exploded.values()]))
+
+		# unchanged explosions are not rewritten
+		self.assertEquals(update_exploded_items([bom.name]), [])
+
+	def test_update_bom_costs(self):
+		from erpnext.manufacturing.doctype.bom.bom_cost import update_bom_costs
+
+		bom_name = get_default_bom()
+		frappe.db.set_value("BOM", bom_name, "total_cost", 0)
+
+		changes = update_bom_costs(dry_run=True)
+		self.assertTrue([d for d in changes if d.bom == bom_name and d.field == "total_cost"
+			and d.old == 0])
+		self.assertEquals(frappe.db.get_value("BOM", bom_name, "total_cost"), 0)
+
+		update_bom_costs()
+		bom = frappe.get_doc("BOM", bom_name)
+		self.assertEquals(flt(bom.total_cost, 2), flt(flt(bom.operating_cost)
+			+ sum([flt(d.amount) for d in bom.items]), 2))
+
+		for d in bom.items:
+			if d.bom_no:
+				child = frappe.db.get_value("BOM", d.bom_no, ["total_cost", "quantity"])
+				self.assertEquals(flt(d.rate, 2), flt(child[0] / child[1], 2))
+
+		self.assertFalse([d for d in update_bom_costs(dry_run=True) if d.bom == bom_name])
+
 def get_default_bom(item_code="_Test FG Item 2"):
 	return frappe.db.get_value("BOM", {"item": item_code, "is_active": 1, "is_default": 1})
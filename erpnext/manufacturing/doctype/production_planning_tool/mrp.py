@@ -0,0 +1,146 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Material requirements planning for the Production Planning Tool.
+
+Demand is a list of rows `{bom_no, qty, sales_order, date}`. All demanded BOMs are
+exploded together over the BOM graph, giving gross requirements per item, date and
+Sales Order. These are netted against the projected qty of the warehouse, which
+includes open Material Requests as requested qty. Available qty is used up in order
+of date, so the net requirements left are those that fall on the latest dates.'''
+
+from __future__ import unicode_literals
+from itertools import groupby
+import frappe
+from frappe.utils import flt, getdate, nowdate
+from erpnext.manufacturing.doctype.bom.bom_explosion import BOMGraph
+
+def get_gross_requirements(demand, use_multi_level_bom=True):
+	'''Raw materials required for `demand`, as rows `{item_code, date, sales_order, qty,
+	description, stock_uom}` ordered by item code and date. Also returns item details'''
+	graph = BOMGraph(set([d.bom_no for d in demand]))
+
+	per_unit = {}
+	for bom_no in set([d.bom_no for d in demand]):
+		if bom_no in graph.boms:
+			per_unit[bom_no] = get_bom_materials(graph, bom_no, use_multi_level_bom)
+
+	item_details = get_item_details(list(set([item_code for materials in per_unit.values()
+		for item_code in materials])))
+
+	requirements = {}
+	for d in demand:
+		for item_code, m in per_unit.get(d.bom_no, {}).iteritems():
+			item = item_details.get(item_code)
+			if not item or not item.is_stock_item:
+				continue
+
+			if use_multi_level_bom and item.is_sub_contracted_item and item.default_bom:
+				continue
+
+			key = (item_code, getdate(d.date), d.sales_order)
+			if key not in requirements:
+				requirements[key] = frappe._dict({"item_code": item_code, "date": key[1],
+					"sales_order": d.sales_order, "qty": 0.0, "description": m.description,
+					"stock_uom": m.stock_uom})
+
+			requirements[key].qty += m.qty * flt(d.qty)
+
+	return sorted(requirements.values(), key=lambda d: (d.item_code, d.date, d.sales_order)), item_details
+
+def get_bom_materials(graph, bom_no, use_multi_level_bom=True):
+	'''Raw materials per unit of the BOM. Sub-assemblies are flattened if `use_multi_level_bom`'''
+	bom = graph.boms[bom_no]
+	quantity = flt(bom.quantity) or 1
+
+	if use_multi_level_bom:
+		items = graph.get_exploded_items(bom_no).values()
+	else:
+		items = bom["items"]
+
+	materials = {}
+	for d in items:
+		if d.item_code in materials:
+			materials[d.item_code].qty += flt(d.qty) / quantity
+		else:
+			materials[d.item_code] = frappe._dict({"qty": flt(d.qty) / quantity,
+				"description": d.description, "stock_uom": d.stock_uom})
+
+	return materials
+
+def get_net_requirements(requirements, item_details, warehouse=None, net_projected_qty=True):
+	'''Time-phased net requirements as rows `{item_code, warehouse, date, sales_order, qty}`.
+
+	Projected qty in `warehouse` is used up by the requirements in order of date. A
+	negative projected qty is added as a requirement on the first date, and if the net
+	qty of an item is less than its minimum order qty, the difference is added on the
+	first date too. These rows have no Sales Order'''
+	projected_qty = {}
+	if net_projected_qty and warehouse:
+		projected_qty = get_projected_qty(list(set([d.item_code for d in requirements])), warehouse)
+
+	net_requirements = []
+	for item_code, rows in groupby(requirements, key=lambda d: d.item_code):
+		rows = list(rows)
+		available = flt(projected_qty.get(item_code))
+
+		item_rows = []
+		if available < 0:
+			item_rows.append(get_net_row(item_code, warehouse, rows[0].date, None, -available))
+			available = 0
+
+		for d in rows:
+			qty = flt(d.qty)
+			if available > 0:
+				used = min(available, qty)
+				available -= used
+				qty -= used
+
+			if qty > 0:
+				item_rows.append(get_net_row(item_code, warehouse, d.date, d.sales_order, qty))
+
+		total_qty = sum([d.qty for d in item_rows])
+		min_order_qty = flt(item_details[item_code].min_order_qty)
+		if total_qty and total_qty < min_order_qty:
+			item_rows.append(get_net_row(item_code, warehouse, item_rows[0].date, None,
+				min_order_qty - total_qty))
+
+		net_requirements.extend(item_rows)
+
+	return net_requirements
+
+def get_net_row(item_code, warehouse, date, sales_order, qty):
+	return frappe._dict({"item_code": item_code, "warehouse": warehouse, "date": date,
+		"sales_order": sales_order, "qty": qty})
+
+def get_item_details(item_codes, chunk_size=1000):
+	item_details = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		for d in frappe.db.sql("""select name, item_name, description, stock_uom, item_group, brand,
+				min_order_qty, lead_time_days, is_stock_item, is_sub_contracted_item, default_bom
+			from `tabItem` where name in %s""", (tuple(item_codes[i:i + chunk_size]),), as_dict=1):
+			item_details[d.name] = d
+
+	return item_details
+
+def get_projected_qty(item_codes, warehouse, chunk_size=1000):
+	projected_qty = {}
+	for i in xrange(0, len(item_codes), chunk_size):
+		projected_qty.update(frappe.db.sql("""select item_code, sum(projected_qty)
+			from `tabBin` where item_code in %s and warehouse=%s group by item_code""",
+			(tuple(item_codes[i:i + chunk_size]), warehouse)))
+
+	return projected_qty
+
+def get_demand_dates(sales_orders=None, material_request_items=None):
+	'''Delivery dates of Sales Orders and schedule dates of Material Request Items, by name'''
+	dates = {}
+	if sales_orders:
+		dates.update(frappe.db.sql("""select name, delivery_date from `tabSales Order`
+			where name in %s""", (tuple(sales_orders),)))
+
+	if material_request_items:
+		dates.update(frappe.db.sql("""select name, schedule_date from `tabMaterial Request Item`
+			where name in %s""", (tuple(material_request_items),)))
+
+	return dict((name, date or nowdate()) for name, date in dates.items())
@@ -2,20 +2,19 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
+from itertools import groupby
 import frappe
-from frappe.utils import cstr, flt, cint, nowdate, add_days, comma_and
+from frappe.utils import cstr, flt, cint, nowdate, add_days, comma_and, getdate
 
 from frappe import msgprint, _
 
 from frappe.model.document import Document
 from erpnext.manufacturing.doctype.bom.bom import validate_bom_no
 from erpnext.manufacturing.doctype.production_order.production_order import get_item_details
+from erpnext.manufacturing.doctype.production_planning_tool.mrp import (get_gross_requirements,
+	get_net_requirements, get_demand_dates)
 
 class ProductionPlanningTool(Document):
-	def __init__(self, arg1, arg2=None):
-		super(ProductionPlanningTool, self).__init__(arg1, arg2)
-		self.item_dict = {}
-
 	def clear_table(self, table_name):
 		self.set(table_name, [])
 
@@ -285,87 +284,64 @@ class ProductionPlanningTool(Document):
 		except OverProductionError:
 			pass
 
-	def get_so_wise_planned_qty(self):
-		"""
-			bom_dict {
-				bom_no: ['sales_order', 'qty']
-			}
-		"""
-		bom_dict = {}
+	def get_demand(self):
+		"""Planned qty of each BOM with the Sales Order and date it is required for.
+			The date is the planned start date, else the delivery date of the Sales Order or
+			the schedule date of the Material Request Item"""
+		from_material_request = self.get_items_from == "Material Request"
+		dates = get_demand_dates(
+			sales_orders=list(set([d.sales_order for d in self.get("items") if d.sales_order])),
+			material_request_items=list(set([d.material_request_item for d in self.get("items")
+				if d.material_request_item])))
+
+		demand = []
 		for d in self.get("items"):
-			if self.get_items_from == "Material Request":
-				bom_dict.setdefault(d.bom_no, []).append([d.material_request_item, flt(d.planned_qty)])
-			else:
-				bom_dict.setdefault(d.bom_no, []).append([d.sales_order, flt(d.planned_qty)])
-		return bom_dict
+			demand.append(frappe._dict({
+				"bom_no": d.bom_no,
+				"qty": flt(d.planned_qty),
+				"sales_order": None if from_material_request else d.sales_order,
+				"date": d.planned_start_date
+					or dates.get(d.material_request_item if from_material_request else d.sales_order)
+					or nowdate()
+			}))
+
+		return demand
 
 	def download_raw_materials(self):
 		""" Create csv data for required raw material to produce finished goods"""
 		self.validate_data()
-		bom_dict = self.get_so_wise_planned_qty()
-		self.get_raw_materials(bom_dict)
+		self.get_raw_materials()
 		return self.get_csv()
 
-	def get_raw_materials(self, bom_dict):
-		""" Get raw materials considering sub-assembly items
-			{
-				"item_code": [qty_required, description, stock_uom, min_order_qty]
-			}
+	def get_raw_materials(self):
+		""" Get raw materials considering sub-assembly items, as rows
+			{item_code, date, sales_order, qty, description, stock_uom}
 		"""
-		item_list = []
-
-		for bom, so_wise_qty in bom_dict.items():
-			bom_wise_item_details = {}
-			if self.use_multi_level_bom:
-				# get all raw materials with sub assembly childs
-				# Did not use qty_consumed_per_unit in the query, as it leads to rounding loss
-				for d in frappe.db.sql("""select fb.item_code,
-					ifnull(sum(fb.qty/ifnull(bom.quantity, 1)), 0) as qty,
-					fb.description, fb.stock_uom, item.min_order_qty
-					from `tabBOM Explosion Item` fb, `tabBOM` bom, `tabItem` item
-					where bom.name = fb.parent and item.name = fb.item_code
-					and (item.is_sub_contracted_item = 0 or ifnull(item.default_bom, "")="")
-					and item.is_stock_item = 1
-					and fb.docstatus<2 and bom.name=%s
-					group by fb.item_code, fb.stock_uom""", bom, as_dict=1):
-						bom_wise_item_details.setdefault(d.item_code, d)
-			else:
-				# Get all raw materials considering SA items as raw materials,
-				# so no childs of SA items
-				for d in frappe.db.sql("""select bom_item.item_code,
-					ifnull(sum(bom_item.qty/ifnull(bom.quantity, 1)), 0) as qty,
-					bom_item.description, bom_item.stock_uom, item.min_order_qty
-					from `tabBOM Item` bom_item, `tabBOM` bom, tabItem item
-					where bom.name = bom_item.parent and bom.name = %s and bom_item.docstatus < 2
-					and bom_item.item_code = item.name
-					and item.is_stock_item = 1
-					group by bom_item.item_code""", bom, as_dict=1):
-						bom_wise_item_details.setdefault(d.item_code, d)
-			for item, item_details in bom_wise_item_details.items():
-				for so_qty in so_wise_qty:
-					item_list.append([item, flt(item_details.qty) * so_qty[1], item_details.description,
-						item_details.stock_uom, item_details.min_order_qty, so_qty[0]])
-
-		self.make_items_dict(item_list)
-
-	def make_items_dict(self, item_list):
-		for i in item_list:
-			self.item_dict.setdefault(i[0], []).append([flt(i[1]), i[2], i[3], i[4], i[5]])
+		self.requirements, self.item_details = get_gross_requirements(self.get_demand(),
+			cint(self.use_multi_level_bom))
 
 	def get_csv(self):
 		item_list = [['Item Code', 'Description', 'Stock UOM', 'Required Qty', 'Warehouse',
 		 	'Quantity Requested for Purchase', 'Ordered Qty', 'Actual Qty']]
-		for item in self.item_dict:
-			total_qty = sum([flt(d[0]) for d in self.item_dict[item]])
-			item_list.append([item, self.item_dict[item][0][1], self.item_dict[item][0][2], total_qty])
-			item_qty = frappe.db.sql("""select warehouse, indented_qty, ordered_qty, actual_qty
-				from `tabBin` where item_code = %s""", item, as_dict=1)
+
+		bins = {}
+		if self.requirements:
+			for w in frappe.db.sql("""select item_code, warehouse, indented_qty, ordered_qty, actual_qty
+				from `tabBin` where item_code in %s order by item_code, warehouse""",
+				(tuple(set([d.item_code for d in self.requirements])),), as_dict=1):
+				bins.setdefault(w.item_code, []).append(w)
+
+		for item, rows in groupby(self.requirements, key=lambda d: d.item_code):
+			rows = list(rows)
+			total_qty = sum([flt(d.qty) for d in rows])
+			item_list.append([item, rows[0].description, rows[0].stock_uom, total_qty])
+
 			i_qty, o_qty, a_qty = 0, 0, 0
-			for w in item_qty:
+			for w in bins.get(item, []):
 				i_qty, o_qty, a_qty = i_qty + flt(w.indented_qty), o_qty + flt(w.ordered_qty), a_qty + flt(w.actual_qty)
 				item_list.append(['', '', '', '', w.warehouse, flt(w.indented_qty),
 					flt(w.ordered_qty), flt(w.actual_qty)])
-			if item_qty:
+			if bins.get(item):
 				item_list.append(['', '', '', '', 'Total', i_qty, o_qty, a_qty])
 
 		return item_list
@@ -379,71 +355,25 @@ class ProductionPlanningTool(Document):
 		if not self.purchase_request_for_warehouse:
 			frappe.throw(_("Please enter Warehouse for which Material Request will be raised"))
 
-		bom_dict = self.get_so_wise_planned_qty()
-		self.get_raw_materials(bom_dict)
+		self.get_raw_materials()
 
-		if self.item_dict:
+		if self.requirements:
 			self.create_material_request()
 
 	def get_requested_items(self):
-		items_to_be_requested = frappe._dict()
-
-		if not self.create_material_requests_for_all_required_qty:
-			item_projected_qty = self.get_projected_qty()			
-
-		for item, so_item_qty in self.item_dict.items():
-			total_qty = sum([flt(d[0]) for d in so_item_qty])
-			requested_qty = 0
-			
-			if self.create_material_requests_for_all_required_qty:
-				requested_qty = total_qty
-			elif total_qty > item_projected_qty.get(item, 0):
-				# shortage
-				requested_qty = total_qty - flt(item_projected_qty.get(item))
-				# consider minimum order qty
-
-			if requested_qty and requested_qty < flt(so_item_qty[0][3]):
-				requested_qty = flt(so_item_qty[0][3])
-
-			# distribute requested qty SO wise
-			for item_details in so_item_qty:
-				if requested_qty:
-					sales_order = item_details[4] or "No Sales Order"
-					if self.get_items_from == "Material Request":
-						sales_order = "No Sales Order"
-					if requested_qty <= item_details[0]:
-						adjusted_qty = requested_qty
-					else:
-						adjusted_qty = item_details[0]
-
-					items_to_be_requested.setdefault(item, {}).setdefault(sales_order, 0)
-					items_to_be_requested[item][sales_order] += adjusted_qty
-					requested_qty -= adjusted_qty
-				else:
-					break
-
-			# requested qty >= total so qty, due to minimum order qty
-			if requested_qty:
-				items_to_be_requested.setdefault(item, {}).setdefault("No Sales Order", 0)
-				items_to_be_requested[item]["No Sales Order"] += requested_qty
-
-		return items_to_be_requested
-
-	def get_projected_qty(self):
-		items = self.item_dict.keys()
-		item_projected_qty = frappe.db.sql("""select item_code, sum(projected_qty)
-			from `tabBin` where item_code in (%s) and warehouse=%s group by item_code""" %
-			(", ".join(["%s"]*len(items)), '%s'), tuple(items + [self.purchase_request_for_warehouse]))
-
-		return dict(item_projected_qty)
+		"""Time-phased net requirements in the warehouse for Material Requests, as rows
+			{item_code, warehouse, date, sales_order, qty}"""
+		return get_net_requirements(self.requirements, self.item_details,
+			self.purchase_request_for_warehouse,
+			net_projected_qty=not self.create_material_requests_for_all_required_qty)
 
 	def create_material_request(self):
 		items_to_be_requested = self.get_requested_items()
 
 		material_request_list = []
 		if items_to_be_requested:
-			for item in items_to_be_requested:
-				item_wrapper = frappe.get_doc("Item", item)
+			for item, rows in groupby(items_to_be_requested, key=lambda d: d.item_code):
+				item_details = self.item_details[item]
 				material_request = frappe.new_doc("Material Request")
 				material_request.update({
 					"transaction_date": nowdate(),
@@ -451,24 +381,27 @@ class ProductionPlanningTool(Document):
 					"company": self.company,
 					"requested_by": frappe.session.user
 				})
-				if item_wrapper.default_bom:
+				if item_details.default_bom:
 					material_request.update({"material_request_type": "Manufacture"}) 
 				else:
 					material_request.update({"material_request_type": "Purchase"})
-				for sales_order, requested_qty in items_to_be_requested[item].items():
+
+				# not before the lead time of the item
+				earliest_date = getdate(add_days(nowdate(), cint(item_details.lead_time_days)))
+				for d in rows:
 					material_request.append("items", {
 						"doctype": "Material Request Item",
 						"__islocal": 1,
 						"item_code": item,
-						"item_name": item_wrapper.item_name,
-						"description": item_wrapper.description,
-						"uom": item_wrapper.stock_uom,
-						"item_group": item_wrapper.item_group,
-						"brand": item_wrapper.brand,
-						"qty": requested_qty,
-						"schedule_date": add_days(nowdate(), cint(item_wrapper.lead_time_days)),
+						"item_name": item_details.item_name,
+						"description": item_details.description,
+						"uom": item_details.stock_uom,
+						"item_group": item_details.item_group,
+						"brand": item_details.brand,
+						"qty": d.qty,
+						"schedule_date": max(getdate(d.date), earliest_date),
 						"warehouse": self.purchase_request_for_warehouse,
-						"sales_order": sales_order if sales_order!="No Sales Order" else None
+						"sales_order": d.sales_order
 					})
 
 				material_request.flags.ignore_permissions = 1
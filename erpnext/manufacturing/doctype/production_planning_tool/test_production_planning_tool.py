@@ -0,0 +1,57 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import unittest
+import frappe
+from frappe.utils import flt, add_days, nowdate, getdate
+from erpnext.stock.utils import get_bin
+from erpnext.manufacturing.doctype.production_planning_tool.mrp import (get_gross_requirements,
+	get_net_requirements)
+
+test_dependencies = ["BOM"]
+
+class TestProductionPlanningTool(unittest.TestCase):
+	def get_requirements(self, qty=10):
+		bom_no = frappe.db.get_value("BOM", {"item": "_Test FG Item 2", "is_active": 1, "is_default": 1})
+		demand = [
+			frappe._dict({"bom_no": bom_no, "qty": qty, "sales_order": "SO-1", "date": add_days(nowdate(), 10)}),
+			frappe._dict({"bom_no": bom_no, "qty": qty, "sales_order": "SO-2", "date": add_days(nowdate(), 20)})
+		]
+		return bom_no, get_gross_requirements(demand)
+
+	def test_gross_requirements(self):
+		bom_no, (requirements, item_details) = self.get_requirements()
+
+		exploded = dict(frappe.db.sql("""select item_code, qty from `tabBOM Explosion Item`
+			where parent=%s""", bom_no))
+		for d in requirements:
+			self.assertEquals(flt(d.qty, 4), flt(exploded[d.item_code] * 10, 4))
+
+		self.assertEquals(sorted(set([d.sales_order for d in requirements])), ["SO-1", "SO-2"])
+
+	def test_net_requirements(self):
+		bom_no, (requirements, item_details) = self.get_requirements()
+		warehouse = "_Test Warehouse - _TC"
+		item_code = requirements[0].item_code
+		rows = [d for d in requirements if d.item_code == item_code]
+
+		# projected qty covers the first requirement
+		bin = get_bin(item_code, warehouse)
+		projected_qty = flt(bin.projected_qty)
+		item_details[item_code].min_order_qty = 0
+		frappe.db.set_value("Bin", bin.name, "projected_qty", rows[0].qty)
+
+		net = [d for d in get_net_requirements(requirements, item_details, warehouse)
+			if d.item_code == item_code]
+		self.assertEquals([(getdate(d.date), d.sales_order, flt(d.qty, 4)) for d in net],
+			[(getdate(rows[1].date), "SO-2", flt(rows[1].qty, 4))])
+
+		# minimum order qty is added on the first date, without a Sales Order
+		item_details[item_code].min_order_qty = rows[1].qty + 5
+		net = [d for d in get_net_requirements(requirements, item_details, warehouse)
+			if d.item_code == item_code]
+		self.assertEquals(flt(sum([d.qty for d in net]), 4), flt(rows[1].qty + 5, 4))
+		self.assertEquals(net[-1].sales_order, None)
+
+		frappe.db.set_value("Bin", bin.name, "projected_qty", projected_qty)
@@ -0,0 +1,8 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.utilities.doctype.search_index.search_index import rebuild_search_index
+
+def execute():
+	frappe.reload_doc("utilities", "doctype", "search_index")
+	frappe.get_doc("DocType", "Search Index").run_module_method("on_doctype_update")
+	rebuild_search_index()
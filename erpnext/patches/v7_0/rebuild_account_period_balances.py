@@ -0,0 +1,8 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.account_period_balance.account_period_balance import rebuild_period_balances
+
+def execute():
+	frappe.reload_doc("accounts", "doctype", "account_period_balance")
+	frappe.get_doc("DocType", "Account Period Balance").run_module_method("on_doctype_update")
+	rebuild_period_balances()
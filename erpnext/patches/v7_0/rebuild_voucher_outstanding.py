@@ -0,0 +1,8 @@
+from __future__ import unicode_literals
+import frappe
+from erpnext.accounts.doctype.voucher_outstanding.voucher_outstanding import rebuild_outstanding_index
+
+def execute():
+	frappe.reload_doc("accounts", "doctype", "voucher_outstanding")
+	frappe.get_doc("DocType", "Voucher Outstanding").run_module_method("on_doctype_update")
+	rebuild_outstanding_index()
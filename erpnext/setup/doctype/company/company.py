@@ -272,5 +272,5 @@ def get_name_with_abbr(name, company):
 	return " - ".join(parts)
 
 def get_company_currency(company):
-	return frappe.local_cache("company_currency", company,
-		lambda: frappe.db.get_value("Company", company, "default_currency"))
+	from erpnext.utilities.precision import get_company_default_currency
+	return get_company_default_currency(company)
@@ -7,6 +7,7 @@ import frappe
 from frappe.utils import cint
 from frappe import _
 from frappe.desk.notifications import clear_notifications
+from erpnext.accounts.doctype.account_balance_checkpoint.account_balance_checkpoint import clear_checkpoints
 
 @frappe.whitelist()
 def delete_company_transactions(company_name):
@@ -28,6 +29,13 @@ def delete_company_transactions(company_name):
 			"Purchase Taxes and Charges Template", "POS Profile", 'BOM'):
 				delete_for_doctype(doctype, company_name)
 
+	# outstanding vouchers are kept per account, not per company
+	frappe.db.sql("""delete from `tabVoucher Outstanding`
+		where account in (select name from `tabAccount` where company=%s)""", company_name)
+
+	# balance checkpoints are mostly kept without a company
+	clear_checkpoints(company_name)
+
 	# Clear notification counts
 	clear_notifications()
 
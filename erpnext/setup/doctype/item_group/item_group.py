@@ -4,11 +4,13 @@
 from __future__ import unicode_literals
 import frappe
 import urllib
+from frappe import _
 from frappe.utils import nowdate, cint, cstr
 from frappe.utils.nestedset import NestedSet
 from frappe.website.website_generator import WebsiteGenerator
 from frappe.website.render import clear_cache
 from frappe.website.doctype.website_slideshow.website_slideshow import get_slideshow
+from erpnext.utilities.tree_cache import clear_tree_cache, get_ancestors, get_descendants
 
 
 class ItemGroup(NestedSet, WebsiteGenerator):
@@ -29,6 +31,9 @@ class ItemGroup(NestedSet, WebsiteGenerator):
 	def on_update(self):
 		NestedSet.on_update(self)
 		WebsiteGenerator.on_update(self)
+
+		# tree has changed, before parent groups are looked up
+		clear_tree_cache(self)
 		invalidate_cache_for(self)
 		self.validate_name_with_item()
 		self.validate_one_root()
@@ -106,10 +111,13 @@ def get_product_list_for_group(product_group=None, start=0, limit=10, search=Non
 	return [get_item_for_list_in_html(r) for r in data]
 
 def get_child_groups(item_group_name):
-	item_group = frappe.get_doc("Item Group", item_group_name)
+	child_groups = get_descendants("Item Group", item_group_name)
+	if not child_groups:
+		frappe.throw(_("Item Group {0} not found").format(item_group_name), frappe.DoesNotExistError)
+
 	return frappe.db.sql("""select name
-		from `tabItem Group` where lft>=%(lft)s and rgt<=%(rgt)s
-			and show_in_website = 1""", {"lft": item_group.lft, "rgt": item_group.rgt})
+		from `tabItem Group` where name in %s
+			and show_in_website = 1""", (tuple(child_groups),))
 
 def get_item_for_list_in_html(context):
 	# add missing absolute link in files
@@ -133,11 +141,14 @@ def get_group_item_count(item_group):
 
 
 def get_parent_item_groups(item_group_name):
-	item_group = frappe.get_doc("Item Group", item_group_name)
+	parent_groups = get_ancestors("Item Group", item_group_name, include_self=True)
+	if not parent_groups:
+		frappe.throw(_("Item Group {0} not found").format(item_group_name), frappe.DoesNotExistError)
+
 	return frappe.db.sql("""select name, route from `tabItem Group`
-		where lft <= %s and rgt >= %s
+		where name in %s
 		and show_in_website=1
-		order by lft asc""", (item_group.lft, item_group.rgt), as_dict=True)
+		order by lft asc""", (tuple(parent_groups),), as_dict=True)
 
 def invalidate_cache_for(doc, item_group=None):
 	if not item_group:
@@ -5,9 +5,11 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _, throw
 from frappe.utils import flt
+from erpnext.utilities.precision import get_company_default_currency
+from erpnext.utilities.tree_cache import get_root, get_ancestors
 
 def get_company_currency(company):
-	currency = frappe.db.get_value("Company", company, "default_currency", cache=True)
+	currency = get_company_default_currency(company)
 	if not currency:
 		currency = frappe.db.get_default("currency")
 	if not currency:
@@ -17,17 +19,11 @@ def get_company_currency(company):
 
 def get_root_of(doctype):
 	"""Get root element of a DocType with a tree structure"""
-	result = frappe.db.sql_list("""select name from `tab%s`
-		where lft=1 and rgt=(select max(rgt) from `tab%s` where docstatus < 2)""" %
-		(doctype, doctype))
-	return result[0] if result else None
+	return get_root(doctype)
 
 def get_ancestors_of(doctype, name):
 	"""Get ancestor elements of a DocType with a tree structure"""
-	lft, rgt = frappe.db.get_value(doctype, name, ["lft", "rgt"])
-	result = frappe.db.sql_list("""select name from `tab%s`
-		where lft<%s and rgt>%s order by lft desc""" % (doctype, "%s", "%s"), (lft, rgt))
-	return result or []
+	return get_ancestors(doctype, name)
 
 def before_tests():
 	frappe.clear_cache()
@@ -60,6 +56,7 @@ def before_tests():
 	frappe.db.sql("delete from `tabItem Price`")
 
 	frappe.db.set_value("Stock Settings", None, "auto_insert_price_list_rate_if_missing", 0)
+	frappe.db.set_value("Stock Settings", None, "repost_future_entries_in_background", 0)
 
 	frappe.db.commit()
 
@@ -8,7 +8,7 @@ import frappe.defaults
 from frappe.utils import cint, flt, get_fullname, cstr
 from erpnext.utilities.doctype.address.address import get_address_display
 from erpnext.shopping_cart.doctype.shopping_cart_settings.shopping_cart_settings import get_shopping_cart_settings
-from frappe.utils.nestedset import get_root_of
+from erpnext.utilities.tree_cache import get_root, get_tree
 from erpnext.accounts.utils import get_account_name
 
 class WebsitePriceListMissingError(frappe.ValidationError): pass
@@ -145,12 +145,12 @@ def update_cart_address(address_fieldname, address_name):
 def guess_territory():
 	territory = None
 	geoip_country = frappe.session.get("session_country")
-	if geoip_country:
-		territory = frappe.db.get_value("Territory", geoip_country)
+	if geoip_country and get_tree("Territory").exists(geoip_country):
+		territory = geoip_country
 
 	return territory or \
 		frappe.db.get_value("Shopping Cart Settings", None, "territory") or \
-			get_root_of("Territory")
+			get_root("Territory")
 
 def decorate_quotation_doc(doc):
 	for d in doc.get("items", []):
@@ -315,7 +315,7 @@ def get_party(user=None):
 			"customer_name": fullname,
 			"customer_type": "Individual",
 			"customer_group": get_shopping_cart_settings().default_customer_group,
-			"territory": get_root_of("Territory")
+			"territory": get_root("Territory")
 		})
 
 		if debtors_account:
@@ -4,9 +4,11 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import _
-from frappe.utils import flt, nowdate
+from datetime import timedelta
+from frappe.utils import flt, cint, nowdate, now_datetime, get_datetime, get_datetime_str
 import frappe.defaults
 from frappe.model.document import Document
+from erpnext.utilities import long_job_timeout
 
 class Bin(Document):
 	def validate(self):
@@ -35,6 +37,7 @@ class Bin(Document):
 
 		if args.get("actual_qty") or args.get("voucher_type") == "Stock Reconciliation":
 			from erpnext.stock.stock_ledger import update_entries_after
+			from erpnext.stock.utils import repost_future_in_background
 
 			if not args.get("posting_date"):
 				args["posting_date"] = nowdate()
@@ -48,33 +51,54 @@ class Bin(Document):
 				"posting_date": args.get("posting_date"),
 				"posting_time": args.get("posting_time"),
 				"voucher_no": args.get("voucher_no")
-			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher)
+			}, allow_negative_stock=allow_negative_stock, via_landed_cost_voucher=via_landed_cost_voucher,
+				bulk_update=True, defer_future_repost=repost_future_in_background())
 
 	def update_qty(self, args):
+		"""Add the quantities in `args` to the Bin with a single atomic update,
+			without saving the document. `Item.total_projected_qty` is updated later by
+			`update_item_projected_qty_for_modified_bins`"""
+		# validate is skipped by the update
+		self.block_transactions_against_group_warehouse()
+
+		values = {"name": self.name, "user": frappe.session.user}
+
 		# update the stock values (for current quantities)
 		if args.get("voucher_type")=="Stock Reconciliation":
 			if args.get('is_cancelled') == 'No':
-				self.actual_qty = args.get("qty_after_transaction")
+				values["actual_qty"] = flt(args.get("qty_after_transaction"))
 			else:
-				qty_after_transaction = frappe.db.get_value("""select qty_after_transaction
+				qty_after_transaction = frappe.db.sql("""select qty_after_transaction
 					from `tabStock Ledger Entry`
 					where item_code=%s and warehouse=%s
 					and not (voucher_type='Stock Reconciliation' and voucher_no=%s)
 					order by posting_date desc limit 1""",
 					(self.item_code, self.warehouse, args.get('voucher_no')))
 
-				self.actual_qty = flt(qty_after_transaction[0][0]) if qty_after_transaction else 0.0
-		else:
-			self.actual_qty = flt(self.actual_qty) + flt(args.get("actual_qty"))
-
-		self.ordered_qty = flt(self.ordered_qty) + flt(args.get("ordered_qty"))
-		self.reserved_qty = flt(self.reserved_qty) + flt(args.get("reserved_qty"))
-		self.indented_qty = flt(self.indented_qty) + flt(args.get("indented_qty"))
-		self.planned_qty = flt(self.planned_qty) + flt(args.get("planned_qty"))
+				values["actual_qty"] = flt(qty_after_transaction[0][0]) if qty_after_transaction else 0.0
 
-		self.set_projected_qty()
-		self.save()
-		update_item_projected_qty(self.item_code)
+			actual_qty = "%(actual_qty)s"
+		else:
+			values["actual_qty"] = flt(args.get("actual_qty"))
+			actual_qty = "ifnull(actual_qty, 0) + %(actual_qty)s"
+
+		for field in ("ordered_qty", "reserved_qty", "indented_qty", "planned_qty"):
+			values[field] = flt(args.get(field))
+
+		# assignments are applied left to right, projected_qty sees the new quantities
+		frappe.db.sql("""update `tabBin`
+			set actual_qty = {actual_qty},
+				ordered_qty = ifnull(ordered_qty, 0) + %(ordered_qty)s,
+				reserved_qty = ifnull(reserved_qty, 0) + %(reserved_qty)s,
+				indented_qty = ifnull(indented_qty, 0) + %(indented_qty)s,
+				planned_qty = ifnull(planned_qty, 0) + %(planned_qty)s,
+				projected_qty = actual_qty + ordered_qty + indented_qty + planned_qty - reserved_qty
+					- ifnull(reserved_qty_for_production, 0),
+				modified = now(), modified_by = %(user)s
+			where name = %(name)s""".format(actual_qty=actual_qty), values)
+
+		self.update(frappe.db.get_value("Bin", self.name, ["actual_qty", "ordered_qty", "reserved_qty",
+			"indented_qty", "planned_qty", "projected_qty", "modified"], as_dict=1))
 
 	def set_projected_qty(self):
 		self.projected_qty = (flt(self.actual_qty) + flt(self.ordered_qty)
@@ -113,3 +137,34 @@ def update_item_projected_qty(item_code):
 	frappe.db.sql('''update tabItem set
 		total_projected_qty = ifnull((select sum(projected_qty) from tabBin where item_code=%s), 0)
 		where name=%s''', (item_code, item_code))
+
+def update_item_projected_qty_for_modified_bins():
+	'''Set total_projected_qty of all Items with Bins modified since the last run, in one update.
+		Called via scheduler'''
+	started_at = now_datetime()
+	condition, values = "", {}
+
+	last_run = frappe.cache().get_value("item_projected_qty_updated_upto")
+	if last_run:
+		# overlap, for transactions that had not been committed in the last run
+		condition = "where modified >= %(since)s"
+		values["since"] = get_datetime(last_run) - timedelta(seconds=long_job_timeout)
+
+	frappe.db.sql('''update tabItem item, (
+			select bin.item_code, sum(bin.projected_qty) as projected_qty
+			from tabBin bin, (select distinct item_code from tabBin {condition}) modified_bin
+			where bin.item_code = modified_bin.item_code
+			group by bin.item_code
+		) bin
+		set item.total_projected_qty = ifnull(bin.projected_qty, 0)
+		where item.name = bin.item_code'''.format(condition=condition), values)
+
+	if not frappe.flags.in_test:
+		frappe.db.commit()
+	frappe.cache().set_value("item_projected_qty_updated_upto", get_datetime_str(started_at))
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabBin`
+		where Key_name="modified_index" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabBin` add index modified_index(modified)""")
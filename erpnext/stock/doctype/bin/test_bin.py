@@ -5,8 +5,50 @@ from __future__ import unicode_literals
 
 import frappe
 import unittest
+from frappe.utils import flt
+from erpnext.stock.utils import get_bin
+from erpnext.stock.doctype.bin.bin import update_item_projected_qty_for_modified_bins
 
 # test_records = frappe.get_test_records('Bin')
 
 class TestBin(unittest.TestCase):
-	pass
+	def test_update_qty(self):
+		bin = get_bin("_Test Item", "_Test Warehouse - _TC")
+		before = frappe.db.get_value("Bin", bin.name, ["actual_qty", "ordered_qty", "reserved_qty"],
+			as_dict=1)
+
+		bin.update_qty({"actual_qty": 5, "ordered_qty": 3, "reserved_qty": 2})
+
+		after = frappe.db.get_value("Bin", bin.name, ["actual_qty", "ordered_qty", "reserved_qty",
+			"indented_qty", "planned_qty", "projected_qty", "reserved_qty_for_production"], as_dict=1)
+
+		self.assertEquals(after.actual_qty, flt(before.actual_qty) + 5)
+		self.assertEquals(after.ordered_qty, flt(before.ordered_qty) + 3)
+		self.assertEquals(after.reserved_qty, flt(before.reserved_qty) + 2)
+		self.assertEquals(after.projected_qty, after.actual_qty + after.ordered_qty + after.indented_qty
+			+ after.planned_qty - after.reserved_qty - flt(after.reserved_qty_for_production))
+
+		# document is in sync with the database
+		self.assertEquals(bin.actual_qty, after.actual_qty)
+		self.assertEquals(bin.projected_qty, after.projected_qty)
+
+		bin.update_qty({"actual_qty": -5, "ordered_qty": -3, "reserved_qty": -2})
+		self.assertEquals(frappe.db.get_value("Bin", bin.name, ["actual_qty", "ordered_qty", "reserved_qty"]),
+			(flt(before.actual_qty), flt(before.ordered_qty), flt(before.reserved_qty)))
+
+	def test_item_projected_qty(self):
+		bin = get_bin("_Test Item", "_Test Warehouse - _TC")
+		bin.update_qty({"actual_qty": 7})
+
+		try:
+			update_item_projected_qty_for_modified_bins()
+			self.assertEquals(flt(frappe.db.get_value("Item", "_Test Item", "total_projected_qty")),
+				flt(frappe.db.sql("""select sum(projected_qty) from tabBin
+					where item_code='_Test Item'""")[0][0]))
+		finally:
+			bin.update_qty({"actual_qty": -7})
+
+	def test_update_qty_in_group_warehouse(self):
+		bin = frappe.get_doc({"doctype": "Bin", "item_code": "_Test Item",
+			"warehouse": frappe.db.get_value("Warehouse", {"is_group": 1})})
+		self.assertRaises(frappe.ValidationError, bin.update_qty, {"actual_qty": 5})
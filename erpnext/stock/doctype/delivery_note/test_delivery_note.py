@@ -513,6 +513,44 @@ class TestDeliveryNote(unittest.TestCase):
 		self.assertEqual(dn.per_billed, 100)
 		self.assertEqual(dn.status, "Completed")
 
+	def test_delivered_qty_for_multiple_so_rows(self):
+		from erpnext.selling.doctype.sales_order.sales_order import make_delivery_note
+
+		frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 1)
+
+		so = make_sales_order(item_list=[
+			{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC", "qty": 10, "rate": 100},
+			{"item_code": "_Test Item", "warehouse": "_Test Warehouse - _TC", "qty": 5, "rate": 100},
+			{"item_code": "_Test Item Home Desktop 100", "warehouse": "_Test Warehouse - _TC",
+				"qty": 4, "rate": 100}
+		])
+
+		dn = make_delivery_note(so.name)
+		dn.set("items", dn.get("items")[:2])
+		dn.get("items")[0].qty = 6
+		dn.get("items")[1].qty = 5
+		dn.insert()
+		dn.submit()
+
+		so.load_from_db()
+		self.assertEqual([d.delivered_qty for d in so.get("items")], [6, 5, 0])
+		self.assertEqual(so.per_delivered, round(11.0 / 19 * 100, 2))
+		self.assertEqual(so.delivery_status, "Partly Delivered")
+
+		# over delivery against the first row, second row is fully delivered
+		dn2 = make_delivery_note(so.name)
+		self.assertEqual([d.so_detail for d in dn2.get("items")],
+			[so.get("items")[0].name, so.get("items")[2].name])
+		dn2.get("items")[0].qty = 8
+		dn2.insert()
+		self.assertRaises(frappe.ValidationError, dn2.submit)
+
+		dn.cancel()
+		so.load_from_db()
+		self.assertEqual([d.delivered_qty for d in so.get("items")], [0, 0, 0])
+		self.assertEqual(so.per_delivered, 0)
+		self.assertEqual(so.delivery_status, "Not Delivered")
+
 def create_delivery_note(**args):
 	dn = frappe.new_doc("Delivery Note")
 	args = frappe._dict(args)
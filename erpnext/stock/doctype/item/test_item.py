@@ -90,6 +90,72 @@ class TestItem(unittest.TestCase):
 		for key, value in to_check.iteritems():
 			self.assertEquals(value, details.get(key))
 
+	def test_get_item_details_batch(self):
+		from erpnext.stock.get_item_details import get_item_details, get_item_details_batch
+
+		make_test_records("Item Price")
+
+		args = {
+			"company": "_Test Company",
+			"price_list": "_Test Price List",
+			"currency": "_Test Currency",
+			"doctype": "Sales Order",
+			"conversion_rate": 1,
+			"price_list_currency": "_Test Currency",
+			"plc_conversion_rate": 1,
+			"order_type": "Sales",
+			"customer": "_Test Customer"
+		}
+		rows = [
+			{"item_code": "_Test Item", "qty": 2},
+			{"item_code": "_Test Item Home Desktop 100", "qty": 1, "warehouse": "_Test Warehouse 1 - _TC"},
+			{"item_code": "_Test Non Stock Item", "qty": 3},
+			{"item_code": "_Test Product Bundle Item", "qty": 1},
+			{"item_code": "_Test Item", "qty": 5}
+		]
+
+		batch = get_item_details_batch(args, rows)
+
+		for row, details in zip(rows, batch):
+			single = get_item_details(dict(args, **row))
+			self.assertEquals(single, details)
+
+	def test_get_item_details_batch_serial_nos(self):
+		from erpnext.stock.get_item_details import get_item_details, get_item_details_batch
+		from erpnext.stock.doctype.stock_entry.test_stock_entry import make_serialized_item
+
+		se = make_serialized_item()
+		warehouse = se.get("items")[0].t_warehouse
+
+		fifo = frappe.db.get_value("Stock Settings", None, "automatically_set_serial_nos_based_on_fifo")
+		frappe.db.set_value("Stock Settings", None, "automatically_set_serial_nos_based_on_fifo", 1)
+		try:
+			args = {
+				"company": "_Test Company",
+				"price_list": "_Test Price List",
+				"currency": "_Test Currency",
+				"doctype": "Sales Invoice",
+				"conversion_rate": 1,
+				"price_list_currency": "_Test Currency",
+				"plc_conversion_rate": 1,
+				"customer": "_Test Customer"
+			}
+			rows = [
+				{"item_code": "_Test Serialized Item With Series", "qty": 2, "warehouse": warehouse},
+				{"item_code": "_Test Item", "qty": 1},
+				{"item_code": "_Test Serialized Item With Series", "qty": 1, "warehouse": warehouse}
+			]
+
+			batch = get_item_details_batch(args, rows)
+
+			for row, details in zip(rows, batch):
+				single = get_item_details(dict(args, **row))
+				self.assertEquals(single, details)
+
+			self.assertEquals(len(batch[0].serial_no.split("\n")), 2)
+		finally:
+			frappe.db.set_value("Stock Settings", None, "automatically_set_serial_nos_based_on_fifo", fifo)
+
 	def test_item_attribute_change_after_variant(self):
 		frappe.delete_doc_if_exists("Item", "_Test Variant Item-L", force=1)
 
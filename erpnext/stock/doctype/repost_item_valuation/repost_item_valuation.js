@@ -0,0 +1,16 @@
+// Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+// License: GNU General Public License v3. See license.txt
+
+frappe.ui.form.on('Repost Item Valuation', {
+	refresh: function(frm) {
+		if(frm.doc.status == "Failed") {
+			frm.add_custom_button(__("Retry"), function() {
+				frappe.call({
+					method: "erpnext.stock.doctype.repost_item_valuation.repost_item_valuation.requeue",
+					args: {name: frm.doc.name},
+					callback: function() { frm.reload_doc(); }
+				});
+			});
+		}
+	}
+});
@@ -0,0 +1,117 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint
+from frappe.model.document import Document
+
+class RepostItemValuation(Document):
+	def repost(self):
+		'''Replay the stock ledger of this item / warehouse from the posting datetime
+			and repost GL Entries of the affected vouchers'''
+		from erpnext.stock.stock_ledger import update_entries_after
+		from erpnext.controllers.stock_controller import update_gl_entries_after
+
+		if not self.claim():
+			return
+
+		try:
+			update_entries_after({
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"posting_date": self.posting_date,
+				"posting_time": self.posting_time
+			}, allow_negative_stock=self.allow_negative_stock,
+				via_landed_cost_voucher=self.via_landed_cost_voucher, verbose=0, bulk_update=True)
+
+			if cint(frappe.defaults.get_global_default("auto_accounting_for_stock")):
+				update_gl_entries_after(self.posting_date, self.posting_time,
+					[self.warehouse], [self.item_code])
+
+			self.db_set("status", "Completed")
+		except Exception:
+			if frappe.flags.in_test:
+				raise
+
+			frappe.db.rollback()
+			self.db_set("status", "Failed")
+			self.db_set("error_log", frappe.get_traceback())
+
+		self.commit()
+
+	def claim(self):
+		'''Set the status to In Progress if it is still Queued. False if another job
+			has claimed it meanwhile'''
+		frappe.db.sql("""update `tabRepost Item Valuation` set status='In Progress'
+			where name=%s and status='Queued'""", self.name)
+		claimed = frappe.db._cursor.rowcount
+		self.commit()
+
+		if claimed:
+			# merged reposts may have moved the posting datetime since this was loaded
+			self.reload()
+
+		return claimed
+
+	def commit(self):
+		if not frappe.flags.in_test:
+			frappe.db.commit()
+
+def queue_repost(args, allow_negative_stock=False, via_landed_cost_voucher=False):
+	'''Queue reposting of future Stock Ledger Entries for item / warehouse.
+
+	Reposts that are still queued for the same item / warehouse are merged into one,
+	starting from the earliest posting datetime.'''
+	# the Bin row serializes queueing for the item / warehouse,
+	# as there may be no queued repost to lock yet
+	frappe.db.sql("""select name from `tabBin` where item_code=%s and warehouse=%s for update""",
+		(args.get("item_code"), args.get("warehouse")))
+
+	queued = frappe.db.sql("""select name from `tabRepost Item Valuation`
+		where item_code=%s and warehouse=%s and status='Queued'
+		limit 1 for update""", (args.get("item_code"), args.get("warehouse")))
+
+	if queued:
+		frappe.db.sql("""update `tabRepost Item Valuation`
+			set posting_date=%(posting_date)s, posting_time=%(posting_time)s
+			where name=%(name)s
+			and timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)""", {
+				"name": queued[0][0],
+				"posting_date": args.get("posting_date"),
+				"posting_time": args.get("posting_time")
+			})
+
+		if allow_negative_stock or via_landed_cost_voucher:
+			frappe.db.sql("""update `tabRepost Item Valuation`
+				set allow_negative_stock = greatest(allow_negative_stock, %s),
+					via_landed_cost_voucher = greatest(via_landed_cost_voucher, %s)
+				where name=%s""", (cint(allow_negative_stock), cint(via_landed_cost_voucher), queued[0][0]))
+
+		repost = frappe.get_doc("Repost Item Valuation", queued[0][0])
+	else:
+		repost = frappe.get_doc({
+			"doctype": "Repost Item Valuation",
+			"item_code": args.get("item_code"),
+			"warehouse": args.get("warehouse"),
+			"posting_date": args.get("posting_date"),
+			"posting_time": args.get("posting_time"),
+			"allow_negative_stock": cint(allow_negative_stock),
+			"via_landed_cost_voucher": cint(via_landed_cost_voucher)
+		}).insert(ignore_permissions=True)
+
+	return repost
+
+def repost_entries():
+	'''Process queued reposts, earliest first. Called by the scheduler'''
+	for name in frappe.db.sql_list("""select name from `tabRepost Item Valuation`
+		where status='Queued' order by posting_date, posting_time, creation"""):
+			frappe.get_doc("Repost Item Valuation", name).repost()
+
+@frappe.whitelist()
+def requeue(name):
+	'''Queue a failed repost again'''
+	repost = frappe.get_doc("Repost Item Valuation", name)
+	repost.check_permission("write")
+	repost.db_set("status", "Queued")
+	repost.db_set("error_log", None)
@@ -0,0 +1,84 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from frappe.utils import add_days, nowdate
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import repost_entries
+from erpnext.stock.stock_ledger import NegativeStockError
+
+class TestRepostItemValuation(unittest.TestCase):
+	def setUp(self):
+		frappe.db.set_value("Stock Settings", None, "repost_future_entries_in_background", 1)
+		frappe.db.sql("delete from `tabRepost Item Valuation`")
+
+	def tearDown(self):
+		frappe.db.set_value("Stock Settings", None, "repost_future_entries_in_background", 0)
+
+	def test_backdated_entries_are_coalesced(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse - _TC"
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100)
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=200,
+			posting_date=add_days(nowdate(), -2))
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=200,
+			posting_date=add_days(nowdate(), -5))
+
+		queued = frappe.get_all("Repost Item Valuation", fields=["posting_date", "status"],
+			filters={"item_code": item_code, "warehouse": warehouse})
+
+		self.assertEqual(len(queued), 1)
+		self.assertEqual(str(queued[0].posting_date), add_days(nowdate(), -5))
+
+		# bin valuation is updated with the submit
+		stock_value = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse},
+			"stock_value")
+
+		repost_entries()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation",
+			{"item_code": item_code, "warehouse": warehouse}, "status"), "Completed")
+
+		last_sle = frappe.db.sql("""select qty_after_transaction, stock_value from `tabStock Ledger Entry`
+			where item_code=%s and warehouse=%s and is_cancelled='No'
+			order by timestamp(posting_date, posting_time) desc, name desc limit 1""",
+			(item_code, warehouse))[0]
+
+		self.assertEqual(last_sle[0], frappe.db.get_value("Bin",
+			{"item_code": item_code, "warehouse": warehouse}, "actual_qty"))
+		self.assertEqual(last_sle[1], stock_value)
+
+	def test_negative_future_stock_blocks_submit(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse 1 - _TC"
+		allow_negative_stock = frappe.db.get_single_value("Stock Settings", "allow_negative_stock")
+		frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 0)
+
+		try:
+			make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100,
+				posting_date=add_days(nowdate(), -5))
+			qty = frappe.db.get_value("Bin", {"item_code": item_code, "warehouse": warehouse}, "actual_qty")
+			make_stock_entry(item_code=item_code, source=warehouse, qty=qty)
+
+			self.assertRaises(NegativeStockError, make_stock_entry, item_code=item_code,
+				source=warehouse, qty=5, posting_date=add_days(nowdate(), -2))
+		finally:
+			frappe.db.set_value("Stock Settings", None, "allow_negative_stock", allow_negative_stock)
+
+	def test_claimed_repost_is_skipped(self):
+		item_code, warehouse = "_Test Item", "_Test Warehouse - _TC"
+
+		make_stock_entry(item_code=item_code, target=warehouse, qty=10, basic_rate=100)
+		make_stock_entry(item_code=item_code, target=warehouse, qty=5, basic_rate=200,
+			posting_date=add_days(nowdate(), -2))
+
+		name = frappe.db.get_value("Repost Item Valuation", {"item_code": item_code,
+			"warehouse": warehouse, "status": "Queued"})
+		repost = frappe.get_doc("Repost Item Valuation", name)
+
+		# claimed by another job after this one loaded it
+		frappe.db.set_value("Repost Item Valuation", name, "status", "In Progress")
+		repost.repost()
+
+		self.assertEqual(frappe.db.get_value("Repost Item Valuation", name, "status"), "In Progress")
@@ -101,18 +101,15 @@ class TestStockEntry(unittest.TestCase):
 		projected_qty = frappe.db.get_value("Bin", {"item_code": item_code,
 			"warehouse": warehouse}, "projected_qty") or 0
 
-		frappe.db.set_value("Stock Settings", None, "auto_indent", 1)
-
 		# update re-level qty so that it is more than projected_qty
 		if projected_qty >= template.reorder_levels[0].warehouse_reorder_level:
 			template.reorder_levels[0].warehouse_reorder_level += projected_qty
 			template.reorder_levels[0].material_request_type = material_request_type
 			template.save()
 
-		from erpnext.stock.reorder_item import reorder_item
-		mr_list = reorder_item()
-
-		frappe.db.set_value("Stock Settings", None, "auto_indent", 0)
+		# reorder_item enqueues this for the long queue
+		from erpnext.stock.reorder_item import get_material_requests, create_material_request
+		mr_list = create_material_request(get_material_requests(), commit_each=False)
 
 		items = []
 		for mr in mr_list:
@@ -595,6 +592,35 @@ class TestStockEntry(unittest.TestCase):
 		s2.submit()
 		s2.cancel()
 
+	def test_bulk_repost_matches_per_row_repost(self):
+		from erpnext.stock.stock_ledger import update_entries_after
+
+		allow_negative_stock = frappe.db.get_value("Stock Settings", None, "allow_negative_stock")
+		frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 1)
+		try:
+			item_code, warehouse = "_Test Item 2", "_Test Warehouse - _TC"
+			fields = ["name", "qty_after_transaction", "valuation_rate", "stock_value",
+				"stock_queue", "stock_value_difference"]
+
+			for qty, rate in ((10, 100), (5, 120), (-8, 0), (4, 90)):
+				if qty > 0:
+					make_stock_entry(item_code=item_code, target=warehouse, qty=qty, basic_rate=rate)
+				else:
+					make_stock_entry(item_code=item_code, source=warehouse, qty=abs(qty))
+
+			args = {"item_code": item_code, "warehouse": warehouse}
+			update_entries_after(args.copy())
+			expected = frappe.get_all("Stock Ledger Entry", filters=args, fields=fields, order_by="name")
+
+			frappe.db.sql("""update `tabStock Ledger Entry` set qty_after_transaction=0, valuation_rate=0,
+				stock_value=0, stock_queue='[]' where item_code=%s and warehouse=%s""", (item_code, warehouse))
+
+			update_entries_after(args.copy(), bulk_update=True)
+			self.assertEqual(expected,
+				frappe.get_all("Stock Ledger Entry", filters=args, fields=fields, order_by="name"))
+		finally:
+			frappe.db.set_value("Stock Settings", None, "allow_negative_stock", allow_negative_stock)
+
 def make_serialized_item(item_code=None, serial_no=None, target_warehouse=None):
 	se = frappe.copy_doc(test_records[0])
 	se.get("items")[0].item_code = item_code or "_Test Serialized Item With Series"
@@ -33,25 +33,67 @@ def get_item_details(args):
 		}
 	"""
 	args = process_args(args)
-	item_doc = frappe.get_doc("Item", args.item_code)
+	return _get_item_details(args, ItemDetailsLookup())
+
+@frappe.whitelist()
+def get_item_details_batch(args, items):
+	"""Returns item details for every row in `items`, the same as `get_item_details` called
+	for each row merged over the header `args`, but with Items, Bins, Item Prices, UOM
+	conversions and other master data loaded for all rows in a fixed number of queries.
+
+		items = [{"item_code": "", "qty": 1.0, "warehouse": "", "uom": ""}, ...]
+
+	Rows with a `uom` other than the stock UOM also get its `conversion_factor`, which
+	the form would otherwise fetch with `get_conversion_factor`.
+	"""
+	if isinstance(args, basestring):
+		args = json.loads(args)
+	if isinstance(items, basestring):
+		items = json.loads(items)
+
+	rows = []
+	for item in items:
+		row_args = dict(args)
+		row_args.update(item)
+		rows.append(process_args(row_args))
+
+	lookup = ItemDetailsBatch(rows)
+
+	out = []
+	for row_args in rows:
+		lookup.set_pricing_rule_args(row_args)
+		details = _get_item_details(row_args, lookup)
+
+		if row_args.get("uom") and row_args.uom != details.stock_uom:
+			details.uom = row_args.uom
+			details.conversion_factor = lookup.get_conversion_factor(details.item_code, row_args.uom)
+
+		out.append(details)
+
+	lookup.set_serial_nos_by_fifo(rows, out)
+
+	return out
+
+def _get_item_details(args, lookup):
+	item_doc = lookup.get_item(args.item_code)
 	item = item_doc
 
 	validate_item_details(args, item)
 
-	out = get_basic_details(args, item)
+	out = get_basic_details(args, item, lookup)
 
 	get_party_item_code(args, item_doc, out)
 
 	if out.get("warehouse"):
-		out.update(get_bin_details(args.item_code, out.warehouse))
+		out.update(lookup.get_bin_details(args.item_code, out.warehouse))
 
-	if frappe.db.exists("Product Bundle", args.item_code):
+	if lookup.is_product_bundle(args.item_code):
 		valuation_rate = 0.0
-		bundled_items = frappe.get_doc("Product Bundle", args.item_code)
+		bundled_items = lookup.get_bundle_items(args.item_code)
 
-		for bundle_item in bundled_items.items:
+		for bundle_item in bundled_items:
 			valuation_rate += \
-				flt(get_valuation_rate(bundle_item.item_code, out.get("warehouse")).get("valuation_rate") \
+				flt(lookup.get_valuation_rate(bundle_item.item_code, out.get("warehouse")).get("valuation_rate") \
 					* bundle_item.qty)
 
 		out.update({
@@ -59,35 +101,316 @@ def get_item_details(args):
 		})
 
 	else:
-		out.update(get_valuation_rate(args.item_code, out.get("warehouse")))
+		out.update(lookup.get_valuation_rate(args.item_code, out.get("warehouse")))
 
-	get_price_list_rate(args, item_doc, out)
+	get_price_list_rate(args, item_doc, out, lookup)
 
 	if args.customer and cint(args.is_pos):
-		out.update(get_pos_profile_item_details(args.company, args))
+		out.update(get_pos_profile_item_details(args.company, args, lookup.get_pos_profile(args.company)))
 
 	# update args with out, if key or value not exists
 	for key, value in out.iteritems():
 		if args.get(key) is None:
 			args[key] = value
 
-	out.update(get_pricing_rule_for_item(args))
+	out.update(get_pricing_rule_for_item(args, item_doc))
 
 	if args.get("doctype") in ("Sales Invoice", "Delivery Note"):
 		if item_doc.has_serial_no == 1 and not args.serial_no:
-			out.serial_no = get_serial_nos_by_fifo(args, item_doc)
+			out.serial_no = lookup.get_serial_nos_by_fifo(args, item_doc)
 
 	if args.transaction_date and item.lead_time_days:
 		out.schedule_date = out.lead_time_date = add_days(args.transaction_date,
 			item.lead_time_days)
 
 	if args.get("is_subcontracted") == "Yes":
-		out.bom = get_default_bom(args.item_code)
+		out.bom = lookup.get_default_bom(args.item_code)
 
 	get_gross_profit(out)
 
 	return out
 
+class ItemDetailsLookup(object):
+	"""Master data lookups for item details, one query each"""
+	def get_item(self, item_code):
+		return frappe.get_doc("Item", item_code)
+
+	def update_template_tables(self, item):
+		item.update_template_tables()
+
+	def get_value(self, doctype, name, fieldname):
+		return frappe.db.get_value(doctype, name, fieldname)
+
+	def is_product_bundle(self, item_code):
+		return frappe.db.exists("Product Bundle", item_code)
+
+	def get_bundle_items(self, item_code):
+		return frappe.get_doc("Product Bundle", item_code).items
+
+	def get_bin_details(self, item_code, warehouse):
+		return get_bin_details(item_code, warehouse)
+
+	def get_valuation_rate(self, item_code, warehouse=None):
+		return get_valuation_rate(item_code, warehouse)
+
+	def get_price_list_rate(self, price_list, item_code):
+		return get_price_list_rate_for(price_list, item_code)
+
+	def validate_price_list_and_conversion_rate(self, args, meta):
+		validate_price_list(args)
+		validate_conversion_rate(args, meta)
+
+	def get_pos_profile(self, company):
+		return get_pos_profile(company)
+
+	def get_default_bom(self, item_code):
+		return get_default_bom(item_code)
+
+	def get_serial_nos_by_fifo(self, args, item_doc):
+		return get_serial_nos_by_fifo(args, item_doc)
+
+class ItemDetailsBatch(ItemDetailsLookup):
+	"""Master data for a list of item rows, loaded with one query per table"""
+	def __init__(self, rows):
+		self.values = {}
+		self.validated = {}
+		self.pos_profiles = {}
+		self.serial_no_rows = []
+
+		item_codes = set([d.item_code for d in rows if d.item_code])
+		self.items = self.load_items(item_codes)
+
+		templates = set([d.variant_of for d in self.items.values() if d.variant_of]) - item_codes
+		self.items.update(self.load_items(templates))
+		for item in self.items.values():
+			if item.variant_of and item.variant_of in self.items:
+				# as Item.update_template_tables, once per item
+				for d in self.items[item.variant_of].get("taxes"):
+					item.append("taxes", {"tax_type": d.tax_type, "tax_rate": d.tax_rate})
+
+		self.bundle_items = {}
+		if item_codes:
+			for d in frappe.db.sql("""select parent, item_code, qty from `tabProduct Bundle Item`
+				where parent in ({0}) order by parent, idx""".format(", ".join(["%s"] * len(item_codes))),
+				tuple(item_codes), as_dict=1):
+				self.bundle_items.setdefault(d.parent, []).append(d)
+
+			bundled = set([d.item_code for items in self.bundle_items.values() for d in items]) \
+				- set(self.items.keys())
+			self.items.update(self.load_items(bundled))
+
+		all_item_codes = tuple(self.items.keys()) or ("",)
+		in_items = ", ".join(["%s"] * len(all_item_codes))
+
+		self.bins = {}
+		for d in frappe.db.sql("""select item_code, warehouse, projected_qty, actual_qty, valuation_rate
+			from tabBin where item_code in ({0})""".format(in_items), all_item_codes, as_dict=1):
+			self.bins[(d.item_code, d.warehouse)] = d
+
+		self.purchase_rates = dict(frappe.db.sql("""select item_code, sum(base_net_amount) / sum(qty)
+			from `tabPurchase Invoice Item`
+			where item_code in ({0}) and docstatus=1 group by item_code""".format(in_items), all_item_codes))
+
+		self.item_prices = {}
+		price_lists = tuple(set([d.price_list for d in rows if d.price_list])) or ("",)
+		for d in frappe.db.sql("""select price_list, item_code, price_list_rate from `tabItem Price`
+			where price_list in ({0}) and item_code in ({1})""".format(", ".join(["%s"] * len(price_lists)),
+			in_items), price_lists + all_item_codes, as_dict=1):
+			self.item_prices.setdefault((d.price_list, d.item_code), d.price_list_rate)
+
+		self.conversion_factors = {}
+		for d in frappe.db.sql("""select parent, uom, conversion_factor from `tabUOM Conversion Detail`
+			where parent in ({0})""".format(in_items), all_item_codes, as_dict=1):
+			self.conversion_factors.setdefault((d.parent, d.uom), d.conversion_factor)
+
+		self.default_boms = dict(frappe.db.sql("""select item, name from tabBOM
+			where docstatus=1 and is_default=1 and is_active=1 and item in ({0})""".format(in_items),
+			all_item_codes))
+
+		item_groups = set([d.item_group for d in self.items.values() if d.item_group])
+		self.preload("Item Group", item_groups,
+			["default_income_account", "default_expense_account", "default_cost_center"])
+
+		accounts, cost_centers, warehouses = set(), set(), set()
+		for d in self.items.values():
+			accounts.update([d.income_account, d.expense_account])
+			cost_centers.update([d.selling_cost_center, d.buying_cost_center])
+			warehouses.add(d.default_warehouse)
+		for d in rows:
+			accounts.update([d.income_account, d.expense_account])
+			cost_centers.add(d.cost_center)
+			warehouses.add(d.warehouse)
+		for item_group in item_groups:
+			accounts.update([self.values.get(("Item Group", item_group, "default_income_account")),
+				self.values.get(("Item Group", item_group, "default_expense_account"))])
+			cost_centers.add(self.values.get(("Item Group", item_group, "default_cost_center")))
+
+		self.preload("Account", accounts, ["company"])
+		self.preload("Cost Center", cost_centers, ["company"])
+		self.preload("Warehouse", warehouses, ["company"])
+
+		self.customers = {}
+		customers = set([d.customer for d in rows if d.customer])
+		if customers:
+			for d in frappe.db.sql("""select name, customer_group, territory from tabCustomer
+				where name in ({0})""".format(", ".join(["%s"] * len(customers))), tuple(customers), as_dict=1):
+				self.customers[d.name] = d
+
+		suppliers = set([d.supplier for d in rows if d.supplier])
+		self.supplier_types = dict(frappe.db.sql("""select name, supplier_type from tabSupplier
+			where name in ({0})""".format(", ".join(["%s"] * len(suppliers))), tuple(suppliers))) \
+			if suppliers else {}
+
+	def load_items(self, item_codes):
+		"""Item documents with child tables, without a query per item"""
+		if not item_codes:
+			return {}
+
+		item_codes = tuple(item_codes)
+		in_items = ", ".join(["%s"] * len(item_codes))
+
+		items = dict((d.name, d) for d in frappe.db.sql("""select * from tabItem
+			where name in ({0})""".format(in_items), item_codes, as_dict=1))
+
+		for df in frappe.get_meta("Item").get_table_fields():
+			for d in frappe.db.sql("""select * from `tab{0}`
+				where parenttype='Item' and parentfield=%s and parent in ({1})
+				order by parent, idx""".format(df.options, in_items), (df.fieldname,) + item_codes, as_dict=1):
+				d.doctype = df.options
+				items[d.parent].setdefault(df.fieldname, []).append(d)
+
+		out = {}
+		for name, item in items.items():
+			item.doctype = "Item"
+			out[name] = frappe.get_doc(item)
+
+		return out
+
+	def preload(self, doctype, names, fieldnames):
+		names = tuple(set([d for d in names if d]))
+		if not names:
+			return
+
+		for d in frappe.db.sql("""select name, {0} from `tab{1}` where name in ({2})""".format(
+			", ".join(fieldnames), doctype, ", ".join(["%s"] * len(names))), names, as_dict=1):
+			for fieldname in fieldnames:
+				self.values[(doctype, d.name, fieldname)] = d.get(fieldname)
+
+		for name in names:
+			for fieldname in fieldnames:
+				self.values.setdefault((doctype, name, fieldname), None)
+
+	def get_item(self, item_code):
+		if item_code not in self.items:
+			self.items[item_code] = super(ItemDetailsBatch, self).get_item(item_code)
+		return self.items[item_code]
+
+	def update_template_tables(self, item):
+		# template taxes are added once when loading
+		pass
+
+	def get_value(self, doctype, name, fieldname):
+		if (doctype, name, fieldname) not in self.values:
+			self.values[(doctype, name, fieldname)] = frappe.db.get_value(doctype, name, fieldname)
+		return self.values[(doctype, name, fieldname)]
+
+	def is_product_bundle(self, item_code):
+		return item_code in self.bundle_items
+
+	def get_bundle_items(self, item_code):
+		return self.bundle_items.get(item_code, [])
+
+	def get_bin_details(self, item_code, warehouse):
+		d = self.bins.get((item_code, warehouse))
+		return frappe._dict({"projected_qty": d.projected_qty, "actual_qty": d.actual_qty}) if d \
+			else {"projected_qty": 0, "actual_qty": 0}
+
+	def get_valuation_rate(self, item_code, warehouse=None):
+		item = self.get_item(item_code)
+		if item.is_stock_item:
+			d = self.bins.get((item_code, warehouse or item.default_warehouse))
+			return frappe._dict({"valuation_rate": d.valuation_rate}) if d else {"valuation_rate": 0}
+		else:
+			return {"valuation_rate": self.purchase_rates.get(item_code) or 0.0}
+
+	def get_price_list_rate(self, price_list, item_code):
+		return self.item_prices.get((price_list, item_code))
+
+	def validate_price_list_and_conversion_rate(self, args, meta):
+		key = (meta.name, args.price_list, args.transaction_type, args.currency, args.conversion_rate,
+			args.price_list_currency, args.plc_conversion_rate, args.company)
+
+		if key not in self.validated:
+			super(ItemDetailsBatch, self).validate_price_list_and_conversion_rate(args, meta)
+			self.validated[key] = (args.conversion_rate, args.plc_conversion_rate)
+
+		args.conversion_rate, args.plc_conversion_rate = self.validated[key]
+
+	def get_pos_profile(self, company):
+		if company not in self.pos_profiles:
+			self.pos_profiles[company] = get_pos_profile(company)
+		return self.pos_profiles[company]
+
+	def get_default_bom(self, item_code):
+		if item_code and not self.default_boms.get(item_code):
+			frappe.throw(_("No default BOM exists for Item {0}").format(item_code))
+		return self.default_boms.get(item_code)
+
+	def get_serial_nos_by_fifo(self, args, item_doc):
+		# set for all rows together by `set_serial_nos_by_fifo`
+		self.serial_no_rows.append(args)
+
+	def set_serial_nos_by_fifo(self, rows, out):
+		"""Set Serial Nos by FIFO in `out` for the rows that need them, with one query"""
+		pending = set([id(d) for d in self.serial_no_rows])
+		rows = [(args, details) for args, details in zip(rows, out) if id(args) in pending]
+		if not rows or not frappe.db.get_single_value("Stock Settings",
+			"automatically_set_serial_nos_based_on_fifo"):
+			return
+
+		limits = {}
+		for args, details in rows:
+			if args.warehouse:
+				key = (args.item_code, args.warehouse)
+				limits[key] = max(limits.get(key, 0), abs(cint(args.qty)))
+
+		serial_nos = {}
+		if limits:
+			keys = limits.keys()
+			for d in frappe.db.sql(" union all ".join(["""(select item_code, warehouse, name,
+					timestamp(purchase_date, purchase_time) as purchase_datetime
+				from `tabSerial No` where item_code=%s and warehouse=%s
+				order by purchase_datetime asc limit {0})""".format(limits[key]) for key in keys]),
+				tuple(v for key in keys for v in key), as_dict=1):
+				serial_nos.setdefault((d.item_code, d.warehouse), []).append(d)
+
+		for args, details in rows:
+			available = sorted(serial_nos.get((args.item_code, args.warehouse), []),
+				key=lambda d: d.purchase_datetime)
+			details.serial_no = "\n".join([d.name for d in available[:abs(cint(args.qty))]])
+
+	def get_conversion_factor(self, item_code, uom):
+		conversion_factor = self.conversion_factors.get((item_code, uom))
+		variant_of = self.get_item(item_code).variant_of
+		if conversion_factor is None and variant_of:
+			conversion_factor = self.conversion_factors.get((variant_of, uom))
+		return conversion_factor
+
+	def set_pricing_rule_args(self, args):
+		"""Set the Customer and Item values `get_pricing_rule_for_item` would look up"""
+		item = self.get_item(args.item_code)
+		if "variant_of" not in args:
+			args.variant_of = item.variant_of
+
+		if args.transaction_type=="selling" and args.customer in self.customers \
+			and not (args.customer_group and args.territory):
+			args.customer_group = self.customers[args.customer].customer_group
+			args.territory = self.customers[args.customer].territory
+
+		elif args.transaction_type!="selling" and args.supplier in self.supplier_types \
+			and not args.supplier_type:
+			args.supplier_type = self.supplier_types[args.supplier]
+
 def process_args(args):
 	if isinstance(args, basestring):
 		args = json.loads(args)
@@ -132,12 +455,15 @@ def validate_item_details(args, item):
 		if args.get("is_subcontracted") == "Yes" and item.is_sub_contracted_item != 1:
 			throw(_("Item {0} must be a Sub-contracted Item").format(item.name))
 
-def get_basic_details(args, item):
+def get_basic_details(args, item, lookup=None):
+	if not lookup:
+		lookup = ItemDetailsLookup()
+
 	if not item:
-		item = frappe.get_doc("Item", args.get("item_code"))
+		item = lookup.get_item(args.get("item_code"))
 
 	if item.variant_of:
-		item.update_template_tables()
+		lookup.update_template_tables(item)
 
 	from frappe.defaults import get_user_default_as_list
 	user_default_warehouse_list = get_user_default_as_list('Warehouse')
@@ -152,9 +478,9 @@ def get_basic_details(args, item):
 		"description": cstr(item.description).strip(),
 		"image": cstr(item.image).strip(),
 		"warehouse": warehouse,
-		"income_account": get_default_income_account(args, item),
-		"expense_account": get_default_expense_account(args, item),
-		"cost_center": get_default_cost_center(args, item),
+		"income_account": get_default_income_account(args, item, lookup),
+		"expense_account": get_default_expense_account(args, item, lookup),
+		"cost_center": get_default_cost_center(args, item, lookup),
 		"batch_no": None,
 		"item_tax_rate": json.dumps(dict(([d.tax_type, d.tax_rate] for d in
 			item.get("taxes")))),
@@ -181,43 +507,44 @@ def get_basic_details(args, item):
 	for d in [["Account", "income_account", "default_income_account"],
 		["Account", "expense_account", "default_expense_account"],
 		["Cost Center", "cost_center", "cost_center"], ["Warehouse", "warehouse", ""]]:
-			company = frappe.db.get_value(d[0], out.get(d[1]), "company")
+			company = lookup.get_value(d[0], out.get(d[1]), "company")
 			if not out[d[1]] or (company and args.company != company):
-				out[d[1]] = frappe.db.get_value("Company", args.company, d[2]) if d[2] else None
+				out[d[1]] = lookup.get_value("Company", args.company, d[2]) if d[2] else None
 
 	for fieldname in ("item_name", "item_group", "barcode", "brand", "stock_uom"):
 		out[fieldname] = item.get(fieldname)
 
 	return out
 
-def get_default_income_account(args, item):
+def get_default_income_account(args, item, lookup=None):
 	return (item.income_account
 		or args.income_account
-		or frappe.db.get_value("Item Group", item.item_group, "default_income_account"))
+		or (lookup or ItemDetailsLookup()).get_value("Item Group", item.item_group, "default_income_account"))
 
-def get_default_expense_account(args, item):
+def get_default_expense_account(args, item, lookup=None):
 	return (item.expense_account
 		or args.expense_account
-		or frappe.db.get_value("Item Group", item.item_group, "default_expense_account"))
+		or (lookup or ItemDetailsLookup()).get_value("Item Group", item.item_group, "default_expense_account"))
 
-def get_default_cost_center(args, item):
-	return (frappe.db.get_value("Project", args.get("project"), "cost_center")
+def get_default_cost_center(args, item, lookup=None):
+	lookup = lookup or ItemDetailsLookup()
+	return (lookup.get_value("Project", args.get("project"), "cost_center")
 		or (item.selling_cost_center if args.get("customer") else item.buying_cost_center)
-		or frappe.db.get_value("Item Group", item.item_group, "default_cost_center")
+		or lookup.get_value("Item Group", item.item_group, "default_cost_center")
 		or args.get("cost_center"))
 
-def get_price_list_rate(args, item_doc, out):
+def get_price_list_rate(args, item_doc, out, lookup=None):
+	lookup = lookup or ItemDetailsLookup()
 	meta = frappe.get_meta(args.parenttype or args.doctype)
 
 	if meta.get_field("currency"):
-		validate_price_list(args)
-		validate_conversion_rate(args, meta)
+		lookup.validate_price_list_and_conversion_rate(args, meta)
 
-		price_list_rate = get_price_list_rate_for(args.price_list, item_doc.name)
+		price_list_rate = lookup.get_price_list_rate(args.price_list, item_doc.name)
 
 		# variant
 		if not price_list_rate and item_doc.variant_of:
-			price_list_rate = get_price_list_rate_for(args.price_list, item_doc.variant_of)
+			price_list_rate = lookup.get_price_list_rate(args.price_list, item_doc.variant_of)
 
 		# insert in database
 		if not price_list_rate:
@@ -5,6 +5,7 @@ import frappe
 import erpnext
 from frappe.utils import flt, nowdate, add_days, cint
 from frappe import _
+from erpnext.utilities import long_job_timeout
 
 def reorder_item():
 	""" Reorder item if stock reaches reorder level"""
@@ -15,91 +16,64 @@ def reorder_item():
 	if cint(frappe.db.get_value('Stock Settings', None, 'auto_indent')):
 		return _reorder_item()
 
-def _reorder_item():
-	material_requests = {"Purchase": {}, "Transfer": {}}
-	warehouse_company = frappe._dict(frappe.db.sql("""select name, company from `tabWarehouse`
-		where disabled=0"""))
-	default_company = (erpnext.get_default_company() or
-		frappe.db.sql("""select name from tabCompany limit 1""")[0][0])
+# material request lines per document when created in the background
+max_items_per_request = 500
 
-	items_to_consider = frappe.db.sql_list("""select name from `tabItem` item
-		where is_stock_item=1 and has_variants=0
-			and disabled=0
-			and (end_of_life is null or end_of_life='0000-00-00' or end_of_life > %(today)s)
-			and (exists (select name from `tabItem Reorder` ir where ir.parent=item.name)
-				or (variant_of is not null and variant_of != ''
-				and exists (select name from `tabItem Reorder` ir where ir.parent=item.variant_of))
-			)""",
-		{"today": nowdate()})
-
-	if not items_to_consider:
+def _reorder_item():
+	material_requests = get_material_requests()
+	if not material_requests:
 		return
 
-	item_warehouse_projected_qty = get_item_warehouse_projected_qty(items_to_consider)
-
-	def add_to_material_request(item_code, warehouse, reorder_level, reorder_qty, material_request_type, warehouse_group=None):
-		if warehouse not in warehouse_company:
-			# a disabled warehouse
-			return
+	frappe.enqueue("erpnext.stock.reorder_item.create_material_request", queue="long",
+		timeout=long_job_timeout, material_requests=material_requests, commit_each=True)
 
-		reorder_level = flt(reorder_level)
-		reorder_qty = flt(reorder_qty)
+def get_material_requests():
+	"""Items to reorder per request type and company, from one query over
+	`tabItem Reorder`, `tabBin` and the warehouse tree.
 
-		# projected_qty will be 0 if Bin does not exist
-		if warehouse_group:
-			projected_qty = flt(item_warehouse_projected_qty.get(item_code, {}).get(warehouse_group))
-		else:
-			projected_qty = flt(item_warehouse_projected_qty.get(item_code, {}).get(warehouse))
+	Variants without reorder levels use the levels of their template. For levels with a
+	warehouse group, the projected qty is summed over all warehouses under the group."""
+	material_requests = {"Purchase": {}, "Transfer": {}}
+	default_company = (erpnext.get_default_company() or
+		frappe.db.sql("""select name from tabCompany limit 1""")[0][0])
 
-		if (reorder_level or reorder_qty) and projected_qty < reorder_level:
-			deficiency = reorder_level - projected_qty
-			if deficiency > reorder_qty:
-				reorder_qty = deficiency
+	for d in frappe.db.sql("""select item.name as item_code, ir.warehouse, wh.company,
+			ir.material_request_type,
+			ifnull(ir.warehouse_reorder_level, 0) as reorder_level,
+			ifnull(ir.warehouse_reorder_qty, 0) as reorder_qty,
+			ifnull(sum(bin.projected_qty), 0) as projected_qty
+		from `tabItem` item
+		inner join `tabItem Reorder` ir
+			on ir.parent = if(exists (select name from `tabItem Reorder` own where own.parent=item.name),
+				item.name, item.variant_of)
+		inner join `tabWarehouse` wh on wh.name = ir.warehouse and wh.disabled = 0
+		left join `tabWarehouse` grp
+			on grp.name = if(ifnull(ir.warehouse_group, '') != '', ir.warehouse_group, ir.warehouse)
+		left join (`tabBin` bin inner join `tabWarehouse` child on child.name = bin.warehouse)
+			on bin.item_code = item.name and child.lft >= grp.lft and child.rgt <= grp.rgt
+		where item.is_stock_item=1 and item.has_variants=0
+			and item.disabled=0
+			and (item.end_of_life is null or item.end_of_life='0000-00-00' or item.end_of_life > %(today)s)
+		group by item.name, ir.name
+		having (reorder_level != 0 or reorder_qty != 0) and projected_qty < reorder_level""",
+		{"today": nowdate()}, as_dict=1):
+
+		deficiency = flt(d.reorder_level) - flt(d.projected_qty)
+		material_requests.setdefault(d.material_request_type, {})\
+			.setdefault(d.company or default_company, []).append({
+				"item_code": d.item_code,
+				"warehouse": d.warehouse,
+				"reorder_qty": max(flt(d.reorder_qty), deficiency)
+			})
 
-			company = warehouse_company.get(warehouse) or default_company
+	if any(material_requests.values()):
+		return material_requests
 
-			material_requests[material_request_type].setdefault(company, []).append({
-				"item_code": item_code,
-				"warehouse": warehouse,
-				"reorder_qty": reorder_qty
-			})
+def create_material_request(material_requests, commit_each=False):
+	"""	Create indent on reaching reorder level.
 
-	for item_code in items_to_consider:
-		item = frappe.get_doc("Item", item_code)
-
-		if item.variant_of and not item.get("reorder_levels"):
-			item.update_template_tables()
-
-		if item.get("reorder_levels"):
-			for d in item.get("reorder_levels"):
-				add_to_material_request(item_code, d.warehouse, d.warehouse_reorder_level,
-					d.warehouse_reorder_qty, d.material_request_type, warehouse_group=d.warehouse_group)
-
-	if material_requests:
-		return create_material_request(material_requests)
-
-def get_item_warehouse_projected_qty(items_to_consider):
-	item_warehouse_projected_qty = {}
-
-	for item_code, warehouse, projected_qty in frappe.db.sql("""select item_code, warehouse, projected_qty
-		from tabBin where item_code in ({0})
-			and (warehouse != "" and warehouse is not null)"""\
-		.format(", ".join(["%s"] * len(items_to_consider))), items_to_consider):
-		
-		item_warehouse_projected_qty.setdefault(item_code, {})[warehouse] = flt(projected_qty)
-		
-		warehouse_doc = frappe.get_doc("Warehouse", warehouse)
-		
-		if warehouse_doc.parent_warehouse:
-			if not item_warehouse_projected_qty.get(item_code, {}).get(warehouse_doc.parent_warehouse):
-				item_warehouse_projected_qty.setdefault(item_code, {})[warehouse_doc.parent_warehouse] = flt(projected_qty)
-			else:
-				item_warehouse_projected_qty[item_code][warehouse_doc.parent_warehouse] += flt(projected_qty)
-				
-	return item_warehouse_projected_qty
-
-def create_material_request(material_requests):
-	"""	Create indent on reaching reorder level	"""
+	Lines of a request type and company are split into documents of
+	`max_items_per_request` lines. Set `commit_each` to commit after every document."""
 	mr_list = []
 	exceptions_list = []
 
@@ -110,42 +84,48 @@ def create_material_request(material_requests):
 		else:
 			exceptions_list.append(frappe.get_traceback())
 
+	item_details = get_item_details(material_requests)
+
 	for request_type in material_requests:
 		for company in material_requests[request_type]:
-			try:
-				items = material_requests[request_type][company]
-				if not items:
-					continue
-
-				mr = frappe.new_doc("Material Request")
-				mr.update({
-					"company": company,
-					"transaction_date": nowdate(),
-					"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
-				})
-
-				for d in items:
-					d = frappe._dict(d)
-					item = frappe.get_doc("Item", d.item_code)
-					mr.append("items", {
-						"doctype": "Material Request Item",
-						"item_code": d.item_code,
-						"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
-						"uom":	item.stock_uom,
-						"warehouse": d.warehouse,
-						"item_name": item.item_name,
-						"description": item.description,
-						"item_group": item.item_group,
-						"qty": d.reorder_qty,
-						"brand": item.brand,
+			items = material_requests[request_type][company]
+
+			for i in xrange(0, len(items), max_items_per_request):
+				try:
+					mr = frappe.new_doc("Material Request")
+					mr.update({
+						"company": company,
+						"transaction_date": nowdate(),
+						"material_request_type": "Material Transfer" if request_type=="Transfer" else request_type
 					})
 
-				mr.insert()
-				mr.submit()
-				mr_list.append(mr)
-
-			except:
-				_log_exception()
+					for d in items[i:i + max_items_per_request]:
+						d = frappe._dict(d)
+						item = item_details[d.item_code]
+						mr.append("items", {
+							"doctype": "Material Request Item",
+							"item_code": d.item_code,
+							"schedule_date": add_days(nowdate(),cint(item.lead_time_days)),
+							"uom":	item.stock_uom,
+							"warehouse": d.warehouse,
+							"item_name": item.item_name,
+							"description": item.description,
+							"item_group": item.item_group,
+							"qty": d.reorder_qty,
+							"brand": item.brand,
+						})
+
+					mr.insert()
+					mr.submit()
+					mr_list.append(mr)
+
+					if commit_each:
+						frappe.db.commit()
+
+				except:
+					if commit_each:
+						frappe.db.rollback()
+					_log_exception()
 
 	if mr_list:
 		if getattr(frappe.local, "reorder_email_notify", None) is None:
@@ -160,6 +140,16 @@ def create_material_request(material_requests):
 
 	return mr_list
 
+def get_item_details(material_requests):
+	item_codes = list(set([d["item_code"] for companies in material_requests.values()
+		for items in companies.values() for d in items]))
+	if not item_codes:
+		return {}
+
+	return dict((d.name, d) for d in frappe.db.sql("""select name, item_name, description,
+			item_group, brand, stock_uom, lead_time_days
+		from `tabItem` where name in %s""", (tuple(item_codes),), as_dict=1))
+
 def send_email_notification(mr_list):
 	""" Notify user about auto creation of indent"""
 
@@ -5,12 +5,11 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 from frappe.utils import flt, getdate
+from erpnext.utilities.tree_cache import get_tree, get_descendants_condition
 
 def execute(filters=None):
 	if not filters: filters = {}
 
-	validate_filters(filters)
-
 	columns = get_columns()
 	item_map = get_item_details(filters)
 	iwb_map = get_item_warehouse_map(filters)
@@ -63,75 +62,105 @@ def get_conditions(filters):
 		frappe.throw(_("'From Date' is required"))
 
 	if filters.get("to_date"):
-		conditions += " and posting_date <= '%s'" % frappe.db.escape(filters["to_date"])
+		conditions += " and posting_date <= %(to_date)s"
 	else:
 		frappe.throw(_("'To Date' is required"))
 
 	if filters.get("item_code"):
-		conditions += " and item_code = '%s'" % frappe.db.escape(filters.get("item_code"), percent=False)
+		conditions += " and item_code = %(item_code)s"
 
 	if filters.get("warehouse"):
-		warehouse_details = frappe.db.get_value("Warehouse", filters.get("warehouse"), ["lft", "rgt"], as_dict=1)
-		if warehouse_details:
-			conditions += " and exists (select name from `tabWarehouse` wh \
-				where wh.lft >= %s and wh.rgt <= %s and sle.warehouse = wh.name)"%(warehouse_details.lft,
-				warehouse_details.rgt)
+		if get_tree("Warehouse").exists(filters.get("warehouse")):
+			conditions += " and " + get_descendants_condition("Warehouse", filters.get("warehouse"),
+				"sle.warehouse")
 
 	return conditions
 
-def get_stock_ledger_entries(filters):
-	conditions = get_conditions(filters)
-	return frappe.db.sql("""select item_code, warehouse, posting_date, actual_qty, valuation_rate,
-			company, voucher_type, qty_after_transaction, stock_value_difference
-		from `tabStock Ledger Entry` sle force index (posting_sort_index)
-		where docstatus < 2 %s order by posting_date, posting_time, name""" %
-		conditions, as_dict=1)
-
 def get_item_warehouse_map(filters):
-	iwb_map = {}
-	from_date = getdate(filters["from_date"])
-	to_date = getdate(filters["to_date"])
-
-	sle = get_stock_ledger_entries(filters)
+	"""Opening, in, out and balance per (company, item, warehouse), aggregated in the database.
 
-	for d in sle:
+	Quantities are summed from `actual_qty` and values from `stock_value_difference`, in / out
+	are split by the sign of `actual_qty`. Stock Reconciliation entries set the quantity, so the
+	difference they make is found from the quantities before them. The valuation rate is read
+	from the last entry of each group, with one ordered lookup per group."""
+	iwb_map = {}
+	conditions = get_conditions(filters)
+	values = {
+		"from_date": getdate(filters["from_date"]),
+		"to_date": getdate(filters["to_date"]),
+		"item_code": filters.get("item_code")
+	}
+
+	in_period = "posting_date >= %(from_date)s and voucher_type != 'Stock Reconciliation'"
+
+	for d in frappe.db.sql("""select sle.*,
+			(select last.valuation_rate from `tabStock Ledger Entry` last
+				where last.item_code = sle.item_code and last.warehouse = sle.warehouse
+				and last.docstatus < 2 and last.posting_date <= %(to_date)s
+				order by last.posting_date desc, last.posting_time desc, last.name desc
+				limit 1) as val_rate
+		from (select company, item_code, warehouse,
+				sum(if(posting_date < %(from_date)s, actual_qty, 0)) as opening_qty,
+				sum(if(posting_date < %(from_date)s, stock_value_difference, 0)) as opening_val,
+				sum(if({in_period} and actual_qty > 0, actual_qty, 0)) as in_qty,
+				sum(if({in_period} and actual_qty > 0, stock_value_difference, 0)) as in_val,
+				sum(if({in_period} and actual_qty <= 0, abs(actual_qty), 0)) as out_qty,
+				sum(if({in_period} and actual_qty <= 0, abs(stock_value_difference), 0)) as out_val,
+				sum(actual_qty) as bal_qty,
+				sum(stock_value_difference) as bal_val
+			from `tabStock Ledger Entry` sle
+			where docstatus < 2 {conditions}
+			group by company, item_code, warehouse) sle""".format(in_period=in_period,
+			conditions=conditions), values, as_dict=1):
+
+		iwb_map[(d.company, d.item_code, d.warehouse)] = frappe._dict({
+			"opening_qty": flt(d.opening_qty), "opening_val": flt(d.opening_val),
+			"in_qty": flt(d.in_qty), "in_val": flt(d.in_val),
+			"out_qty": flt(d.out_qty), "out_val": flt(d.out_val),
+			"bal_qty": flt(d.bal_qty), "bal_val": flt(d.bal_val),
+			"val_rate": flt(d.val_rate), "uom": None
+		})
+
+	# quantity set by each reconciliation, less the quantity before it
+	qty_set = {}
+	for d in get_reconciliation_entries(conditions, values):
 		key = (d.company, d.item_code, d.warehouse)
-		if key not in iwb_map:
-			iwb_map[key] = frappe._dict({
-				"opening_qty": 0.0, "opening_val": 0.0,
-				"in_qty": 0.0, "in_val": 0.0,
-				"out_qty": 0.0, "out_val": 0.0,
-				"bal_qty": 0.0, "bal_val": 0.0,
-				"val_rate": 0.0, "uom": None
-			})
-
-		qty_dict = iwb_map[(d.company, d.item_code, d.warehouse)]
-
-		if d.voucher_type == "Stock Reconciliation":
-			qty_diff = flt(d.qty_after_transaction) - qty_dict.bal_qty
-		else:
-			qty_diff = flt(d.actual_qty)
+		qty_dict = iwb_map[key]
 
+		qty_diff = flt(d.qty_after_transaction) - flt(d.previous_qty) - qty_set.get(key, 0)
+		qty_set[key] = qty_set.get(key, 0) + qty_diff
 		value_diff = flt(d.stock_value_difference)
 
-		if d.posting_date < from_date:
+		if d.posting_date < values["from_date"]:
 			qty_dict.opening_qty += qty_diff
-			qty_dict.opening_val += value_diff
-
-		elif d.posting_date >= from_date and d.posting_date <= to_date:
-			if qty_diff > 0:
-				qty_dict.in_qty += qty_diff
-				qty_dict.in_val += value_diff
-			else:
-				qty_dict.out_qty += abs(qty_diff)
-				qty_dict.out_val += abs(value_diff)
+		elif qty_diff > 0:
+			qty_dict.in_qty += qty_diff
+			qty_dict.in_val += value_diff
+		else:
+			qty_dict.out_qty += abs(qty_diff)
+			qty_dict.out_val += abs(value_diff)
 
-		qty_dict.val_rate = d.valuation_rate
 		qty_dict.bal_qty += qty_diff
-		qty_dict.bal_val += value_diff
 
 	return iwb_map
 
+def get_reconciliation_entries(conditions, values):
+	"""Stock Reconciliation entries up to the end of the period, in order, with the sum of
+	`actual_qty` before each of them"""
+	return frappe.db.sql("""select company, item_code, warehouse, posting_date,
+			qty_after_transaction, stock_value_difference,
+			(select sum(prev.actual_qty) from `tabStock Ledger Entry` prev
+				where prev.item_code = sle.item_code and prev.warehouse = sle.warehouse
+				and prev.docstatus < 2
+				and (prev.posting_date < sle.posting_date
+					or (prev.posting_date = sle.posting_date and prev.posting_time < sle.posting_time)
+					or (prev.posting_date = sle.posting_date and prev.posting_time = sle.posting_time
+						and prev.name < sle.name))) as previous_qty
+		from `tabStock Ledger Entry` sle
+		where docstatus < 2 and voucher_type = 'Stock Reconciliation' {conditions}
+		order by company, item_code, warehouse, posting_date, posting_time, name""".format(
+			conditions=conditions), values, as_dict=1)
+
 def get_item_details(filters):
 	condition = ''
 	value = ()
@@ -143,9 +172,3 @@ def get_item_details(filters):
 		from tabItem {condition}""".format(condition=condition), value, as_dict=1)
 
 	return dict((d.name, d) for d in items)
-
-def validate_filters(filters):
-	if not (filters.get("item_code") or filters.get("warehouse")):
-		sle_count = flt(frappe.db.sql("""select count(name) from `tabStock Ledger Entry`""")[0][0])
-		if sle_count > 500000:
-			frappe.throw(_("Please set filter based on Item or Warehouse"))
@@ -47,8 +47,30 @@ frappe.query_reports["Stock Ledger"] = {
 			"fieldname":"voucher_no",
 			"label": __("Voucher #"),
 			"fieldtype": "Data"
+		},
+		{
+			"fieldname":"page",
+			"label": __("Page"),
+			"fieldtype": "Int",
+			"description": __("Show one page of 500 entries, leave blank for all")
 		}
-	]
+	],
+	"onload": function(report) {
+		$.each(["CSV", "XLSX"], function(i, file_format) {
+			report.page.add_menu_item(__("Export {0} in background", [file_format]), function() {
+				frappe.call({
+					method: "erpnext.stock.report.stock_ledger.stock_ledger.export_stock_ledger",
+					args: {
+						filters: report.get_values(),
+						file_format: file_format
+					},
+					callback: function() {
+						frappe.msgprint(__("You will be notified with a link when the file is ready"));
+					}
+				});
+			});
+		});
+	}
 }
 
 // $(function() {
@@ -2,30 +2,30 @@
 # License: GNU General Public License v3. See license.txt
 
 from __future__ import unicode_literals
+import os, json, csv
 import frappe
 from frappe import _
+from frappe.utils import flt, cint, cstr
+from erpnext.utilities.tree_cache import get_tree, get_descendants, get_descendants_condition
+from erpnext.utilities.report_pages import get_page, validate_report_permission
+from erpnext.utilities import long_job_timeout
 
 def execute(filters=None):
 	columns = get_columns()
-	sl_entries = get_stock_ledger_entries(filters)
-	item_details = get_item_details(filters)
-	opening_row = get_opening_balance(filters, columns)
-	
 	data = []
-	
-	if opening_row:
-		data.append(opening_row)
-
-	for sle in sl_entries:
-		item_detail = item_details[sle.item_code]
-
-		data.append([sle.date, sle.item_code, item_detail.item_name, item_detail.item_group,
-			item_detail.brand, item_detail.description, sle.warehouse,
-			item_detail.stock_uom, sle.actual_qty, sle.qty_after_transaction,
-			(sle.incoming_rate if sle.actual_qty > 0 else 0.0),
-			sle.valuation_rate, sle.stock_value, sle.voucher_type, sle.voucher_no,
-			sle.batch_no, sle.serial_no, sle.company])
-			
+
+	if cint(filters.get("page")):
+		pages = [get_page("Stock Ledger", "Stock Ledger Entry", filters, filters.get("page"),
+			get_ledger_page)]
+	else:
+		pages = stream_ledger(filters)
+
+	for page in pages:
+		if page["opening"]:
+			data.append(get_opening_row(page["opening"], columns))
+
+		data.extend(page["entries"])
+
 	return columns, data
 
 def get_columns():
@@ -37,22 +37,106 @@ def get_columns():
 		_("Serial #") + ":Link/Serial No:100", _("Company") + ":Link/Company:100"
 	]
 
-def get_stock_ledger_entries(filters):
+@frappe.whitelist()
+def get_ledger_page(filters, cursor=None, page_length=500):
+	'''Return one page of report rows, ordered by (posting_date, posting_time, name).
+
+	The opening balance is computed once on the first call. Pass the returned `cursor`
+	back to fetch the next page; it is `None` after the last page. Item details are
+	fetched only for the items on the page.'''
+	validate_report_permission("Stock Ledger Entry")
+
+	if isinstance(filters, basestring):
+		filters = json.loads(filters)
+	filters = frappe._dict(filters)
+
+	if isinstance(cursor, basestring):
+		cursor = json.loads(cursor)
+
+	opening = None
+	if not cursor:
+		opening = get_opening_balance(filters)
+
+	page_length = cint(page_length) or 500
+	sl_entries = get_stock_ledger_entries(filters, cursor and frappe._dict(cursor), page_length + 1)
+
+	has_more = len(sl_entries) > page_length
+	sl_entries = sl_entries[:page_length]
+
+	item_details = get_item_details(list(set([sle.item_code for sle in sl_entries])))
+
+	next_cursor = None
+	if has_more:
+		next_cursor = {
+			"posting_date": sl_entries[-1].posting_date,
+			"posting_time": sl_entries[-1].posting_time,
+			"name": sl_entries[-1].name
+		}
+
+	return {
+		"opening": opening,
+		"entries": [get_row(sle, item_details[sle.item_code]) for sle in sl_entries],
+		"cursor": next_cursor
+	}
+
+def stream_ledger(filters, page_length=500):
+	'''Yield pages of report rows until the ledger is exhausted'''
+	cursor = None
+	while True:
+		page = get_ledger_page(filters, cursor, page_length)
+		yield page
+
+		cursor = page["cursor"]
+		if not cursor:
+			break
+
+def get_row(sle, item_detail):
+	return [sle.date, sle.item_code, item_detail.item_name, item_detail.item_group,
+		item_detail.brand, item_detail.description, sle.warehouse,
+		item_detail.stock_uom, sle.actual_qty, sle.qty_after_transaction,
+		(sle.incoming_rate if sle.actual_qty > 0 else 0.0),
+		sle.valuation_rate, sle.stock_value, sle.voucher_type, sle.voucher_no,
+		sle.batch_no, sle.serial_no, sle.company]
+
+def get_opening_row(opening, columns):
+	row = [""]*len(columns)
+	row[1] = _("'Opening'")
+	for i, v in ((9, 'qty_after_transaction'), (11, 'valuation_rate'), (12, 'stock_value')):
+		row[i] = opening.get(v, 0)
+
+	return row
+
+def get_stock_ledger_entries(filters, cursor=None, limit=None):
+	values = filters.copy()
+	keyset_condition = ""
+	if cursor:
+		keyset_condition = """and posting_date >= %(cursor_date)s
+			and (posting_date > %(cursor_date)s
+				or (posting_date = %(cursor_date)s and (posting_time > %(cursor_time)s
+					or (posting_time = %(cursor_time)s and name > %(cursor_name)s))))"""
+		values.update({"cursor_date": cursor.posting_date, "cursor_time": cursor.posting_time,
+			"cursor_name": cursor.name})
+
 	return frappe.db.sql("""select concat_ws(" ", posting_date, posting_time) as date,
+			name, posting_date, posting_time,
 			item_code, warehouse, actual_qty, qty_after_transaction, incoming_rate, valuation_rate,
 			stock_value, voucher_type, voucher_no, batch_no, serial_no, company
-		from `tabStock Ledger Entry` sle
+		from `tabStock Ledger Entry`
 		where company = %(company)s and
 			posting_date between %(from_date)s and %(to_date)s
-			{sle_conditions}
-			order by posting_date asc, posting_time asc, name asc"""\
-		.format(sle_conditions=get_sle_conditions(filters)), filters, as_dict=1)
+			{sle_conditions} {keyset_condition}
+			order by posting_date asc, posting_time asc, name asc
+			{limit}"""\
+		.format(sle_conditions=get_sle_conditions(filters), keyset_condition=keyset_condition,
+			limit="limit {0}".format(cint(limit)) if limit else ""), values, as_dict=1)
 
-def get_item_details(filters):
+def get_item_details(items):
 	item_details = {}
+	if not items:
+		return item_details
+
 	for item in frappe.db.sql("""select name, item_name, description, item_group,
-			brand, stock_uom from `tabItem` {item_conditions}"""\
-			.format(item_conditions=get_item_conditions(filters)), filters, as_dict=1):
+			brand, stock_uom from `tabItem` where name in %s""", (tuple(items),), as_dict=1):
 		item_details.setdefault(item.name, item)
 
 	return item_details
@@ -68,41 +152,128 @@ def get_item_conditions(filters):
 
 def get_sle_conditions(filters):
 	conditions = []
-	item_conditions=get_item_conditions(filters)
-	if item_conditions:
+	if filters.get("item_code"):
+		conditions.append("item_code=%(item_code)s")
+	if filters.get("brand"):
 		conditions.append("""item_code in (select name from tabItem
-			{item_conditions})""".format(item_conditions=item_conditions))
+			{item_conditions})""".format(item_conditions=get_item_conditions(filters)))
 	if filters.get("warehouse"):
 		conditions.append(get_warehouse_condition(filters.get("warehouse")))
 	if filters.get("voucher_no"):
 		conditions.append("voucher_no=%(voucher_no)s")
 
+	from frappe.desk.reportview import build_match_conditions
+	match_conditions = build_match_conditions("Stock Ledger Entry")
+	if match_conditions: conditions.append(match_conditions)
+
 	return "and {}".format(" and ".join(conditions)) if conditions else ""
 
-def get_opening_balance(filters, columns):
+def get_opening_balance(filters):
+	'''Balance of the item before `from_date`, summed over the warehouse and warehouses under it'''
 	if not (filters.item_code and filters.warehouse and filters.from_date):
 		return
 
-	from erpnext.stock.stock_ledger import get_previous_sle
-	last_entry = get_previous_sle({
-		"item_code": filters.item_code,
-		"warehouse": get_warehouse_condition(filters.warehouse),
-		"posting_date": filters.from_date,
-		"posting_time": "00:00:00"
-	})
-	
-	row = [""]*len(columns)
-	row[1] = _("'Opening'")
-	for i, v in ((9, 'qty_after_transaction'), (11, 'valuation_rate'), (12, 'stock_value')):
-			row[i] = last_entry.get(v, 0)
-		
-	return row
-	
+	opening = frappe._dict({"qty_after_transaction": 0.0, "valuation_rate": 0.0, "stock_value": 0.0})
+	warehouses = frappe.db.sql_list("""select distinct warehouse from `tabStock Ledger Entry`
+		where item_code = %s and warehouse in %s and posting_date < %s
+			and ifnull(is_cancelled, 'No') = 'No'""",
+		(filters.item_code, tuple(get_descendants("Warehouse", filters.warehouse) or [filters.warehouse]),
+			filters.from_date))
+
+	for warehouse in warehouses:
+		last_entry = frappe.db.sql("""select qty_after_transaction, valuation_rate, stock_value
+			from `tabStock Ledger Entry`
+			where item_code = %s and warehouse = %s and posting_date < %s
+				and ifnull(is_cancelled, 'No') = 'No'
+			order by posting_date desc, posting_time desc, name desc
+			limit 1""", (filters.item_code, warehouse, filters.from_date), as_dict=1)[0]
+
+		opening.qty_after_transaction += flt(last_entry.qty_after_transaction)
+		opening.stock_value += flt(last_entry.stock_value)
+		if len(warehouses) == 1:
+			opening.valuation_rate = flt(last_entry.valuation_rate)
+
+	if len(warehouses) > 1 and opening.qty_after_transaction:
+		opening.valuation_rate = opening.stock_value / opening.qty_after_transaction
+
+	return opening
+
 def get_warehouse_condition(warehouse):
-	warehouse_details = frappe.db.get_value("Warehouse", warehouse, ["lft", "rgt"], as_dict=1)
-	if warehouse_details:
-		return " exists (select name from `tabWarehouse` wh \
-			where wh.lft >= %s and wh.rgt <= %s and sle.warehouse = wh.name)"%(warehouse_details.lft,
-			warehouse_details.rgt)
+	if get_tree("Warehouse").exists(warehouse):
+		return get_descendants_condition("Warehouse", warehouse, "warehouse")
 
 	return ''
+
+@frappe.whitelist()
+def export_stock_ledger(filters, file_format="CSV"):
+	'''Write the report to a private file in the background, the user is notified with
+	a link when the file is ready'''
+	validate_report_permission("Stock Ledger Entry")
+
+	if isinstance(filters, basestring):
+		filters = json.loads(filters)
+
+	frappe.enqueue("erpnext.stock.report.stock_ledger.stock_ledger.write_ledger_file", queue="long",
+		timeout=long_job_timeout, filters=filters, file_format=file_format, user=frappe.session.user)
+
+def write_ledger_file(filters, file_format="CSV", user=None, page_length=2000):
+	'''Write report rows page by page to a private CSV or XLSX file, returns the File.
+	Rows are read as `user`, with their permissions'''
+	if user:
+		frappe.set_user(user)
+
+	file_format = "XLSX" if cstr(file_format).upper() == "XLSX" else "CSV"
+	file_name = "stock-ledger-{0}.{1}".format(frappe.generate_hash(length=8), file_format.lower())
+	path = frappe.get_site_path("private", "files", file_name)
+
+	columns = get_columns()
+	header = [c.split(":")[0] for c in columns]
+
+	def get_rows():
+		yield header
+		for page in stream_ledger(filters, page_length):
+			if page["opening"]:
+				yield get_opening_row(page["opening"], columns)
+
+			for row in page["entries"]:
+				yield row
+
+	if file_format == "XLSX":
+		write_xlsx(path, get_rows())
+	else:
+		write_csv(path, get_rows())
+
+	_file = frappe.get_doc({
+		"doctype": "File",
+		"file_name": file_name,
+		"file_url": "/private/files/" + file_name,
+		"is_private": 1,
+		"file_size": os.path.getsize(path)
+	})
+	_file.flags.ignore_permissions = True
+	_file.insert()
+	frappe.db.commit()
+
+	if user:
+		frappe.publish_realtime("msgprint", _("Stock Ledger exported to {0}").format(
+			'<a href="{0}">{1}</a>'.format(_file.file_url, file_name)), user=user)
+
+	return _file
+
+def write_csv(path, rows):
+	with open(path, "wb") as f:
+		writer = csv.writer(f)
+		for row in rows:
+			writer.writerow([cstr(v).encode("utf-8") for v in row])
+
+def write_xlsx(path, rows):
+	from openpyxl import Workbook
+
+	# write only workbooks flush rows to a temporary file as they are appended
+	wb = Workbook(write_only=True)
+	ws = wb.create_sheet(_("Stock Ledger"))
+	for row in rows:
+		ws.append([cstr(v) if v is not None and not isinstance(v, (int, long, float)) else v
+			for v in row])
+
+	wb.save(path)
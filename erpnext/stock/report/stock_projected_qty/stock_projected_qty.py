@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 from frappe.utils import flt, today
+from erpnext.utilities.tree_cache import get_tree, get_descendants_condition
 
 def execute(filters=None):
 	filters = frappe._dict(filters or {})
@@ -63,12 +64,8 @@ def get_bin_list(filters):
 		conditions.append("item_code = '%s' "%filters.item_code)
 		
 	if filters.warehouse:
-		warehouse_details = frappe.db.get_value("Warehouse", filters.warehouse, ["lft", "rgt"], as_dict=1)
-
-		if warehouse_details:
-			conditions.append(" exists (select name from `tabWarehouse` wh \
-				where wh.lft >= %s and wh.rgt <= %s and bin.warehouse = wh.name)"%(warehouse_details.lft,
-				warehouse_details.rgt))
+		if get_tree("Warehouse").exists(filters.warehouse):
+			conditions.append(get_descendants_condition("Warehouse", filters.warehouse, "bin.warehouse"))
 
 	bin_list = frappe.db.sql("""select item_code, warehouse, actual_qty, planned_qty, indented_qty,
 		ordered_qty, reserved_qty, reserved_qty_for_production, projected_qty
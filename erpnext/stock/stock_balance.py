@@ -52,7 +52,8 @@ def repost_stock(item_code, warehouse, allow_zero_rate=False, only_actual=False,
 
 def repost_actual_qty(item_code, warehouse, allow_zero_rate=False):
 	try:
-		update_entries_after({ "item_code": item_code, "warehouse": warehouse }, allow_zero_rate)
+		update_entries_after({ "item_code": item_code, "warehouse": warehouse }, allow_zero_rate,
+			bulk_update=True)
 	except:
 		pass
 
@@ -230,6 +231,8 @@ def reset_serial_no_status_and_warehouse(serial_nos=None):
 				pass
 
 def repost_all_stock_vouchers():
+	from erpnext.accounts.general_ledger import delete_voucher_gl_entries
+
 	warehouses_with_account = frappe.db.sql_list("""select master_name from tabAccount
 		where ifnull(account_type, '') = 'Stock' and (warehouse is not null and warehouse != '')
 		and is_group=0""")
@@ -246,9 +249,9 @@ def repost_all_stock_vouchers():
 		i+=1
 		print i, "/", len(vouchers)
 		try:
-			for dt in ["Stock Ledger Entry", "GL Entry"]:
-				frappe.db.sql("""delete from `tab%s` where voucher_type=%s and voucher_no=%s"""%
-					(dt, '%s', '%s'), (voucher_type, voucher_no))
+			frappe.db.sql("""delete from `tabStock Ledger Entry` where voucher_type=%s and voucher_no=%s""",
+				(voucher_type, voucher_no))
+			delete_voucher_gl_entries(voucher_type, voucher_no)
 
 			doc = frappe.get_doc(voucher_type, voucher_no)
 			if voucher_type=="Stock Entry" and doc.purpose in ["Manufacture", "Repack"]:
@@ -6,6 +6,7 @@ import frappe
 from frappe import _
 from frappe.utils import cint, flt, cstr, now
 from erpnext.stock.utils import get_valuation_method
+from erpnext.utilities.report_pages import bump_ledger_version
 import json
 
 # future reposting
@@ -40,6 +41,8 @@ def make_sl_entries(sl_entries, is_amended=None, allow_negative_stock=False, via
 		if cancel:
 			delete_cancelled_entry(sl_entries[0].get('voucher_type'), sl_entries[0].get('voucher_no'))
 
+		bump_ledger_version("Stock Ledger Entry")
+
 def set_as_cancel(voucher_type, voucher_no):
 	frappe.db.sql("""update `tabStock Ledger Entry` set is_cancelled='Yes',
 		modified=%s, modified_by=%s
@@ -74,13 +77,18 @@ class update_entries_after(object):
 				"posting_time": "12:00"
 			}
 	"""
-	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False, verbose=1):
-		from frappe.model.meta import get_field_precision
+	def __init__(self, args, allow_zero_rate=False, allow_negative_stock=None, via_landed_cost_voucher=False,
+		verbose=1, bulk_update=False, defer_future_repost=False):
+		from erpnext.utilities.precision import get_field_precision, get_company_default_currency
 
 		self.exceptions = []
 		self.verbose = verbose
+		self.bulk_update = bulk_update
+		self.defer_future_repost = defer_future_repost
+		self.entries_to_update = []
 		self.allow_zero_rate = allow_zero_rate
 		self.allow_negative_stock = allow_negative_stock
+		self.queue_allow_negative_stock = allow_negative_stock
 		self.via_landed_cost_voucher = via_landed_cost_voucher
 		if not self.allow_negative_stock:
 			self.allow_negative_stock = cint(frappe.db.get_single_value("Stock Settings",
@@ -97,8 +105,8 @@ class update_entries_after(object):
 			setattr(self, key, flt(self.previous_sle.get(key)))
 
 		self.company = frappe.db.get_value("Warehouse", self.warehouse, "company")
-		self.precision = get_field_precision(frappe.get_meta("Stock Ledger Entry").get_field("stock_value"),
-			currency=frappe.db.get_value("Company", self.company, "default_currency", cache=True))
+		self.precision = get_field_precision("Stock Ledger Entry", "stock_value",
+			get_company_default_currency(self.company))
 
 		self.prev_stock_value = self.previous_sle.stock_value or 0.0
 		self.stock_queue = json.loads(self.previous_sle.stock_queue or "[]")
@@ -107,6 +115,13 @@ class update_entries_after(object):
 		self.build()
 
 	def build(self):
+		# back-dated entry: future entries are replayed to validate negative stock and
+		# update the bin, but written back (with future GL Entries) by a queued job
+		defer = self.defer_future_repost and self.has_future_entries()
+		if defer:
+			current_entries = set([sle.name for sle in self.get_sle_upto_datetime()])
+			self.bulk_update = True
+
 		# includes current entry!
 		entries_to_fix = self.get_sle_after_datetime()
 
@@ -116,8 +131,18 @@ class update_entries_after(object):
 		if self.exceptions:
 			self.raise_exceptions()
 
+		if defer:
+			self.entries_to_update = [sle for sle in self.entries_to_update if sle.name in current_entries]
+
+		if self.entries_to_update:
+			bulk_update_stock_ledger_entries(self.entries_to_update)
+
 		self.update_bin()
 
+		if defer:
+			from erpnext.stock.doctype.repost_item_valuation.repost_item_valuation import queue_repost
+			queue_repost(self.args, self.queue_allow_negative_stock, self.via_landed_cost_voucher)
+
 	def update_bin(self):
 		# update bin
 		bin_name = frappe.db.get_value("Bin", {
@@ -185,8 +210,13 @@ class update_entries_after(object):
 		sle.stock_value = self.stock_value
 		sle.stock_queue = json.dumps(self.stock_queue)
 		sle.stock_value_difference = stock_value_difference
-		sle.doctype="Stock Ledger Entry"
-		frappe.get_doc(sle).db_update()
+
+		if self.bulk_update:
+			# written back in chunks once the whole queue is replayed
+			self.entries_to_update.append(sle)
+		else:
+			sle.doctype="Stock Ledger Entry"
+			frappe.get_doc(sle).db_update()
 
 	def validate_negative_stock(self, sle):
 		"""
@@ -341,6 +371,37 @@ class update_entries_after(object):
 				"item_code": self.args.get("item_code"), "warehouse": self.args.get("warehouse") }),
 			">", "asc", for_update=True)
 
+	def get_sle_upto_datetime(self):
+		"""get Stock Ledger Entries after the previous entry upto the current time-bucket"""
+		return frappe.db.sql("""select *, timestamp(posting_date, posting_time) as "timestamp"
+			from `tabStock Ledger Entry`
+			where item_code = %(item_code)s
+			and warehouse = %(warehouse)s
+			and ifnull(is_cancelled, 'No')='No'
+			and timestamp(posting_date, posting_time) > timestamp(%(from_date)s, %(from_time)s)
+			and timestamp(posting_date, posting_time) <= timestamp(%(posting_date)s, %(posting_time)s)
+			order by timestamp(posting_date, posting_time) asc, name asc
+			for update""", {
+				"item_code": self.item_code,
+				"warehouse": self.warehouse,
+				"from_date": self.previous_sle.get("posting_date") or "1900-01-01",
+				"from_time": self.previous_sle.get("posting_time") or "00:00",
+				"posting_date": self.args.get("posting_date"),
+				"posting_time": self.args.get("posting_time")
+			}, as_dict=1)
+
+	def has_future_entries(self):
+		"""check if there are Stock Ledger Entries after the current time-bucket"""
+		if not (self.args.get("posting_date") and self.args.get("posting_time")):
+			return False
+
+		return frappe.db.sql("""select name from `tabStock Ledger Entry`
+			where item_code = %(item_code)s
+			and warehouse = %(warehouse)s
+			and ifnull(is_cancelled, 'No')='No'
+			and timestamp(posting_date, posting_time) > timestamp(%(posting_date)s, %(posting_time)s)
+			limit 1""", self.args)
+
 	def raise_exceptions(self):
 		deficiency = min(e["diff"] for e in self.exceptions)
 
@@ -362,6 +423,28 @@ class update_entries_after(object):
 		else:
 			raise NegativeStockError, msg
 
+def bulk_update_stock_ledger_entries(entries, chunk_size=500):
+	"""Write back reposted values of Stock Ledger Entries using one multi-row
+		`update ... case` statement per chunk instead of one update per entry"""
+	fields = ("qty_after_transaction", "valuation_rate", "stock_value",
+		"stock_queue", "stock_value_difference")
+
+	for i in xrange(0, len(entries), chunk_size):
+		chunk = entries[i:i + chunk_size]
+		when_clause = " ".join(["when %s then %s"] * len(chunk))
+
+		set_clauses, values = [], []
+		for fieldname in fields:
+			set_clauses.append("`{0}` = case name {1} end".format(fieldname, when_clause))
+			for sle in chunk:
+				values.extend([sle.name, sle.get(fieldname)])
+
+		values.extend([sle.name for sle in chunk])
+
+		frappe.db.sql("""update `tabStock Ledger Entry` set {0}
+			where name in ({1})""".format(", ".join(set_clauses), ", ".join(["%s"] * len(chunk))),
+			tuple(values))
+
 def get_previous_sle(args, for_update=False):
 	"""
 		get the last sle on or before the current time-bucket,
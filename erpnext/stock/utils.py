@@ -5,7 +5,8 @@ from __future__ import unicode_literals
 import frappe
 from frappe import _
 import json
-from frappe.utils import flt, cstr, nowdate, nowtime
+from frappe.utils import flt, cstr, cint, nowdate, nowtime
+from erpnext.utilities.tree_cache import is_group, get_descendants
 
 class InvalidWarehouseCompany(frappe.ValidationError): pass
 
@@ -15,15 +16,10 @@ def get_stock_value_on(warehouse=None, posting_date=None, item_code=None):
 	values, condition = [posting_date], ""
 
 	if warehouse:
-		
-		lft, rgt, is_group = frappe.db.get_value("Warehouse", warehouse, ["lft", "rgt", "is_group"])
-		
-		if is_group:
-			values.extend([lft, rgt])
-			condition += "and exists (\
-				select name from `tabWarehouse` wh where wh.name = sle.warehouse\
-				and wh.lft >= %s and wh.rgt <= %s)"
-		
+		if is_group("Warehouse", warehouse):
+			values.append(tuple(get_descendants("Warehouse", warehouse)))
+			condition += " AND warehouse in %s"
+
 		else:
 			values.append(warehouse)
 			condition += " AND warehouse = %s"
@@ -98,6 +94,12 @@ def update_bin(args, allow_negative_stock=False, via_landed_cost_voucher=False):
 	else:
 		frappe.msgprint(_("Item {0} ignored since it is not a stock item").format(args.get("item_code")))
 
+def repost_future_in_background():
+	"""Future Stock Ledger and GL Entries are reposted by a queued job if set in Stock Settings,
+	or while documents are being posted in bulk (`frappe.flags.defer_future_repost`)"""
+	return frappe.flags.defer_future_repost or cint(frappe.db.get_single_value("Stock Settings",
+		"repost_future_entries_in_background"))
+
 @frappe.whitelist()
 def get_incoming_rate(args):
 	"""Get Incoming Rate based on valuation method"""
@@ -189,6 +191,6 @@ def validate_warehouse_company(warehouse, company):
 			InvalidWarehouseCompany)
 
 def is_group_warehouse(warehouse):
-	if frappe.db.get_value("Warehouse", warehouse, "is_group"):
+	if is_group("Warehouse", warehouse):
 		frappe.throw(_("Group node warehouse is not allowed to select for transactions"))
 	
\ No newline at end of file
@@ -0,0 +1,36 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Micro-benchmarks for hot transaction paths.
+
+Run them against a site with test records, e.g.
+
+	bench --site test_site execute erpnext.tests.benchmarks.stock_ledger.run
+
+Each benchmark rolls back whatever it writes.'''
+
+from __future__ import unicode_literals, print_function
+import time
+import frappe
+
+class Timer(object):
+	'''Context manager that records the wall clock time spent inside it'''
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *args):
+		self.elapsed = time.time() - self.start
+
+def timed(fn, *args, **kwargs):
+	'''Call `fn` and return `(elapsed seconds, result)`, rolling back any writes'''
+	with Timer() as t:
+		result = fn(*args, **kwargs)
+	frappe.db.rollback()
+	return t.elapsed, result
+
+def report(title, rows):
+	'''Print a list of `(label, value)` pairs'''
+	print(title)
+	for label, value in rows:
+		print("  {0:<40} {1}".format(label, value))
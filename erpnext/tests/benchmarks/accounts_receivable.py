@@ -0,0 +1,97 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import nowdate, add_days, flt, getdate
+from erpnext.accounts.general_ledger import insert_gl_entries
+from erpnext.accounts.report.accounts_receivable.accounts_receivable import ReceivablePayableReport
+from erpnext.tests.benchmarks import Timer, report
+
+def make_dataset(invoices, customer="_Test Customer", company="_Test Company",
+	debtors="Debtors - _TC", income="Sales - _TC"):
+	'''Post GL Entries for `invoices` invoices over the last year. Every second invoice is
+	part paid, every third fully paid and every tenth customer receipt is an advance.'''
+	common = {
+		"company": company,
+		"party_type": "Customer",
+		"party": customer,
+		"account": debtors,
+		"account_currency": frappe.db.get_value("Company", company, "default_currency"),
+		"remarks": "Benchmark",
+		"is_opening": "No"
+	}
+
+	gl_map = []
+	for i in xrange(invoices):
+		posting_date = add_days(nowdate(), -(i % 365))
+		invoice = "_Bench-SINV-{0}".format(i)
+
+		gl_map.append(frappe._dict(common, posting_date=posting_date, voucher_type="Sales Invoice",
+			voucher_no=invoice, against_voucher_type="Sales Invoice", against_voucher=invoice,
+			debit=100, debit_in_account_currency=100, against=income))
+
+		paid = 100 if i % 3 == 0 else (40 if i % 2 == 0 else 0)
+		if paid:
+			gl_map.append(frappe._dict(common, posting_date=add_days(posting_date, 10),
+				voucher_type="Journal Entry", voucher_no="_Bench-JV-{0}".format(i),
+				against_voucher_type="Sales Invoice", against_voucher=invoice,
+				credit=paid, credit_in_account_currency=paid, against=income))
+
+		if i % 10 == 0:
+			gl_map.append(frappe._dict(common, posting_date=posting_date, voucher_type="Journal Entry",
+				voucher_no="_Bench-ADV-{0}".format(i), credit=25, credit_in_account_currency=25,
+				against=income))
+
+	for start in xrange(0, len(gl_map), 5000):
+		insert_gl_entries(gl_map[start:start + 5000])
+
+	return len(gl_map)
+
+class ScanReport(ReceivablePayableReport):
+	'''Reference: look future vouchers up in a list and walk each voucher's entries'''
+	def get_entries_after(self, report_date, party_type):
+		return list(set([(e.voucher_type, e.voucher_no) for e in self.get_gl_entries(party_type)
+			if getdate(e.posting_date) > report_date]))
+
+	def get_outstanding_amount(self, gle, report_date, dr_or_cr):
+		payment_amount = 0.0
+		for e in self.get_gl_entries_for(gle.party, gle.party_type, gle.voucher_type, gle.voucher_no):
+			if getdate(e.posting_date) <= report_date and e.name!=gle.name:
+				payment_amount += (flt(e.credit if gle.party_type == "Customer" else e.debit) - flt(e.get(dr_or_cr)))
+
+		return flt(gle.get(dr_or_cr)) - flt(gle.credit if gle.party_type == "Customer" else gle.debit) - payment_amount
+
+	def get_gl_entries_for(self, party, party_type, against_voucher_type, against_voucher):
+		if not hasattr(self, "gl_entries_map"):
+			self.gl_entries_map = {}
+			for gle in self.get_gl_entries(party_type):
+				if gle.against_voucher_type and gle.against_voucher:
+					self.gl_entries_map.setdefault(gle.party, {})\
+						.setdefault(gle.against_voucher_type, {})\
+						.setdefault(gle.against_voucher, [])\
+						.append(gle)
+
+		return self.gl_entries_map.get(party, {})\
+			.get(against_voucher_type, {})\
+			.get(against_voucher, [])
+
+def run(invoices=20000, company="_Test Company"):
+	'''Time the Accounts Receivable report against the reference and check both agree'''
+	invoices = int(invoices)
+	entries = make_dataset(invoices, company=company)
+
+	filters = {"company": company, "report_date": nowdate(), "ageing_based_on": "Posting Date"}
+	args = {"party_type": "Customer", "naming_by": ["Selling Settings", "cust_master_name"]}
+
+	results, data = [], {}
+	for label, report_class in (("list lookups", ScanReport), ("grouped payments", ReceivablePayableReport)):
+		with Timer() as t:
+			data[label] = report_class(filters).run(args)[1]
+		results.append((label, "{0:.3f}s".format(t.elapsed)))
+
+	frappe.db.rollback()
+
+	assert data["list lookups"] == data["grouped payments"], "report rows differ"
+	report("Accounts Receivable over {0} invoices ({1} GL entries, {2} open rows)".format(invoices,
+		entries, len(data["grouped payments"])), results)
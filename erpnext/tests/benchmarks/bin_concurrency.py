@@ -0,0 +1,105 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Stock Entry submits per second from parallel workers, with Bins updated by a full
+document save (as before) and by an atomic delta update.
+
+Every worker commits, so run it on a test site. Entries made are deleted and the Bins
+reposted at the end.'''
+
+from __future__ import unicode_literals
+import multiprocessing
+import frappe
+from frappe.utils import flt
+from erpnext.stock.doctype.bin.bin import Bin, update_item_projected_qty
+from erpnext.tests.benchmarks import Timer, report
+
+warehouses = ["_Test Warehouse - _TC", "_Test Warehouse 1 - _TC", "_Test Warehouse 2 - _TC",
+	"_Test Rejected Warehouse - _TC"]
+
+def reference_update_qty(self, args):
+	'''Bin update by document save, followed by the Item total'''
+	self.actual_qty = flt(self.actual_qty) + flt(args.get("actual_qty"))
+	for field in ("ordered_qty", "reserved_qty", "indented_qty", "planned_qty"):
+		self.set(field, flt(self.get(field)) + flt(args.get(field)))
+
+	self.set_projected_qty()
+	self.save()
+	update_item_projected_qty(self.item_code)
+
+def worker(site, sites_path, delta, warehouse, count, results):
+	from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+
+	frappe.init(site=site, sites_path=sites_path)
+	frappe.connect()
+	try:
+		if not delta:
+			Bin.update_qty = reference_update_qty
+
+		names = []
+		for i in xrange(count):
+			se = make_stock_entry(item_code="_Test Item", target=warehouse, qty=1, basic_rate=100)
+			frappe.db.commit()
+			names.append(se.name)
+
+		results.put(names)
+	finally:
+		frappe.destroy()
+
+def run_workers(site, sites_path, delta, workers, count):
+	results = multiprocessing.Queue()
+	processes = [multiprocessing.Process(target=worker, args=(site, sites_path, delta,
+		warehouses[i % len(warehouses)], count, results)) for i in xrange(workers)]
+
+	with Timer() as t:
+		for p in processes:
+			p.start()
+
+		names = []
+		for p in processes:
+			names.extend(results.get())
+
+		for p in processes:
+			p.join()
+
+	return t.elapsed, names
+
+def cleanup(names):
+	from erpnext.stock.stock_balance import repost_stock
+
+	if names:
+		names = tuple(names)
+		for doctype in ("Stock Ledger Entry", "GL Entry"):
+			frappe.db.sql("""delete from `tab{0}` where voucher_type='Stock Entry'
+				and voucher_no in %s""".format(doctype), (names,))
+		frappe.db.sql("""delete from `tabStock Entry Detail` where parent in %s""", (names,))
+		frappe.db.sql("""delete from `tabStock Entry` where name in %s""", (names,))
+
+	for warehouse in warehouses:
+		repost_stock("_Test Item", warehouse)
+	update_item_projected_qty("_Test Item")
+	frappe.db.commit()
+
+def run(workers=4, count=50):
+	'''Compare Stock Entry submits per second with Bin saves and Bin delta updates'''
+	workers, count = int(workers), int(count)
+	site, sites_path = frappe.local.site, frappe.local.sites_path
+
+	frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 1)
+	frappe.db.commit()
+
+	# workers open their own connections
+	frappe.destroy()
+
+	results, names = [], []
+	try:
+		for label, delta in (("document save", False), ("delta update", True)):
+			elapsed, created = run_workers(site, sites_path, delta, workers, count)
+			names.extend(created)
+			results.append((label, "{0:.1f} submits/sec".format(len(created) / elapsed)))
+	finally:
+		frappe.init(site=site, sites_path=sites_path)
+		frappe.connect()
+		cleanup(names)
+
+	report("Stock Entry submits with {0} parallel workers".format(workers), results)
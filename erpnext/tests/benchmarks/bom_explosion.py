@@ -0,0 +1,132 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Exploded items of a generated BOM forest, updated BOM by BOM from the stored
+explosion of each sub-assembly (as before) and by the BOM graph in one pass.
+
+Every BOM has `items_per_bom` rows. BOMs above the last level use two sub-assemblies
+from the level below, so BOMs of the first level are roots of `levels` deep trees. The reference
+path opens every BOM and is slow, expect several minutes for 50k nodes.'''
+
+from __future__ import unicode_literals
+import random
+from operator import itemgetter
+import frappe
+from frappe.utils import flt, now
+from erpnext.manufacturing.doctype.bom.bom_explosion import BOMGraph, update_exploded_items
+from erpnext.tests.benchmarks import Timer, report
+
+def reference_update_exploded_items(bom_name):
+	'''Explosion of one BOM as before, reading the explosion of each sub-assembly BOM
+	and inserting one row at a time'''
+	bom = frappe.get_doc("BOM", bom_name)
+	bom.cur_exploded_items = {}
+
+	def add(args):
+		if bom.cur_exploded_items.get(args.item_code):
+			bom.cur_exploded_items[args.item_code]["qty"] += args.qty
+		else:
+			bom.cur_exploded_items[args.item_code] = args
+
+	for d in bom.get("items"):
+		if d.bom_no:
+			for c in frappe.db.sql("""select bom_item.item_code, bom_item.item_name, bom_item.description,
+				bom_item.stock_uom, bom_item.qty, bom_item.rate,
+				bom_item.qty / ifnull(bom.quantity, 1) as qty_consumed_per_unit
+				from `tabBOM Explosion Item` bom_item, tabBOM bom
+				where bom_item.parent = bom.name and bom.name = %s and bom.docstatus = 1""", d.bom_no, as_dict=1):
+				add(frappe._dict({"item_code": c.item_code, "item_name": c.item_name,
+					"description": c.description, "stock_uom": c.stock_uom,
+					"qty": c.qty_consumed_per_unit * d.qty, "rate": flt(c.rate)}))
+		else:
+			add(frappe._dict({"item_code": d.item_code, "item_name": d.item_name,
+				"description": d.description, "image": d.image, "stock_uom": d.stock_uom,
+				"qty": flt(d.qty), "rate": flt(d.rate)}))
+
+	frappe.db.sql("""delete from `tabBOM Explosion Item` where parent=%s""", bom.name)
+	bom.set("exploded_items", [])
+	for d in sorted(bom.cur_exploded_items, key=itemgetter(0)):
+		ch = bom.append("exploded_items", {})
+		for i in bom.cur_exploded_items[d].keys():
+			ch.set(i, bom.cur_exploded_items[d][i])
+		ch.amount = flt(ch.qty) * flt(ch.rate)
+		ch.qty_consumed_per_unit = flt(ch.qty) / flt(bom.quantity)
+		ch.docstatus = bom.docstatus
+		ch.db_insert()
+
+def bulk_insert(doctype, columns, rows, chunk_size=500):
+	for i in xrange(0, len(rows), chunk_size):
+		chunk = rows[i:i + chunk_size]
+		frappe.db.sql("""insert into `tab{0}` ({1}) values {2}""".format(doctype,
+			", ".join("`{0}`".format(c) for c in columns),
+			", ".join(["({0})".format(", ".join(["%s"] * len(columns)))] * len(chunk))),
+			tuple(v for row in chunk for v in row))
+
+def make_bom_forest(levels, nodes, items_per_bom=5, raw_materials=40):
+	'''Insert submitted BOMs with about `nodes` BOM Items over `levels` levels.
+	Returns BOM names, lowest level first'''
+	rand = random.Random(levels * nodes)
+	per_level = max(nodes // (levels * items_per_bom), 2)
+	timestamp, user = now(), frappe.session.user
+
+	names = [["BENCH-BOM-{0}-{1}".format(level, i) for i in xrange(per_level)]
+		for level in xrange(levels)]
+
+	boms, items = [], []
+	for level in xrange(levels):
+		for i, name in enumerate(names[level]):
+			boms.append([name, timestamp, timestamp, user, user, 1, "BENCH-SA-{0}-{1}".format(level, i),
+				1, 1, 0, "Valuation Rate", 0])
+
+			sub_assemblies = rand.sample(xrange(per_level), 2) if level < levels - 1 else []
+			for idx in xrange(items_per_bom):
+				if idx < len(sub_assemblies):
+					j = sub_assemblies[idx]
+					item_code, bom_no = "BENCH-SA-{0}-{1}".format(level + 1, j), names[level + 1][j]
+				else:
+					item_code, bom_no = "BENCH-RM-{0}".format(rand.randrange(raw_materials)), None
+
+				items.append([frappe.generate_hash(length=10), timestamp, timestamp, user, user, 1,
+					name, "items", "BOM", idx + 1, item_code, item_code, item_code, "Nos",
+					rand.randint(1, 2), rand.randint(1, 100), bom_no])
+
+	bulk_insert("BOM", ("name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"item", "quantity", "is_active", "is_default", "rm_cost_as_per", "with_operations"), boms)
+	bulk_insert("BOM Item", ("name", "creation", "modified", "owner", "modified_by", "docstatus",
+		"parent", "parentfield", "parenttype", "idx", "item_code", "item_name", "description",
+		"stock_uom", "qty", "rate", "bom_no"), items)
+
+	return [name for level in reversed(names) for name in level]
+
+def get_explosions():
+	return dict(((d.parent, d.item_code), (flt(d.qty, 4), flt(d.rate, 4), flt(d.amount, 4)))
+		for d in frappe.db.sql("""select parent, item_code, qty, rate, amount
+			from `tabBOM Explosion Item` where parent like 'BENCH-BOM-%'""", as_dict=1))
+
+def run(levels=10, nodes=50000):
+	'''Compare updating exploded items BOM by BOM and by the BOM graph'''
+	levels, nodes = int(levels), int(nodes)
+
+	try:
+		boms = make_bom_forest(levels, nodes)
+
+		with Timer() as reference_timer:
+			for bom in boms:
+				reference_update_exploded_items(bom)
+		reference = get_explosions()
+
+		frappe.db.sql("""delete from `tabBOM Explosion Item` where parent like 'BENCH-BOM-%'""")
+
+		with Timer() as graph_timer:
+			graph = BOMGraph()
+			update_exploded_items(boms, graph)
+		exploded = get_explosions()
+	finally:
+		frappe.db.rollback()
+
+	assert reference == exploded, "Exploded items differ"
+	report("Exploding {0} BOMs over {1} levels ({2} explosion rows)".format(len(boms), levels,
+		len(exploded)), [
+			("BOM by BOM", "{0:.2f}s".format(reference_timer.elapsed)),
+			("BOM graph", "{0:.2f}s".format(graph_timer.elapsed))
+		])
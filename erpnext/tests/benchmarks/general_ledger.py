@@ -0,0 +1,105 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+import copy
+from frappe.utils import nowdate, flt, cstr
+from erpnext.accounts.general_ledger import (process_gl_map, round_off_debit_credit,
+	make_entry, make_entries_in_bulk, validate_expense_against_budget, merge_similar_entries)
+from erpnext.tests.benchmarks import Timer, timed, report
+
+def make_gl_map(lines, company="_Test Company", voucher_no="_Bench-JV"):
+	'''A balanced gl_map with `lines` income rows and one bank row'''
+	common = {
+		"company": company,
+		"posting_date": nowdate(),
+		"voucher_type": "Journal Entry",
+		"voucher_no": voucher_no,
+		"remarks": "Benchmark",
+		"is_opening": "No"
+	}
+
+	gl_map = []
+	for i in xrange(lines):
+		gl_map.append(frappe._dict(common, account="Sales - _TC", cost_center="_Test Cost Center - _TC",
+			credit=i + 1, credit_in_account_currency=i + 1, against="_Test Bank - _TC"))
+
+	total = sum(d.credit for d in gl_map)
+	gl_map.append(frappe._dict(common, account="_Test Bank - _TC", debit=total,
+		debit_in_account_currency=total, against="Sales - _TC"))
+
+	gl_map = process_gl_map(gl_map, merge_entries=False)
+	round_off_debit_credit(gl_map)
+	return gl_map
+
+def post_per_row(gl_map):
+	for entry in gl_map:
+		make_entry(entry, False, 'Yes')
+		validate_expense_against_budget(entry)
+
+def post_in_bulk(gl_map):
+	make_entries_in_bulk(gl_map, False, 'Yes')
+
+def run(lines=200, vouchers=10):
+	'''Report ms per voucher for posting `vouchers` vouchers of `lines` lines each'''
+	lines, vouchers = int(lines), int(vouchers)
+
+	results = []
+	for label, post in (("GL Entry documents", post_per_row), ("bulk insert", post_in_bulk)):
+		elapsed = 0
+		for i in xrange(vouchers):
+			elapsed += timed(post, make_gl_map(lines, voucher_no="_Bench-JV-{0}".format(i)))[0]
+		results.append((label, "{0:.1f} ms per voucher".format(elapsed * 1000 / vouchers)))
+
+	report("Posting {0} vouchers of {1} lines".format(vouchers, lines + 1), results)
+
+def make_unmerged_gl_map(lines, distinct=100):
+	'''A gl_map of `lines` rows spread over `distinct` account / party / cost center heads'''
+	gl_map = []
+	for i in xrange(lines):
+		gl_map.append(frappe._dict({
+			"account": "Account {0}".format(i % distinct),
+			"party_type": "Customer" if i % 3 else None,
+			"party": "Customer {0}".format(i % 7) if i % 3 else None,
+			"cost_center": "Cost Center {0}".format(i % 5),
+			"debit": i if i % 2 else 0,
+			"credit": 0 if i % 2 else i,
+			"debit_in_account_currency": i if i % 2 else 0,
+			"credit_in_account_currency": 0 if i % 2 else i
+		}))
+	return gl_map
+
+def merge_by_scan(gl_map):
+	'''Reference: scan the merged entries for every entry'''
+	merged_gl_map = []
+	for entry in gl_map:
+		same_head = None
+		for e in merged_gl_map:
+			if e.account == entry.account \
+				and all(cstr(e.get(f)) == cstr(entry.get(f)) for f in ("party_type", "party",
+					"against_voucher", "against_voucher_type", "cost_center", "project")):
+				same_head = e
+				break
+
+		if same_head:
+			for f in ("debit", "credit", "debit_in_account_currency", "credit_in_account_currency"):
+				same_head[f] = flt(same_head[f]) + flt(entry[f])
+		else:
+			merged_gl_map.append(entry)
+
+	return filter(lambda x: flt(x.debit, 9)!=0 or flt(x.credit, 9)!=0, merged_gl_map)
+
+def run_merge(lines=10000, distinct=2000):
+	'''Time merge_similar_entries against a scan of the merged list and check both agree'''
+	lines, distinct = int(lines), int(distinct)
+	gl_map = make_unmerged_gl_map(lines, distinct)
+
+	results, merged = [], {}
+	for label, merge in (("scan merged list", merge_by_scan), ("keyed merge", merge_similar_entries)):
+		with Timer() as t:
+			merged[label] = merge(copy.deepcopy(gl_map))
+		results.append((label, "{0:.3f}s".format(t.elapsed)))
+
+	assert merged["scan merged list"] == merged["keyed merge"], "merged gl_maps differ"
+	report("Merging {0} gl entries into {1} heads".format(lines, len(merged["keyed merge"])), results)
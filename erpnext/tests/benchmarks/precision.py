@@ -0,0 +1,52 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from erpnext.utilities.precision import get_lookup_stats, clear_precision_registry
+from erpnext.tests.benchmarks import Timer, report
+
+def make_invoice(lines):
+	items = frappe.db.sql_list("""select name from tabItem
+		where has_variants=0 and is_stock_item=0 and disabled=0 limit 50""")
+
+	si = frappe.get_doc({
+		"doctype": "Sales Invoice",
+		"company": "_Test Company",
+		"customer": "_Test Customer",
+		"debit_to": "Debtors - _TC",
+		"currency": "INR",
+		"conversion_rate": 1,
+		"items": [{
+			"item_code": items[i % len(items)],
+			"qty": 1 + i % 5,
+			"rate": 100 + i,
+			"income_account": "Sales - _TC",
+			"cost_center": "_Test Cost Center - _TC"
+		} for i in xrange(lines)],
+		"taxes": [{"charge_type": "On Net Total", "account_head": "_Test Account VAT - _TC",
+			"cost_center": "_Test Cost Center - _TC", "description": "VAT", "rate": 10}]
+	})
+	si.flags.ignore_permissions = True
+	return si
+
+def run(lines=100, invoices=5):
+	'''Report precision / currency lookups served by the registry per Sales Invoice submit.
+	Lookups served include those `doc.precision` would serve from its own per document cache'''
+	lines, invoices = int(lines), int(invoices)
+	clear_precision_registry()
+
+	results = []
+	for i in xrange(invoices):
+		si = make_invoice(lines)
+		get_lookup_stats(reset=True)
+		with Timer() as t:
+			si.insert()
+			si.submit()
+
+		stats = get_lookup_stats(reset=True)
+		results.append(("invoice {0}".format(i + 1), "{0} served by the registry, {1} computed, {2:.0f} ms".format(
+			stats["hits"], stats["misses"], t.elapsed * 1000)))
+
+	frappe.db.rollback()
+	report("Submitting Sales Invoices with {0} lines".format(lines), results)
@@ -0,0 +1,98 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import random
+import frappe
+from frappe.utils import nowdate
+from erpnext.accounts.doctype.pricing_rule.pricing_rule import (get_pricing_rules,
+	get_pricing_rules_from_index, filter_pricing_rules, clear_pricing_rule_index,
+	MultiplePricingRuleConflict)
+from erpnext.tests.benchmarks import Timer, report
+
+def make_pricing_rules(count, seed=1):
+	'''Insert `count` selling rules on random items, item groups and brands'''
+	rand = random.Random(seed)
+	items = frappe.db.sql_list("select name from tabItem where has_variants=0 limit 500")
+	item_groups = frappe.db.sql_list("select name from `tabItem Group`")
+	brands = frappe.db.sql_list("select name from tabBrand") or [None]
+
+	applicable_for = [{}, {"applicable_for": "Customer", "customer": "_Test Customer"},
+		{"applicable_for": "Customer Group", "customer_group": "_Test Customer Group"},
+		{"applicable_for": "Territory", "territory": "_Test Territory"}]
+
+	for i in xrange(count):
+		apply_on = rand.choice([("Item Code", "item_code", items), ("Item Group", "item_group", item_groups),
+			("Brand", "brand", brands)])
+		rule = frappe.get_doc(dict({
+			"doctype": "Pricing Rule",
+			"title": "_Bench Pricing Rule {0}".format(i),
+			"apply_on": apply_on[0],
+			apply_on[1]: rand.choice(apply_on[2]),
+			"selling": 1,
+			"priority": str(rand.randint(1, 20)),
+			"price_or_discount": "Discount Percentage",
+			"discount_percentage": rand.randint(1, 30)
+		}, **rand.choice(applicable_for)))
+		rule.flags.ignore_permissions = True
+		rule.insert()
+
+def make_lines(count, customer="_Test Customer", company="_Test Company"):
+	'''Item lines with the arguments `get_pricing_rule_for_item` would have filled in'''
+	items = frappe.db.sql("""select name, item_group, brand, variant_of from tabItem
+		where has_variants=0 limit 500""", as_dict=1)
+	customer_group, territory = frappe.db.get_value("Customer", customer, ["customer_group", "territory"])
+
+	lines = []
+	for i in xrange(count):
+		item = items[i % len(items)]
+		lines.append(frappe._dict({
+			"transaction_type": "selling",
+			"item_code": item.name,
+			"item_group": item.item_group,
+			"brand": item.brand,
+			"variant_of": item.variant_of,
+			"customer": customer,
+			"customer_group": customer_group,
+			"territory": territory,
+			"company": company,
+			"price_list": "_Test Price List",
+			"transaction_date": nowdate(),
+			"qty": 1
+		}))
+	return lines
+
+def resolve(lines, get_rules):
+	out = []
+	for args in lines:
+		args = frappe._dict(args)
+		try:
+			pricing_rule = filter_pricing_rules(args, get_rules(args))
+			out.append(pricing_rule.name if pricing_rule else None)
+		except MultiplePricingRuleConflict:
+			out.append("conflict")
+
+	frappe.local.message_log = []
+	return out
+
+def run(rules=1000, lines=500):
+	'''Report per line pricing rule resolution with a query per line and with the cached index'''
+	rules, lines = int(rules), int(lines)
+	make_pricing_rules(rules)
+	clear_pricing_rule_index()
+	lines = make_lines(lines)
+
+	# build the index once so that only lookups are timed
+	get_pricing_rules_from_index(frappe._dict(lines[0]))
+
+	results, resolved = [], {}
+	for label, get_rules in (("query per line", get_pricing_rules), ("cached index", get_pricing_rules_from_index)):
+		with Timer() as t:
+			resolved[label] = resolve(lines, get_rules)
+		results.append((label, "{0:.2f} ms per line".format(t.elapsed * 1000 / len(lines))))
+
+	frappe.db.rollback()
+	clear_pricing_rule_index()
+
+	assert resolved["query per line"] == resolved["cached index"], "resolved pricing rules differ"
+	report("Resolving {0} lines against {1} pricing rules".format(len(lines), rules), results)
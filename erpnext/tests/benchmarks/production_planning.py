@@ -0,0 +1,131 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Raw materials to request for Sales Order demand on a generated BOM forest, computed
+with one query per BOM and nested lists (as before) and with the MRP engine.
+
+The demand is one Production Planning Tool row per Sales Order, for a random BOM of
+the first level. Requested qty may be split differently between Sales Orders, so
+the totals per item are compared.'''
+
+from __future__ import unicode_literals
+import random
+import frappe
+from frappe.utils import flt
+from erpnext.manufacturing.doctype.bom.bom_explosion import update_exploded_items
+from erpnext.tests.benchmarks import Timer, report
+from erpnext.tests.benchmarks.bom_explosion import make_bom_forest, bulk_insert
+
+warehouse = "_Test Warehouse - _TC"
+
+def reference_get_raw_materials(self):
+	'''`get_raw_materials` as before, one grouped query per BOM over stored explosions'''
+	bom_dict = {}
+	for d in self.get("items"):
+		bom_dict.setdefault(d.bom_no, []).append([d.sales_order, flt(d.planned_qty)])
+
+	self.item_dict = {}
+	for bom, so_wise_qty in bom_dict.items():
+		bom_wise_item_details = {}
+		for d in frappe.db.sql("""select fb.item_code,
+			ifnull(sum(fb.qty/ifnull(bom.quantity, 1)), 0) as qty,
+			fb.description, fb.stock_uom, item.min_order_qty
+			from `tabBOM Explosion Item` fb, `tabBOM` bom, `tabItem` item
+			where bom.name = fb.parent and item.name = fb.item_code
+			and (item.is_sub_contracted_item = 0 or ifnull(item.default_bom, "")="")
+			and item.is_stock_item = 1
+			and fb.docstatus<2 and bom.name=%s
+			group by fb.item_code, fb.stock_uom""", bom, as_dict=1):
+				bom_wise_item_details.setdefault(d.item_code, d)
+
+		for item, item_details in bom_wise_item_details.items():
+			for so_qty in so_wise_qty:
+				self.item_dict.setdefault(item, []).append([flt(item_details.qty) * so_qty[1],
+					item_details.description, item_details.stock_uom, item_details.min_order_qty, so_qty[0]])
+
+def reference_get_requested_items(self):
+	'''Total qty to request per item as before, netted against projected qty'''
+	items = self.item_dict.keys()
+	item_projected_qty = dict(frappe.db.sql("""select item_code, sum(projected_qty)
+		from `tabBin` where item_code in (%s) and warehouse=%s group by item_code""" %
+		(", ".join(["%s"]*len(items)), '%s'), tuple(items + [self.purchase_request_for_warehouse])))
+
+	requested = {}
+	for item, so_item_qty in self.item_dict.items():
+		total_qty = sum([flt(d[0]) for d in so_item_qty])
+		requested_qty = 0
+		if total_qty > item_projected_qty.get(item, 0):
+			requested_qty = total_qty - flt(item_projected_qty.get(item))
+
+		if requested_qty and requested_qty < flt(so_item_qty[0][3]):
+			requested_qty = flt(so_item_qty[0][3])
+
+		if requested_qty:
+			requested[item] = flt(requested_qty, 4)
+
+	return requested
+
+def make_raw_materials(raw_materials=40):
+	'''Items and Bins for the raw materials of the forest, some with negative projected qty'''
+	rand = random.Random(raw_materials)
+	items, bins = [], []
+	for i in xrange(raw_materials):
+		item_code = "BENCH-RM-{0}".format(i)
+		items.append([item_code, item_code, item_code, item_code, "Nos", "_Test Item Group",
+			1, 0, rand.choice([0, 0, 500, 5000])])
+		bins.append([frappe.generate_hash(length=10), item_code, warehouse,
+			rand.randint(-1000, 20000)])
+
+	bulk_insert("Item", ("name", "item_code", "item_name", "description", "stock_uom", "item_group",
+		"is_stock_item", "is_sub_contracted_item", "min_order_qty"), items)
+	bulk_insert("Bin", ("name", "item_code", "warehouse", "projected_qty"), bins)
+
+def make_planning_tool(top_level_boms, sales_orders):
+	rand = random.Random(sales_orders)
+	ppt = frappe.get_doc({
+		"doctype": "Production Planning Tool",
+		"company": "_Test Company",
+		"get_items_from": "Sales Order",
+		"use_multi_level_bom": 1,
+		"purchase_request_for_warehouse": warehouse,
+		"items": [{
+			"item_code": "BENCH-FG",
+			"bom_no": rand.choice(top_level_boms),
+			"sales_order": "BENCH-SO-{0}".format(i),
+			"planned_qty": rand.randint(1, 20),
+			"warehouse": warehouse
+		} for i in xrange(sales_orders)]
+	})
+	return ppt
+
+def run(sales_orders=2000, levels=10, nodes=50000):
+	'''Compare raw material planning for Sales Order demand, per BOM queries vs MRP engine'''
+	sales_orders, levels, nodes = int(sales_orders), int(levels), int(nodes)
+
+	try:
+		boms = make_bom_forest(levels, nodes)
+		update_exploded_items(boms)
+		make_raw_materials()
+
+		per_level = len(boms) // levels
+		ppt = make_planning_tool(boms[-per_level:], sales_orders)
+
+		with Timer() as reference_timer:
+			reference_get_raw_materials(ppt)
+			reference = reference_get_requested_items(ppt)
+
+		with Timer() as mrp_timer:
+			ppt.get_raw_materials()
+			requested = {}
+			for d in ppt.get_requested_items():
+				requested[d.item_code] = requested.get(d.item_code, 0) + d.qty
+			requested = dict((item_code, flt(qty, 4)) for item_code, qty in requested.items())
+	finally:
+		frappe.db.rollback()
+
+	assert reference == requested, "Requested qty differs"
+	report("Planning raw materials for {0} Sales Orders over {1} BOM levels".format(sales_orders,
+		levels), [
+			("per BOM queries", "{0:.2f}s".format(reference_timer.elapsed)),
+			("MRP engine", "{0:.2f}s".format(mrp_timer.elapsed))
+		])
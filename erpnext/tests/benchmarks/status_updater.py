@@ -0,0 +1,156 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import types
+import frappe
+from frappe.utils import flt
+from erpnext.controllers.status_updater import notify_status
+from erpnext.tests.benchmarks import Timer, report
+
+def reference_update_qty(self, update_modified=True):
+	'''Row by row `update_qty`, one correlated subquery per source row and per target parent'''
+	for args in self.status_updater:
+		args['cond'] = (' or parent="%s"' if self.docstatus == 1 else ' and parent!="%s"') % self.name
+
+		for d in self.get_all_children():
+			if d.doctype != args['source_dt'] or not d.get(args['join_field']):
+				continue
+
+			self._update_modified(args, update_modified)
+			args['detail_id'] = d.get(args['join_field'])
+			args['second_source_condition'] = ""
+			if args.get('second_source_dt') and args.get('second_source_field') \
+					and args.get('second_join_field'):
+				args['second_source_condition'] = """ + ifnull((select sum(%(second_source_field)s)
+					from `tab%(second_source_dt)s`
+					where `%(second_join_field)s`="%(detail_id)s"
+					and (`tab%(second_source_dt)s`.docstatus=1) %(second_source_extra_cond)s), 0) """ \
+					% dict(args, second_source_extra_cond=args.get("second_source_extra_cond") or "")
+
+			frappe.db.sql("""update `tab%(target_dt)s`
+				set %(target_field)s = (
+					(select ifnull(sum(%(source_field)s), 0)
+						from `tab%(source_dt)s` where `%(join_field)s`="%(detail_id)s"
+						and (docstatus=1 %(cond)s) %(extra_cond)s)
+					%(second_source_condition)s
+				)
+				%(update_modified)s
+				where name='%(detail_id)s'""" % dict(args, extra_cond=args.get("extra_cond") or ""))
+
+		if "percent_join_field" not in args:
+			continue
+
+		for name in set([d.get(args['percent_join_field'])
+				for d in self.get_all_children(args['source_dt'])]):
+			if not name:
+				continue
+
+			args['name'] = name
+			self._update_modified(args, update_modified)
+			if args.get('target_parent_field'):
+				frappe.db.sql("""update `tab%(target_parent_dt)s`
+					set %(target_parent_field)s = round(
+						ifnull((select
+							ifnull(sum(if(%(target_ref_field)s > %(target_field)s, %(target_field)s, %(target_ref_field)s)), 0)
+							/ sum(%(target_ref_field)s) * 100
+						from `tab%(target_dt)s` where parent="%(name)s"), 0), 2)
+						%(update_modified)s
+					where name='%(name)s'""" % args)
+
+			if args.get('status_field'):
+				frappe.db.sql("""update `tab%(target_parent_dt)s`
+					set %(status_field)s = if(%(target_parent_field)s<0.001,
+						'Not %(keyword)s', if(%(target_parent_field)s>=99.99,
+						'Fully %(keyword)s', 'Partly %(keyword)s'))
+					where name='%(name)s'""" % args)
+
+			if update_modified:
+				target = frappe.get_doc(args["target_parent_dt"], name)
+				target.set_status(update=True)
+				target.notify_update()
+				notify_status(target)
+
+def reference_validate_qty(self):
+	'''Row by row `validate_qty`, one query per source row'''
+	self.tolerance = {}
+	self.global_tolerance = None
+
+	for args in self.status_updater:
+		if "target_ref_field" not in args:
+			continue
+
+		for d in self.get_all_children():
+			if d.doctype == args['source_dt'] and d.get(args["join_field"]):
+				item = frappe.db.sql("""select item_code, `{target_ref_field}`,
+					`{target_field}`, parenttype, parent from `tab{target_dt}`
+					where `{target_ref_field}` < `{target_field}`
+					and name=%s and docstatus=1""".format(**args), d.get(args['join_field']), as_dict=1)
+				if item:
+					item = item[0]
+					item['idx'] = d.idx
+					item['target_ref_field'] = args['target_ref_field'].replace('_', ' ')
+					if args.get('no_tolerance'):
+						item['reduce_by'] = item[args['target_field']] - item[args['target_ref_field']]
+						if item['reduce_by'] > .01:
+							self.limits_crossed_error(args, item)
+					else:
+						self.check_overflow_with_tolerance(item, args)
+
+def make_sales_order(lines):
+	so = frappe.get_doc({
+		"doctype": "Sales Order",
+		"company": "_Test Company",
+		"customer": "_Test Customer",
+		"currency": "INR",
+		"delivery_date": frappe.utils.add_days(frappe.utils.nowdate(), 10),
+		"items": [{
+			"item_code": "_Test Item",
+			"warehouse": "_Test Warehouse - _TC",
+			"qty": 10,
+			"rate": 100 + i
+		} for i in xrange(lines)]
+	})
+	so.insert()
+	so.submit()
+	return so
+
+def submit_delivery_note(lines, row_by_row):
+	'''Submit a Delivery Note delivering part of every line of a new Sales Order,
+	returns `(elapsed, values set in the Sales Order)`'''
+	from erpnext.selling.doctype.sales_order.sales_order import make_delivery_note
+
+	so = make_sales_order(lines)
+	dn = make_delivery_note(so.name)
+	for i, d in enumerate(dn.get("items")):
+		d.qty = 1 + i % 10
+	dn.insert()
+
+	if row_by_row:
+		dn.update_qty = types.MethodType(reference_update_qty, dn)
+		dn.validate_qty = types.MethodType(reference_validate_qty, dn)
+
+	with Timer() as t:
+		dn.submit()
+
+	so.load_from_db()
+	values = ([flt(d.delivered_qty) for d in so.get("items")],
+		so.per_delivered, so.delivery_status, so.status)
+
+	frappe.db.rollback()
+	return t.elapsed, values
+
+def run(lines=400):
+	'''Compare Delivery Note submit time with row by row and set based status updates'''
+	lines = int(lines)
+	frappe.db.set_value("Stock Settings", None, "allow_negative_stock", 1)
+	frappe.db.commit()
+
+	results, values = [], []
+	for label, row_by_row in (("row by row", True), ("set based", False)):
+		elapsed, out = submit_delivery_note(lines, row_by_row)
+		values.append(out)
+		results.append((label, "{0:.2f}s".format(elapsed)))
+
+	assert values[0] == values[1], "Sales Order values differ"
+	report("Submitting a Delivery Note against {0} Sales Order lines".format(lines), results)
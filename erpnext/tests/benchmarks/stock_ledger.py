@@ -0,0 +1,51 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import add_days, nowdate
+from erpnext.stock.stock_ledger import update_entries_after
+from erpnext.tests.benchmarks import timed, report
+
+def make_entries(item_code, warehouse, count, company="_Test Company"):
+	'''Insert `count` alternating receipts and issues directly, without reposting'''
+	posting_date = add_days(nowdate(), -count)
+	for i in xrange(count):
+		sle = frappe.get_doc({
+			"doctype": "Stock Ledger Entry",
+			"item_code": item_code,
+			"warehouse": warehouse,
+			"company": company,
+			"posting_date": add_days(posting_date, i),
+			"posting_time": "10:00",
+			"voucher_type": "Stock Entry",
+			"voucher_no": "_Bench-{0}".format(i),
+			"actual_qty": 10 if i % 2 == 0 else -5,
+			"incoming_rate": 100 + (i % 7) if i % 2 == 0 else 0,
+			"is_cancelled": "No",
+			"docstatus": 1
+		})
+		sle.flags.ignore_links = True
+		sle.db_insert()
+
+def run(item_code="_Test Item", warehouse="_Test Warehouse - _TC", count=5000):
+	'''Compare per-row and bulk reposting of all entries of an item / warehouse'''
+	count = int(count)
+	make_entries(item_code, warehouse, count)
+	frappe.db.commit()
+
+	try:
+		args = {"item_code": item_code, "warehouse": warehouse}
+		rows = frappe.db.count("Stock Ledger Entry", args)
+
+		results = []
+		for label, bulk_update in (("per-row db_update", False), ("bulk update", True)):
+			elapsed, _ = timed(update_entries_after, args.copy(), allow_negative_stock=1,
+				bulk_update=bulk_update)
+			results.append((label, "{0:.2f}s, {1:.0f} rows/sec".format(elapsed, rows / elapsed)))
+
+		report("Reposting {0} entries of {1} in {2}".format(rows, item_code, warehouse), results)
+	finally:
+		frappe.db.sql("""delete from `tabStock Ledger Entry`
+			where voucher_no like '\\_Bench-%%'""")
+		frappe.db.commit()
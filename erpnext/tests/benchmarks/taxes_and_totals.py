@@ -0,0 +1,210 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import json
+import random
+import frappe
+from frappe.utils import cint, flt
+from erpnext.controllers.taxes_and_totals import calculate_taxes_and_totals
+from erpnext.tests.benchmarks import Timer, report
+
+class calculate_row_by_row(calculate_taxes_and_totals):
+	'''Reference implementation: applies one tax row to one item at a time'''
+	def determine_exclusive_rate(self):
+		if not any((cint(tax.included_in_print_rate) for tax in self.doc.get("taxes"))):
+			return
+
+		for item in self.doc.get("items"):
+			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+			cumulated_tax_fraction = 0
+			for i, tax in enumerate(self.doc.get("taxes")):
+				tax.tax_fraction_for_current_item = self.get_current_tax_fraction(tax, item_tax_map)
+
+				if i==0:
+					tax.grand_total_fraction_for_current_item = 1 + tax.tax_fraction_for_current_item
+				else:
+					tax.grand_total_fraction_for_current_item = \
+						self.doc.get("taxes")[i-1].grand_total_fraction_for_current_item \
+						+ tax.tax_fraction_for_current_item
+
+				cumulated_tax_fraction += tax.tax_fraction_for_current_item
+
+			if cumulated_tax_fraction and not self.discount_amount_applied and item.qty:
+				item.net_amount = flt(item.amount / (1 + cumulated_tax_fraction), item.precision("net_amount"))
+				item.net_rate = flt(item.net_amount / item.qty, item.precision("net_rate"))
+				item.discount_percentage = flt(item.discount_percentage, item.precision("discount_percentage"))
+
+				self._set_in_company_currency(item, ["net_rate", "net_amount"])
+
+	def get_current_tax_fraction(self, tax, item_tax_map):
+		current_tax_fraction = 0
+
+		if cint(tax.included_in_print_rate):
+			tax_rate = self._get_tax_rate(tax, item_tax_map)
+
+			if tax.charge_type == "On Net Total":
+				current_tax_fraction = tax_rate / 100.0
+
+			elif tax.charge_type == "On Previous Row Amount":
+				current_tax_fraction = (tax_rate / 100.0) * \
+					self.doc.get("taxes")[cint(tax.row_id) - 1].tax_fraction_for_current_item
+
+			elif tax.charge_type == "On Previous Row Total":
+				current_tax_fraction = (tax_rate / 100.0) * \
+					self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_fraction_for_current_item
+
+		if getattr(tax, "add_deduct_tax", None):
+			current_tax_fraction *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+		return current_tax_fraction
+
+	def calculate_taxes(self):
+		actual_tax_dict = dict([[tax.idx, flt(tax.tax_amount, tax.precision("tax_amount"))]
+			for tax in self.doc.get("taxes") if tax.charge_type == "Actual"])
+
+		for n, item in enumerate(self.doc.get("items")):
+			item_tax_map = self._load_item_tax_rate(item.item_tax_rate)
+
+			for i, tax in enumerate(self.doc.get("taxes")):
+				current_tax_amount = self.get_current_tax_amount(item, tax, item_tax_map)
+
+				if tax.charge_type == "Actual":
+					actual_tax_dict[tax.idx] -= current_tax_amount
+					if n == len(self.doc.get("items")) - 1:
+						current_tax_amount += actual_tax_dict[tax.idx]
+
+				if tax.charge_type != "Actual" and \
+					not (self.discount_amount_applied and self.doc.apply_discount_on=="Grand Total"):
+						tax.tax_amount += current_tax_amount
+
+				tax.tax_amount_for_current_item = current_tax_amount
+				tax.tax_amount_after_discount_amount += current_tax_amount
+
+				if getattr(tax, "category", None):
+					current_tax_amount = 0.0 if (tax.category == "Valuation") \
+						else current_tax_amount
+
+					current_tax_amount *= -1.0 if (tax.add_deduct_tax == "Deduct") else 1.0
+
+				if i==0:
+					tax.grand_total_for_current_item = flt(item.net_amount + current_tax_amount, tax.precision("total"))
+				else:
+					tax.grand_total_for_current_item = \
+						flt(self.doc.get("taxes")[i-1].grand_total_for_current_item + current_tax_amount, tax.precision("total"))
+
+				tax.total += tax.grand_total_for_current_item
+
+				if n == len(self.doc.get("items")) - 1:
+					self.round_off_totals(tax)
+
+					if i == (len(self.doc.get("taxes")) - 1) and self.discount_amount_applied \
+						and self.doc.discount_amount and self.doc.apply_discount_on == "Grand Total":
+							self.adjust_discount_amount_loss(tax)
+
+	def get_current_tax_amount(self, item, tax, item_tax_map):
+		tax_rate = self._get_tax_rate(tax, item_tax_map)
+		current_tax_amount = 0.0
+
+		if tax.charge_type == "Actual":
+			actual = flt(tax.tax_amount, tax.precision("tax_amount"))
+			current_tax_amount = item.net_amount*actual / self.doc.net_total if self.doc.net_total else 0.0
+
+		elif tax.charge_type == "On Net Total":
+			current_tax_amount = (tax_rate / 100.0) * item.net_amount
+		elif tax.charge_type == "On Previous Row Amount":
+			current_tax_amount = (tax_rate / 100.0) * \
+				self.doc.get("taxes")[cint(tax.row_id) - 1].tax_amount_for_current_item
+		elif tax.charge_type == "On Previous Row Total":
+			current_tax_amount = (tax_rate / 100.0) * \
+				self.doc.get("taxes")[cint(tax.row_id) - 1].grand_total_for_current_item
+
+		current_tax_amount = flt(current_tax_amount, tax.precision("tax_amount"))
+
+		self.set_item_wise_tax(item, tax, tax_rate, current_tax_amount)
+
+		return current_tax_amount
+
+	def set_item_wise_tax(self, item, tax, tax_rate, current_tax_amount):
+		key = item.item_code or item.item_name
+		item_wise_tax_amount = current_tax_amount*self.doc.conversion_rate
+		if tax.item_wise_tax_detail.get(key):
+			item_wise_tax_amount += tax.item_wise_tax_detail[key][1]
+
+		tax.item_wise_tax_detail[key] = [tax_rate,flt(item_wise_tax_amount, tax.precision("base_tax_amount"))]
+
+def make_invoice(lines, taxes, seed=1, **kwargs):
+	'''Unsaved Sales Invoice with `lines` random items and the given tax rows'''
+	rand = random.Random(seed)
+	items = frappe.db.sql_list("select name from tabItem where has_variants=0 limit 200")
+	item_tax_rates = [None, json.dumps({"_Test Account Excise Duty - _TC": 12}),
+		json.dumps({"_Test Account Excise Duty - _TC": 0, "_Test Account VAT - _TC": 4.5})]
+
+	doc = frappe.get_doc(dict({
+		"doctype": "Sales Invoice",
+		"company": "_Test Company",
+		"customer": "_Test Customer",
+		"currency": "INR",
+		"party_account_currency": "INR",
+		"conversion_rate": 1.0,
+		"selling_price_list": "_Test Price List",
+		"plc_conversion_rate": 1.0,
+		"items": [{
+			"item_code": items[i % len(items)],
+			"qty": rand.randint(1, 20),
+			"rate": rand.randint(100, 100000) / 100.0,
+			"item_tax_rate": rand.choice(item_tax_rates)
+		} for i in xrange(lines)],
+		"taxes": [dict(tax, idx=i + 1) for i, tax in enumerate(taxes)]
+	}, **kwargs))
+
+	return doc
+
+exclusive_taxes = [
+	{"charge_type": "On Net Total", "account_head": "_Test Account Excise Duty - _TC", "rate": 10},
+	{"charge_type": "On Previous Row Amount", "account_head": "_Test Account Education Cess - _TC", "rate": 2, "row_id": 1},
+	{"charge_type": "On Previous Row Amount", "account_head": "_Test Account S&H Education Cess - _TC", "rate": 1, "row_id": 1},
+	{"charge_type": "On Previous Row Total", "account_head": "_Test Account CST - _TC", "rate": 2, "row_id": 3},
+	{"charge_type": "On Net Total", "account_head": "_Test Account VAT - _TC", "rate": 12.5},
+	{"charge_type": "Actual", "account_head": "_Test Account Shipping Charges - _TC", "tax_amount": 100},
+	{"charge_type": "On Net Total", "account_head": "_Test Account Customs Duty - _TC", "rate": 3},
+	{"charge_type": "On Previous Row Total", "account_head": "_Test Account Service Tax - _TC", "rate": 1.5, "row_id": 7}
+]
+
+inclusive_taxes = [dict(tax, included_in_print_rate=1) for tax in exclusive_taxes[:5] + [
+	{"charge_type": "On Net Total", "account_head": "_Test Account Customs Duty - _TC", "rate": 3},
+	{"charge_type": "On Previous Row Total", "account_head": "_Test Account Service Tax - _TC", "rate": 1.5, "row_id": 6}
+]]
+
+def get_values(doc):
+	'''Calculated values of the document, items and taxes to compare'''
+	fields = ("net_amount", "base_net_amount", "net_rate", "amount")
+	tax_fields = ("tax_amount", "tax_amount_after_discount_amount", "total", "base_total", "item_wise_tax_detail")
+
+	return ([doc.grand_total, doc.base_grand_total, doc.net_total, doc.total_taxes_and_charges],
+		[[item.get(f) for f in fields] for item in doc.items],
+		[[tax.get(f) for f in tax_fields] for tax in doc.taxes])
+
+def run(lines=1000, repeat=5):
+	'''Report calculate_taxes_and_totals row by row and with tax row values looked up once'''
+	lines, repeat = int(lines), int(repeat)
+
+	scenarios = (("exclusive taxes", exclusive_taxes, {}),
+		("inclusive taxes", inclusive_taxes, {}),
+		("discount on grand total", exclusive_taxes, {"apply_discount_on": "Grand Total",
+			"additional_discount_percentage": 5}))
+
+	for title, taxes, kwargs in scenarios:
+		results, values = [], {}
+		for label, calculate in (("row by row", calculate_row_by_row), ("current", calculate_taxes_and_totals)):
+			docs = [make_invoice(lines, taxes, **kwargs) for i in xrange(repeat)]
+			with Timer() as t:
+				for doc in docs:
+					calculate(doc)
+
+			values[label] = get_values(docs[-1])
+			results.append((label, "{0:.1f} ms per invoice".format(t.elapsed * 1000 / repeat)))
+
+		assert values["row by row"] == values["current"], "calculated values differ for {0}".format(title)
+		report("{0} lines, {1} tax rows, {2}".format(lines, len(taxes), title), results)
+
+	frappe.db.rollback()
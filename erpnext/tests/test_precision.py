@@ -0,0 +1,49 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+from __future__ import unicode_literals
+
+import unittest, frappe
+from erpnext.utilities.precision import (get_precision, get_company_default_currency,
+	clear_precision_registry, get_lookup_stats)
+from erpnext.accounts.doctype.sales_invoice.test_sales_invoice import create_sales_invoice
+
+class TestPrecision(unittest.TestCase):
+	def test_precision_same_as_document(self):
+		si = create_sales_invoice(do_not_save=True)
+		si.append("taxes", {"charge_type": "On Net Total", "account_head": "_Test Account VAT - _TC",
+			"description": "VAT", "rate": 10})
+
+		for doc, fields in ((si, ("grand_total", "base_grand_total", "conversion_rate")),
+			(si.items[0], ("rate", "base_rate", "qty", "discount_percentage", "item_code")),
+			(si.taxes[0], ("tax_amount", "base_tax_amount", "rate"))):
+			for fieldname in fields:
+				self.assertEquals(get_precision(doc, fieldname), doc.precision(fieldname))
+
+		self.assertEquals(get_precision(si, "rate", si.taxes[0]), si.precision("rate", si.taxes[0]))
+
+	def test_lookups_are_cached_until_cleared(self):
+		clear_precision_registry()
+		get_lookup_stats(reset=True)
+
+		for i in xrange(3):
+			get_company_default_currency("_Test Company")
+
+		self.assertEquals(get_lookup_stats(), {"hits": 2, "misses": 1})
+
+		clear_precision_registry()
+		get_company_default_currency("_Test Company")
+		self.assertEquals(get_lookup_stats(reset=True), {"hits": 2, "misses": 2})
+
+	def test_not_shared_with_uncommitted_writes(self):
+		clear_precision_registry()
+		currency = get_company_default_currency("_Test Company")
+
+		frappe.db.set_value("Company", "_Test Company", "default_currency", "USD")
+		clear_precision_registry()
+		self.assertEquals(get_company_default_currency("_Test Company"), "USD")
+
+		frappe.db.rollback()
+
+		# as in the next request
+		frappe.local.precision_registry = None
+		self.assertEquals(get_company_default_currency("_Test Company"), currency)
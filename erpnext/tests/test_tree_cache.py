@@ -0,0 +1,77 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+from __future__ import unicode_literals
+
+import unittest, frappe
+from erpnext.utilities.tree_cache import (get_tree, get_ancestors, get_descendants,
+	is_descendant_of, is_group, get_root, get_descendants_condition)
+
+test_dependencies = ["Item Group", "Warehouse"]
+
+class TestTreeCache(unittest.TestCase):
+	def test_same_as_nested_set(self):
+		for name in frappe.db.sql_list("select name from `tabItem Group`"):
+			lft, rgt = frappe.db.get_value("Item Group", name, ["lft", "rgt"])
+
+			self.assertEquals(get_ancestors("Item Group", name), frappe.db.sql_list("""select name
+				from `tabItem Group` where lft < %s and rgt > %s order by lft desc""", (lft, rgt)))
+
+			self.assertEquals(get_descendants("Item Group", name), frappe.db.sql_list("""select name
+				from `tabItem Group` where lft >= %s and rgt <= %s order by lft""", (lft, rgt)))
+
+		self.assertEquals(get_root("Item Group"), frappe.db.get_value("Item Group",
+			{"lft": 1}, "name"))
+
+	def test_descendants_condition(self):
+		self.assertEquals(frappe.db.sql_list("""select name from `tabItem Group` where {0}
+			order by lft""".format(get_descendants_condition("Item Group", "_Test Item Group B", "name"))),
+			get_descendants("Item Group", "_Test Item Group B"))
+
+	def test_membership(self):
+		self.assertTrue(is_descendant_of("Item Group", "_Test Item Group B - 3", "_Test Item Group B"))
+		self.assertTrue(is_descendant_of("Item Group", "_Test Item Group B", "_Test Item Group B"))
+		self.assertFalse(is_descendant_of("Item Group", "_Test Item Group B", "_Test Item Group B",
+			include_self=False))
+		self.assertFalse(is_descendant_of("Item Group", "_Test Item Group B", "_Test Item Group B - 3"))
+
+		self.assertTrue(is_group("Warehouse", frappe.db.get_value("Warehouse", {"is_group": 1})))
+		self.assertFalse(is_group("Warehouse", "_Test Warehouse - _TC"))
+
+	def test_refreshed_on_update(self):
+		tree = get_tree("Item Group")
+		self.assertTrue(get_tree("Item Group") is tree)
+
+		group = frappe.get_doc("Item Group", "_Test Item Group B - 3")
+		group.parent_item_group = "_Test Item Group C"
+		group.save()
+
+		self.assertFalse(get_tree("Item Group") is tree)
+		self.assertTrue(is_descendant_of("Item Group", "_Test Item Group B - 3", "_Test Item Group C"))
+		self.assertFalse(is_descendant_of("Item Group", "_Test Item Group B - 3", "_Test Item Group B"))
+
+		group.parent_item_group = "_Test Item Group B"
+		group.save()
+		self.assertTrue(is_descendant_of("Item Group", "_Test Item Group B - 3", "_Test Item Group B"))
+
+	def test_refreshed_on_rename(self):
+		get_tree("Item Group")
+
+		frappe.rename_doc("Item Group", "_Test Item Group B - 3", "_Test Item Group B - 3 Renamed")
+		self.assertTrue(is_descendant_of("Item Group", "_Test Item Group B - 3 Renamed", "_Test Item Group B"))
+		self.assertFalse(get_tree("Item Group").exists("_Test Item Group B - 3"))
+
+		frappe.rename_doc("Item Group", "_Test Item Group B - 3 Renamed", "_Test Item Group B - 3")
+		self.assertTrue(get_tree("Item Group").exists("_Test Item Group B - 3"))
+
+	def test_not_shared_with_uncommitted_writes(self):
+		group = frappe.get_doc({"doctype": "Item Group", "item_group_name": "_Test Tree Cache Group",
+			"parent_item_group": "_Test Item Group B", "is_group": 0}).insert()
+		self.assertTrue(is_descendant_of("Item Group", group.name, "_Test Item Group B"))
+
+		tree = get_tree("Item Group")
+		frappe.db.rollback()
+
+		# as in the next request
+		frappe.local.tree_cache = None
+		self.assertFalse(get_tree("Item Group") is tree)
+		self.assertFalse(get_tree("Item Group").exists(group.name))
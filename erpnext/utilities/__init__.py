@@ -2,6 +2,9 @@
 
 import frappe
 
+# timeout of long queue jobs, no transaction stays open for longer than this
+long_job_timeout = 3000
+
 def update_doctypes():
 	for d in frappe.db.sql("""select df.parent, df.fieldname
 		from tabDocField df, tabDocType dt where df.fieldname
@@ -0,0 +1,131 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+from __future__ import unicode_literals
+import frappe, re, unicodedata, binascii
+from frappe.utils import cstr, now
+from frappe.model.document import Document
+
+# fields matched by `LIKE '%txt%'` in link field searches (erpnext.controllers.queries)
+search_fields = {
+	"Item": ("name", "item_name", "item_group", "description"),
+	"Customer": ("name", "customer_name"),
+	"Supplier": ("name", "supplier_name")
+}
+
+class SearchIndex(Document):
+	pass
+
+def on_doctype_update():
+	if not frappe.db.sql("""show index from `tabSearch Index`
+		where Key_name="search_index_reference" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabSearch Index`
+			add unique index search_index_reference(reference_doctype, reference_name)""")
+
+	if not frappe.db.sql("""show index from `tabSearch Index`
+		where Key_name="search_index_trigrams" """):
+		frappe.db.commit()
+		frappe.db.sql("""alter table `tabSearch Index`
+			add fulltext index search_index_trigrams(trigrams)""")
+
+def normalize(text):
+	'''Lower case without accents, as compared by the database collation'''
+	text = unicodedata.normalize("NFKD", cstr(text).lower())
+	return "".join([c for c in text if not unicodedata.combining(c)])
+
+def get_trigrams(text):
+	text = normalize(text)
+	return set([text[i:i + 3] for i in xrange(len(text) - 2)])
+
+def get_token(trigram):
+	'''Trigram as a full text token. Hex encoded, so that punctuation, spaces and
+	stopwords are indexed too'''
+	return "t" + binascii.hexlify(trigram.encode("utf-8"))
+
+def get_search_index_condition(doctype, txt, searchfield, name_field="name"):
+	'''Condition restricting `name_field` to records having all the trigrams of `txt`.
+	Records matching `LIKE '%txt%'` on any indexed field always qualify, so the `LIKE`
+	conditions and ranking of the query stay as they are. Returns an empty string
+	if the index cannot be used for this search.
+
+	A FULLTEXT index only sees committed rows, so records saved in the current
+	transaction would be left out. The index is not used once the transaction has writes'''
+	txt = cstr(txt)
+	if searchfield not in search_fields.get(doctype, ()) or "\\" in txt:
+		return ""
+
+	if frappe.db.transaction_writes:
+		return ""
+
+	# `%` and `_` are wildcards, only the text around them must be present
+	trigrams = set()
+	for part in re.split("[%_]", txt):
+		trigrams.update(get_trigrams(part))
+
+	if not trigrams:
+		return ""
+
+	return """ and {name_field} in (select reference_name from `tabSearch Index`
+		where reference_doctype = '{doctype}'
+			and match(trigrams) against ('{tokens}' in boolean mode))""".format(name_field=name_field,
+			doctype=doctype, tokens=" ".join(["+" + get_token(d) for d in sorted(trigrams)]))
+
+def update_search_index(doc, method=None, *args, **kwargs):
+	'''Keep the search index of Item, Customer and Supplier in sync. Called via hooks'''
+	if method == "on_trash":
+		delete_from_index(doc.doctype, [doc.name])
+		return
+
+	if method == "after_rename" and args:
+		delete_from_index(doc.doctype, [args[0]])
+
+	index_documents(doc.doctype, [doc.name])
+
+def update_item_group_in_index(doc, method=None, *args, **kwargs):
+	'''Items of a renamed Item Group are searched by the new name'''
+	index_documents("Item", frappe.db.sql_list("""select name from `tabItem`
+		where item_group=%s""", doc.name))
+
+def delete_from_index(doctype, names):
+	frappe.db.sql("""delete from `tabSearch Index` where reference_doctype=%s
+		and reference_name in %s""", (doctype, tuple(names)))
+
+def index_documents(doctype, names=None, chunk_size=500):
+	'''Index `names` (or all records) of `doctype`'''
+	if names is not None and not names:
+		return
+
+	fields = search_fields[doctype]
+	records = frappe.db.sql("""select {fields} from `tab{doctype}` {condition}""".format(
+		fields=", ".join(["`{0}`".format(f) for f in fields]), doctype=doctype,
+		condition="where name in %(names)s" if names is not None else ""),
+		{"names": tuple(names or [])}, as_dict=True)
+
+	timestamp, user = now(), frappe.session.user
+	for i in xrange(0, len(records), chunk_size):
+		chunk = records[i:i + chunk_size]
+
+		values = []
+		for d in chunk:
+			trigrams = set()
+			for f in fields:
+				trigrams.update(get_trigrams(d.get(f)))
+
+			values.extend([frappe.generate_hash(length=10), timestamp, timestamp, user, user,
+				doctype, d.name, " ".join([get_token(t) for t in sorted(trigrams)])])
+
+		frappe.db.sql("""insert into `tabSearch Index`
+			(name, creation, modified, owner, modified_by, reference_doctype, reference_name, trigrams)
+			values {0}
+			on duplicate key update trigrams = values(trigrams), modified = values(modified)""".format(
+				", ".join(["(%s)" % ", ".join(["%s"] * 8)] * len(chunk))), tuple(values))
+
+def rebuild_search_index(doctype=None):
+	'''Rebuild the search index of `doctype`, or of all indexed doctypes
+
+	bench --site [site] execute erpnext.utilities.doctype.search_index.search_index.rebuild_search_index'''
+	for dt in ([doctype] if doctype else search_fields.keys()):
+		frappe.db.sql("""delete from `tabSearch Index` where reference_doctype=%s""", dt)
+		index_documents(dt)
+		frappe.db.commit()
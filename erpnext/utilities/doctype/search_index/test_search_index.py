@@ -0,0 +1,58 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+from __future__ import unicode_literals
+
+import frappe
+import unittest
+from erpnext.controllers.queries import item_query, customer_query
+from erpnext.stock.doctype.item.test_item import make_item
+from erpnext.utilities.doctype.search_index.search_index import (rebuild_search_index,
+	get_search_index_condition)
+
+class TestSearchIndex(unittest.TestCase):
+	def test_item_query_with_index(self):
+		rebuild_search_index("Item")
+
+		for txt in ("_Test Item", "test item home", "Products", "desktop", "_T%t Ite"):
+			self.assertTrue(get_search_index_condition("Item", txt, "name"))
+
+			expected = frappe.db.sql_list("""select name from tabItem
+				where docstatus < 2 and has_variants=0 and disabled=0
+					and (end_of_life > curdate() or ifnull(end_of_life, '0000-00-00')='0000-00-00')
+					and (name like %(txt)s or item_group like %(txt)s
+						or item_name like %(txt)s or description like %(txt)s)""", {"txt": "%%%s%%" % txt})
+
+			self.assertEquals(sorted([d[0] for d in item_query("Item", txt, "name", 0, 1000, {})]),
+				sorted(expected))
+
+	def test_customer_query_with_index(self):
+		rebuild_search_index("Customer")
+
+		expected = frappe.db.sql_list("""select name from tabCustomer where disabled=0
+			and (name like '%%_Test Customer%%' or customer_name like '%%_Test Customer%%')""")
+		self.assertEquals(sorted([d[0] for d in customer_query("Customer", "_Test Customer", "name", 0, 1000, {})]),
+			sorted(expected))
+
+	def test_short_text_is_not_indexed(self):
+		self.assertEquals(get_search_index_condition("Item", "ab", "name"), "")
+		self.assertEquals(get_search_index_condition("Item", "abc", "barcode"), "")
+
+	def test_uncommitted_records_are_found(self):
+		rebuild_search_index("Item")
+
+		item = make_item("_Test Search Index Uncommitted Item", {"is_stock_item": 0})
+		self.assertTrue(item.name in [d[0] for d in item_query("Item", "Index Uncommitted", "name",
+			0, 1000, {})])
+
+		frappe.db.rollback()
+
+	def test_merged_records(self):
+		for item_code in ("_Test Search Index Merged Item", "_Test Search Index Merged Into Item"):
+			make_item(item_code, {"is_stock_item": 0})
+
+		frappe.rename_doc("Item", "_Test Search Index Merged Item", "_Test Search Index Merged Into Item",
+			merge=True)
+
+		self.assertEquals(frappe.db.sql_list("""select reference_name from `tabSearch Index`
+			where reference_doctype='Item' and reference_name like '_Test Search Index Merged%'"""),
+			["_Test Search Index Merged Into Item"])
@@ -0,0 +1,135 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Process wide registry of field precisions and company currencies.
+
+Values are kept per site for the life of the worker process. The version of the
+registry is checked once per request. It is made of the last `modified` (and number
+of rows, where rows are deleted to reset a value) of DocType, Property Setter, Custom
+Field, Currency, Company, System Settings and Global Defaults, as committed, and a
+counter in redis that is bumped when any of these is saved, deleted or renamed. A
+registry built in a transaction with writes is used only for that request.'''
+
+from __future__ import unicode_literals
+import frappe
+from frappe.utils import cint
+from frappe.model.meta import get_field_precision as _get_field_precision, get_field_currency
+
+float_fieldtypes = ("Currency", "Float", "Percent")
+
+# site -> {"version": .., "precision": {}, "company_currency": {}}
+_registry = {}
+
+def get_registry():
+	registry = getattr(frappe.local, "precision_registry", None)
+	if registry is None:
+		version = get_version()
+		registry = _registry.get(frappe.local.site)
+		if not registry or registry["version"] != version:
+			registry = {"version": version, "precision": {}, "company_currency": {},
+				"currency_fields": {}}
+
+			# values read in this transaction may still be rolled back
+			if not frappe.db.transaction_writes:
+				_registry[frappe.local.site] = registry
+
+		frappe.local.precision_registry = registry
+
+	return registry
+
+def get_version():
+	'''Version of the registry as seen by this transaction'''
+	return (frappe.cache().get_value("precision_registry_version"),) + tuple(frappe.db.sql("""select
+		(select max(modified) from `tabDocType`),
+		(select max(modified) from `tabProperty Setter`),
+		(select count(*) from `tabProperty Setter`),
+		(select max(modified) from `tabCustom Field`),
+		(select count(*) from `tabCustom Field`),
+		(select max(modified) from `tabCurrency`),
+		(select max(modified) from `tabCompany`),
+		(select max(value) from `tabSingles`
+			where doctype in ('System Settings', 'Global Defaults') and field='modified')""")[0])
+
+def clear_precision_registry(*args, **kwargs):
+	'''Invalidate the registry in all worker processes. Called via hooks'''
+	frappe.cache().set_value("precision_registry_version", frappe.generate_hash(length=10))
+	_registry.pop(frappe.local.site, None)
+	frappe.local.precision_registry = None
+
+def count_lookup(hit):
+	stats = getattr(frappe.local, "precision_lookups", None)
+	if stats is None:
+		stats = frappe.local.precision_lookups = {"hits": 0, "misses": 0}
+
+	stats["hits" if hit else "misses"] += 1
+
+def get_lookup_stats(reset=False):
+	'''Lookups served by the registry (`hits`) and computed (`misses`) in this request.
+	Not all hits are saved lookups: `doc.precision` also keeps the precisions it
+	computed, per document'''
+	stats = dict(getattr(frappe.local, "precision_lookups", None) or {"hits": 0, "misses": 0})
+	if reset:
+		frappe.local.precision_lookups = None
+
+	return stats
+
+def get_field_precision(doctype, fieldname, currency=None):
+	'''Precision of `fieldname` of `doctype` in `currency`, as per
+	`frappe.model.meta.get_field_precision`. None if the field is not a float field'''
+	cache = get_registry()["precision"]
+	key = (doctype, fieldname, currency)
+
+	if key in cache:
+		count_lookup(True)
+	else:
+		count_lookup(False)
+		df = frappe.get_meta(doctype).get_field(fieldname)
+		cache[key] = _get_field_precision(df, currency=currency) \
+			if df and df.fieldtype in float_fieldtypes else None
+
+	return cache[key]
+
+def get_precision(doc, fieldname, parentfield=None):
+	'''Same as `doc.precision(fieldname, parentfield)`, shared by all documents of
+	the doctype with the same currency instead of being computed for each document'''
+	if parentfield and not isinstance(parentfield, basestring):
+		parentfield = parentfield.parentfield
+
+	doctype = doc.meta.get_field(parentfield).options if parentfield else doc.doctype
+
+	# fields whose precision depends on the currency of the document
+	currency_fields = get_registry()["currency_fields"]
+	key = (doctype, fieldname)
+	if key not in currency_fields:
+		df = frappe.get_meta(doctype).get_field(fieldname)
+		currency_fields[key] = df if df and df.fieldtype == "Currency" and not cint(df.precision) else None
+
+	currency = None
+	if currency_fields[key]:
+		currency = get_field_currency(currency_fields[key], doc) or get_default_currency()
+
+	return get_field_precision(doctype, fieldname, currency)
+
+def get_company_default_currency(company):
+	'''Default currency of `company`'''
+	cache = get_registry()["company_currency"]
+
+	if company in cache:
+		count_lookup(True)
+	else:
+		count_lookup(False)
+		cache[company] = frappe.db.get_value("Company", company, "default_currency")
+
+	return cache[company]
+
+def get_default_currency():
+	'''Currency set in Global Defaults'''
+	registry = get_registry()
+
+	if "default_currency" in registry:
+		count_lookup(True)
+	else:
+		count_lookup(False)
+		registry["default_currency"] = frappe.db.get_default("currency")
+
+	return registry["default_currency"]
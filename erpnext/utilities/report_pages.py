@@ -0,0 +1,66 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''Page numbers for reports that are read with a keyset cursor.
+
+The cursor returned for each page is cached per report and user, for the filters last
+used, so opening the next page is one range scan. A page that is not cached is reached
+by walking forward from the nearest cached page before it. Cached cursors expire after
+an hour and are dropped when entries of the ledger are posted or cancelled, see
+`bump_ledger_version`.'''
+
+from __future__ import unicode_literals
+import json
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+cursor_expiry = 3600
+
+def validate_report_permission(ref_doctype):
+	'''Same check as for running the report, the user must have report permission on its doctype'''
+	if not frappe.has_permission(ref_doctype, "report"):
+		frappe.throw(_("Must have report permission to access this report."), frappe.PermissionError)
+
+def get_page(report_name, ref_doctype, filters, page_no, get_ledger_page, resume=None,
+	page_length=500):
+	'''Page `page_no` (from 1) of the report, as returned by `get_ledger_page(filters, cursor,
+	page_length)`. If there are less pages, the last page is returned. `page_no` of the
+	returned page is set.
+
+	A cached cursor is passed through `resume(filters, cursor)` before it is used, to
+	recompute values carried in it from the current ledger'''
+	page_no = max(cint(page_no), 1)
+	key = "report_page_cursors:{0}:{1}".format(report_name, frappe.session.user)
+	signature = get_signature(ref_doctype, filters, page_length)
+
+	cached = frappe.cache().get_value(key)
+	cursors = cached["cursors"] if cached and cached["signature"] == signature else {}
+
+	start = max([n for n in cursors if n <= page_no] or [1])
+	cursor = cursors.get(start)
+	if cursor and resume:
+		cursor = resume(filters, cursor)
+
+	for n in xrange(start, page_no + 1):
+		page = get_ledger_page(filters, cursor, page_length)
+		cursor = page["cursor"]
+		if not cursor:
+			break
+
+		cursors[n + 1] = cursor
+
+	frappe.cache().set_value(key, {"signature": signature, "cursors": cursors})
+	frappe.cache().expire(frappe.cache().make_key(key), cursor_expiry)
+
+	page["page_no"] = n
+	return page
+
+def get_signature(ref_doctype, filters, page_length):
+	return json.dumps([dict((k, v) for k, v in filters.items() if k != "page"), page_length,
+		cint(frappe.cache().hget("report_ledger_version", ref_doctype))], sort_keys=True, default=unicode)
+
+def bump_ledger_version(ref_doctype):
+	'''Drop cached cursors of reports on `ref_doctype`, when its entries are posted or cancelled'''
+	frappe.cache().hset("report_ledger_version", ref_doctype,
+		cint(frappe.cache().hget("report_ledger_version", ref_doctype)) + 1)
@@ -0,0 +1,180 @@
+# Copyright (c) 2015, Frappe Technologies Pvt. Ltd. and Contributors
+# License: GNU General Public License v3. See license.txt
+
+'''In-memory copies of nested set trees (Item Group, Customer Group, Territory, Warehouse,
+Account, Cost Center, Sales Person) for ancestor / descendant lookups without `lft` / `rgt` queries.
+
+Trees are loaded on first use and kept per site for the life of the worker process.
+The version of a tree is a counter in redis, bumped when a node is saved, trashed or
+renamed, and checked once per request. A tree loaded in a transaction with writes is
+used only for that request, and a name that is not found reloads the tree if it exists
+in the database.'''
+
+from __future__ import unicode_literals
+from bisect import bisect_left, bisect_right
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+tree_doctypes = ("Item Group", "Customer Group", "Territory", "Warehouse", "Account",
+	"Cost Center", "Sales Person")
+
+# site -> {doctype: NestedSetTree}
+_trees = {}
+
+class NestedSetTree(object):
+	'''Nodes of a nested set doctype ordered by `lft`'''
+	def __init__(self, doctype, version=None):
+		self.doctype = doctype
+		self.version = version
+
+		has_is_group = frappe.get_meta(doctype).has_field("is_group")
+		nodes = frappe.db.sql("""select name, lft, rgt{0} from `tab{1}`
+			where docstatus < 2 order by lft""".format(", is_group" if has_is_group else "", doctype))
+
+		self.names = [d[0] for d in nodes]
+		self.lfts = [d[1] for d in nodes]
+		self.index = {}
+		self.groups = set()
+		self.ancestors = {}
+
+		parents = []
+		for i, d in enumerate(nodes):
+			name, lft, rgt = d[0], d[1], d[2]
+			self.index[name] = i
+			if has_is_group and cint(d[3]):
+				self.groups.add(name)
+
+			while parents and parents[-1][2] < lft:
+				parents.pop()
+
+			# nearest first
+			self.ancestors[name] = tuple(reversed([p[0] for p in parents]))
+			parents.append(d)
+
+		self.rgts = [d[2] for d in nodes]
+
+	def exists(self, name):
+		return name in self.index
+
+	def is_group(self, name):
+		return name in self.groups
+
+	def is_descendant_of(self, name, ancestor, include_self=True):
+		'''True if `name` is in the subtree of `ancestor`'''
+		i, j = self.index.get(name), self.index.get(ancestor)
+		if i is None or j is None:
+			return False
+
+		if i == j:
+			return include_self
+
+		return self.lfts[j] < self.lfts[i] and self.rgts[i] < self.rgts[j]
+
+	def get_ancestors(self, name, include_self=False):
+		'''Ancestors of `name`, nearest first'''
+		ancestors = list(self.ancestors.get(name, ()))
+		if include_self and name in self.index:
+			ancestors.insert(0, name)
+
+		return ancestors
+
+	def get_descendants(self, name, include_self=True):
+		'''`name` and all nodes under it, in `lft` order'''
+		i = self.index.get(name)
+		if i is None:
+			return []
+
+		start = i if include_self else i + 1
+		end = bisect_right(self.lfts, self.rgts[i], lo=i)
+		return self.names[start:end]
+
+	def get_root(self):
+		'''Node with the lowest `lft`, if it contains every other node'''
+		if self.names and bisect_left(self.lfts, self.rgts[0]) == len(self.names):
+			return self.names[0]
+
+def get_tree(doctype):
+	'''Cached `NestedSetTree` of `doctype`'''
+	local_trees = getattr(frappe.local, "tree_cache", None)
+	if local_trees is None:
+		local_trees = frappe.local.tree_cache = {}
+
+	if doctype in local_trees:
+		return local_trees[doctype]
+
+	version = get_version(doctype)
+	trees = _trees.setdefault(frappe.local.site, {})
+	tree = trees.get(doctype)
+	if not tree or tree.version != version:
+		tree = NestedSetTree(doctype, version)
+
+		# uncommitted nodes may still be rolled back
+		if not frappe.db.transaction_writes:
+			trees[doctype] = tree
+
+	# a node trashed in this request is deleted only after the hook runs
+	if doctype not in (getattr(frappe.local, "tree_cache_trashed", None) or ()):
+		local_trees[doctype] = tree
+
+	return tree
+
+def get_version(doctype):
+	return cint(frappe.cache().hget("tree_cache_version", doctype))
+
+def get_tree_with(doctype, *names):
+	'''Tree of `doctype`, reloaded if any of `names` is missing but exists in the database'''
+	tree = get_tree(doctype)
+	for name in names:
+		if name and not tree.exists(name) and frappe.db.exists(doctype, name):
+			clear_tree_cache(doctype)
+			return get_tree(doctype)
+
+	return tree
+
+def clear_tree_cache(doc, method=None, *args, **kwargs):
+	'''Drop the cached tree of `doc` and bump its version. Called via hooks'''
+	doctype = doc if isinstance(doc, basestring) else doc.doctype
+
+	frappe.cache().hset("tree_cache_version", doctype, get_version(doctype) + 1)
+
+	_trees.get(frappe.local.site, {}).pop(doctype, None)
+
+	if getattr(frappe.local, "tree_cache", None) is not None:
+		frappe.local.tree_cache.pop(doctype, None)
+
+	if method == "on_trash":
+		if getattr(frappe.local, "tree_cache_trashed", None) is None:
+			frappe.local.tree_cache_trashed = set()
+		frappe.local.tree_cache_trashed.add(doctype)
+
+def validate_node(doctype, name):
+	if not get_tree_with(doctype, name).exists(name):
+		frappe.throw(_("Invalid {0}").format(name))
+
+def get_ancestors(doctype, name, include_self=False):
+	'''Ancestors of `name`, nearest first'''
+	return get_tree_with(doctype, name).get_ancestors(name, include_self)
+
+def get_descendants(doctype, name, include_self=True):
+	'''`name` and all nodes under it'''
+	return get_tree_with(doctype, name).get_descendants(name, include_self)
+
+def is_descendant_of(doctype, name, ancestor, include_self=True):
+	return get_tree_with(doctype, name, ancestor).is_descendant_of(name, ancestor, include_self)
+
+def is_group(doctype, name):
+	return get_tree_with(doctype, name).is_group(name)
+
+def get_root(doctype):
+	return get_tree(doctype).get_root()
+
+def get_descendants_condition(doctype, name, fieldname):
+	'''SQL condition for `fieldname` being `name` or any node under it, as a `lft` / `rgt`
+		range so that large subtrees are not inlined in the query'''
+	lft, rgt = frappe.db.get_value(doctype, name, ["lft", "rgt"]) or (None, None)
+	if lft is None:
+		frappe.throw(_("Invalid {0}").format(name))
+
+	return """{0} in (select name from `tab{1}`
+		where lft >= {2} and rgt <= {3} and docstatus < 2)""".format(fieldname, doctype, cint(lft), cint(rgt))